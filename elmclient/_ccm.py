@@ -4,7 +4,11 @@
 ##
 
 
+import json
 import logging
+import os
+import re
+import time
 
 import anytree
 import lxml.etree as ET
@@ -24,6 +28,13 @@ from . import resource
 
 logger = logging.getLogger(__name__)
 
+# the number of work items/attachments retrieved in parallel by download_attachments
+ATTACHMENT_DOWNLOAD_WORKERS = 4
+# attachments are written to disk in chunks of this many bytes
+ATTACHMENT_CHUNKSIZE = 1024*1024
+# the file in the download folder recording the attachments downloaded, so they can be skipped next time
+ATTACHMENT_MANIFEST = "attachments_manifest.json"
+
 # generate a compact stacktrace of function-line-file because it's often
 # helpful to know how a function was called
 import inspect
@@ -293,6 +304,125 @@ class CCMProject( _project._Project , resource.Resources_Mixin):
         logger.info( f"Result {result=}" )
         return result
 
+    # download the attachments of many work items into folder, in a subfolder for each work item named by its identifier
+    # workitems is a list of work item identifiers and/or uris, or the results of an OSLC query (a dictionary keyed by work item uri)
+    # the work items and attachment details are retrieved in parallel, then up to workers attachments are downloaded at a time, each
+    # streamed to disk in chunks (to a temporary file which is renamed when complete) so large attachments aren't held in memory
+    # attachments already downloaded are skipped: a manifest in folder records the size and etag of each one, and if freshness is "etags"
+    # a conditional GET checks that it hasn't changed (with "none" it isn't checked). An existing file with no manifest entry is skipped if
+    # its size matches the attachment's Content-Length. Use force=True to download everything again.
+    # returns a dictionary with 'attachments' (keyed by attachment content url of {'workitem','file','status' (downloaded/skipped),'bytes'} or the exception
+    # if it failed), and the 'downloaded', 'skipped', 'failed', 'bytes', 'seconds' and 'bytespersecond' (throughput) totals
+    def download_attachments( self, workitems, folder, *, workers=None, freshness="etags", force=False, verbose=True ):
+        if freshness not in ["etags","none"]:
+            raise Exception( f"Attachment freshness must be one of etags or none not '{freshness}'" )
+        starttime = time.perf_counter()
+        workers = workers or ATTACHMENT_DOWNLOAD_WORKERS
+        wiurls = [ self.app.reluri(f'resource/itemName/com.ibm.team.workitem.WorkItem/{wi}') if utils.isint( str(wi) ) else wi for wi in workitems ]
+
+        # find the attachments of each work item
+        # <rtc_cm:com.ibm.team.workitem.linktype.attachment.attachment rdf:resource="https://jazz.ibm.com:9443/ccm/resource/itemOid/com.ibm.team.workitem.Attachment/_IZCsIRuREeyjc_YwJfTLJA"/>
+        def getworkitem( wiurl ):
+            wi_x = self.app.server.execute_get_xml( wiurl, cacheable=False, headers={'OSLC-Core-Version': '2.0'}, intent="Retrieve work item content (including attachment details)" )
+            wiid = rdfxml.xmlrdf_get_resource_text( wi_x, './/dcterms:identifier' ) or wiurl.rsplit( "/", 1 )[-1]
+            return wiid, [ rdfxml.xmlrdf_get_resource_uri( el ) for el in rdfxml.xml_find_elements( wi_x, './/rtc_cm:com.ibm.team.workitem.linktype.attachment.attachment' ) ]
+        attachmentwis = {}
+        for wiurl,result in self._get_concurrently( getworkitem, wiurls, workers=workers, verbose=verbose, desc="Retrieving work items" ).items():
+            if isinstance( result, Exception ):
+                raise result
+            wiid, attachment_us = result
+            for attachment_u in attachment_us:
+                attachmentwis[attachment_u] = wiid
+
+        # get the attachment details - the download link and the filename
+        # <rtc_cm:content rdf:resource="https://jazz.ibm.com:9443/ccm/resource/content/_IZCsIRuREeyjc_YwJfTLJA"/>
+        def getattachment( attachment_u ):
+            attachment_x = self.app.server.execute_get_xml( attachment_u, cacheable=False, headers={'OSLC-Core-Version': '2.0'}, intent="Retrieve attachment details (points to attachment content)" )
+            return rdfxml.xmlrdf_get_resource_uri( attachment_x, './/rtc_cm:content' ), rdfxml.xmlrdf_get_resource_text( attachment_x, './/dcterms:title' )
+        todownload = {}
+        usedfiles = set()
+        for attachment_u,result in self._get_concurrently( getattachment, attachmentwis.keys(), workers=workers, verbose=verbose, desc="Retrieving attachment details" ).items():
+            if isinstance( result, Exception ):
+                raise result
+            download_u, filename = result
+            # make the filename safe, and unique if a work item has two attachments with the same name
+            filename = re.sub( r'[<>:"/\\|?*\x00-\x1f]', '_', filename or "" ).strip() or download_u.rsplit( "/", 1 )[-1]
+            path = os.path.join( folder, attachmentwis[attachment_u], filename )
+            if path in usedfiles:
+                path = os.path.join( folder, attachmentwis[attachment_u], f"{download_u.rsplit( '/', 1 )[-1]}_{filename}" )
+            usedfiles.add( path )
+            todownload[download_u] = ( attachmentwis[attachment_u], path )
+
+        manifestfile = os.path.join( folder, ATTACHMENT_MANIFEST )
+        manifest = {}
+        # (the manifest is read even if force so the entries for attachments not in this download are kept)
+        if os.path.isfile( manifestfile ):
+            try:
+                with open( manifestfile, "r" ) as f:
+                    manifest = json.load( f )
+            except Exception as e:
+                logger.info( f"Attachment manifest {manifestfile} not readable {e}" )
+
+        def download( download_u ):
+            wiid, path = todownload[download_u]
+            known = None if force else manifest.get( download_u )
+            if known and ( known['file'] != path or not os.path.isfile( path ) or os.path.getsize( path ) != known['bytes'] ):
+                known = None
+            if known and freshness == "none":
+                return { 'workitem': wiid, 'file': path, 'status': 'skipped', 'bytes': known['bytes'], 'etag': known.get( 'etag' ) }
+            # download it, using Referer set to the URI (addresses a security measure built-in to ccm)
+            headers = {'OSLC-Core-Version': '2.0', 'Referer':download_u}
+            if known and known.get( 'etag' ):
+                headers['If-None-Match'] = known['etag']
+            response = self.app.server.execute_get_binary( download_u, cacheable=False, headers=headers, stream=True, intent="Retrieve attachment content (binary)" )
+            try:
+                etag = response.headers.get( 'ETag' )
+                if response.status_code == 304:
+                    return { 'workitem': wiid, 'file': path, 'status': 'skipped', 'bytes': known['bytes'], 'etag': known['etag'] }
+                length = response.headers.get( 'Content-Length' )
+                if not force and not known and length is not None and os.path.isfile( path ) and os.path.getsize( path ) == int( length ):
+                    # probably downloaded by a previous run which didn't finish
+                    return { 'workitem': wiid, 'file': path, 'status': 'skipped', 'bytes': int( length ), 'etag': etag }
+                os.makedirs( os.path.dirname( path ), exist_ok=True )
+                tmppath = f"{path}.part"
+                nbytes = 0
+                with open( tmppath, "wb" ) as f:
+                    for chunk in response.iter_content( chunk_size=ATTACHMENT_CHUNKSIZE ):
+                        f.write( chunk )
+                        nbytes += len( chunk )
+                os.replace( tmppath, path )
+            finally:
+                response.close()
+            return { 'workitem': wiid, 'file': path, 'status': 'downloaded', 'bytes': nbytes, 'etag': etag }
+
+        attachments = self._get_concurrently( download, todownload.keys(), workers=workers, verbose=verbose, desc="Downloading attachments" )
+
+        # record what's been downloaded (written to a temporary file then renamed so a reader never sees a partial file)
+        # if a run is interrupted before this, files it completed are skipped next time because their size matches
+        for download_u,result in attachments.items():
+            if not isinstance( result, Exception ):
+                manifest[download_u] = { 'file': result['file'], 'bytes': result['bytes'], 'etag': result['etag'] }
+        os.makedirs( folder, exist_ok=True )
+        tmpfilename = f"{manifestfile}.{os.getpid()}.tmp"
+        with open( tmpfilename, "w" ) as f:
+            json.dump( manifest, f )
+        os.replace( tmpfilename, manifestfile )
+
+        elapsed = time.perf_counter()-starttime
+        downloaded = [ r for r in attachments.values() if not isinstance( r, Exception ) and r['status'] == 'downloaded' ]
+        nbytes = sum( r['bytes'] for r in downloaded )
+        summary = {
+            'attachments': attachments
+            ,'downloaded': len( downloaded )
+            ,'skipped': sum( 1 for r in attachments.values() if not isinstance( r, Exception ) and r['status'] == 'skipped' )
+            ,'failed': sum( 1 for r in attachments.values() if isinstance( r, Exception ) )
+            ,'bytes': nbytes
+            ,'seconds': elapsed
+            ,'bytespersecond': nbytes/elapsed if elapsed > 0 else 0
+        }
+        logger.info( f"download_attachments {len(wiurls)} work items {summary['downloaded']} downloaded {summary['skipped']} skipped {summary['failed']} failed {nbytes} bytes in {elapsed:.1f}s {summary['bytespersecond']/1e6:.2f} MB/s" )
+        return summary
+
 #################################################################################################
 
 @utils.mixinomatic
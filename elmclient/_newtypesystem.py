@@ -8,11 +8,14 @@
 #
 
 import collections
+import concurrent.futures
 import datetime
+import hashlib
 import inspect
 import logging
 import re
 import sys
+import threading
 import time
 
 import anytree
@@ -218,6 +221,10 @@ class AT( _DNType ):
         self.isenum = isenum
         # this is keyed by the enum URL and contains an ET
         self.enumvalues = enumvalues or {}
+    # the checks/messages refer to the enum values as enumurls
+    @property
+    def enumurls( self ):
+        return self.enumvalues
 
 # this is only used inside and AT!
 class EnumValue( _DNType ):
@@ -253,6 +260,38 @@ def expand( errorname ):
     errorcode,template = error
     return ( errorcode, errorname, fstr( template ) )
 
+# cache of retrieved type definitions (parsed XML) which can be shared by the TypeSystems of several configurations
+# definitions are keyed by (url, configuration) and also by (url, dcterms:modified) so a configuration where a definition's
+# modified is already known (e.g. from the query which found it) and is the same as one already retrieved doesn't retrieve it again
+class TypeDefinitionCache( object ):
+    def __init__( self ):
+        self._byconfig = {}
+        self._bymodified = {}
+        self._lock = threading.Lock()
+        self.nretrieved = 0
+        self.nreused = 0
+
+    def get( self, serverconnection, url, config, *, modified=None, iscacheable=True ):
+        with self._lock:
+            content_x = self._byconfig.get( (url,config) )
+            if content_x is None and modified is not None:
+                content_x = self._bymodified.get( (url,modified) )
+            if content_x is not None:
+                self._byconfig[(url,config)] = content_x
+                self.nreused += 1
+                return content_x
+        # get the definition in this config
+        content_x = serverconnection.execute_get_xml( url, params={'vvc.configuration':config},headers={'Configuration-Context': None}, cacheable=iscacheable )
+        if content_x is None:
+            raise Exception( "No XML!" )
+        modified = rdfxml.xmlrdf_get_resource_uri( content_x,'.//dcterms:modified' )
+        with self._lock:
+            self._byconfig[(url,config)] = content_x
+            if modified:
+                self._bymodified[(url,modified)] = content_x
+            self.nretrieved += 1
+        return content_x
+
 class TypeSystem(object):
     # has a definition of a concrete point-in-time type system. i.e. in a single local config (e.g. stream or baseline or changeset)
     ots = {} # these are keyed by the type URL
@@ -261,6 +300,7 @@ class TypeSystem(object):
     lts = {} # these are keyed by the type URL
     config_u = None
     config_name = None
+    _fingerprints = None
 
     def __init__( self, config_name, config_u ):
         logger.debug( f"Creating typesystem for {config_u=}" )
@@ -279,16 +319,96 @@ class TypeSystem(object):
             members.append( o.__repr__() )
         return "\n".join(members)
 
-    def load_ot( self, serverconnection, url, iscacheable=True, isused=False ):
+    def load_ot( self, serverconnection, url, iscacheable=True, isused=False, cache=None ):
         if url in self.ots:
 #            raise Exception( f"OT definition for {url} already present!" )
             print( f"OT definition for {url} already present!" )
             return
-        # get the URI and process all the attributes
-        content_x = serverconnection.execute_get_xml( url, params={'vvc.configuration':serverconnection.local_config},headers={'Configuration-Context': None},  cacheable=iscacheable )
-        if content_x is None:
-            raise Exception( "No XML!" )
+        self.load_types( serverconnection, [('OT',url,isused)], iscacheable=iscacheable, cache=cache )
+
+    def load_ad( self, serverconnection, url, iscacheable=True, isused=False, cache=None ):
+        if url in self.ads:
+#            print( f"AD definition for {url} already present!" )
+            return
+        self.load_types( serverconnection, [('AD',url,isused)], iscacheable=iscacheable, cache=cache )
+
+    def load_at( self, serverconnection, url, iscacheable=True, isused=False, cache=None ):
+#        print( f"load_at {url=}" )
+        if url in self.ats:
+#            print( f"AT definition for {url} already present!" )
+            return
+        self.load_types( serverconnection, [('AT',url,isused)], iscacheable=iscacheable, cache=cache )
 
+    def load_lt( self, serverconnection, url, iscacheable=True, isused=False, cache=None ):
+#        print( f"load_lt {url=}" )
+        if url in self.lts:
+#            print( f"LT definition for {url} already present!" )
+            return
+        self.load_types( serverconnection, [('LT',url,isused)], iscacheable=iscacheable, cache=cache )
+
+    # load type definitions as a concurrent crawl in the current local config of serverconnection
+    # todo is a list of (kind,url,isused) where kind is OT, AD, AT or LT - each definition is retrieved once (at most workers at a time)
+    # and the definitions it references (an OT's attribute definitions, an AD's attribute type) are added to the crawl
+    # isused is applied to the todo definitions and then propagated from used OTs to their ADs and from used ADs to their ATs
+    # cache is a TypeDefinitionCache which can be shared by the typesystems of several configurations; modifieds is an optional dictionary
+    # url->dcterms:modified (e.g. from the query which found the types) which lets the cache reuse definitions retrieved in another configuration
+    def load_types( self, serverconnection, todo, *, iscacheable=True, modifieds=None, cache=None, workers=None ):
+        cache = cache or TypeDefinitionCache()
+        modifieds = modifieds or {}
+        workers = workers or _project.TYPESYSTEM_LOAD_WORKERS
+        config = serverconnection.local_config
+        registries = { 'OT': self.ots, 'AD': self.ads, 'AT': self.ats, 'LT': self.lts }
+        parsers = { 'OT': self._parse_ot, 'AD': self._parse_ad, 'AT': self._parse_at, 'LT': self._parse_lt }
+        visited = set()
+        used = set()
+
+        def retrieve( kind, url ):
+            content_x = cache.get( serverconnection, url, config, modified=modifieds.get( url ), iscacheable=iscacheable )
+            return parsers[kind]( serverconnection, url, content_x )
+
+        with concurrent.futures.ThreadPoolExecutor( max_workers=workers ) as executor:
+            futures = {}
+
+            def submit( kind, url, isused ):
+                if isused:
+                    used.add( (kind,url) )
+                if (kind,url) in visited or url in registries[kind]:
+                    return
+                if kind == 'AT' and not serverconnection.app.is_server_uri( url ):
+#                    print( f"AT Ignoring non-server URL {url}" )
+                    return
+                visited.add( (kind,url) )
+                futures[executor.submit( retrieve, kind, url )] = (kind,url)
+
+            for kind,url,isused in todo:
+                submit( kind, url, isused )
+            while futures:
+                done,notdone = concurrent.futures.wait( futures, return_when=concurrent.futures.FIRST_COMPLETED )
+                for future in done:
+                    kind,url = futures.pop( future )
+                    thetype,references = future.result()
+                    registries[kind][url] = thetype
+                    for refkind,refurl in references:
+                        submit( refkind, refurl, False )
+
+        # now all are loaded, mark the used ones and propagate to what they reference
+        for kind,url in used:
+            if url in registries[kind]:
+                registries[kind][url].isused = True
+        for ot in self.ots.values():
+            if ot.isused:
+                for att_u in ot.attriburls:
+                    if att_u in self.ads:
+                        self.ads[att_u].isused = True
+        for ad in self.ads.values():
+            if ad.isused and ad.basetypeurl in self.ats:
+                self.ats[ad.basetypeurl].isused = True
+        self._fingerprints = None
+        logger.info( f"Loaded types for {config} {len(visited)} definitions, cache retrieved {cache.nretrieved} reused {cache.nreused}" )
+
+    # these parse a retrieved definition returning the type object and a list of (kind,url) of the definitions it references
+
+    def _parse_ot( self, serverconnection, url, content_x ):
         modified = rdfxml.xmlrdf_get_resource_uri( content_x,'.//dcterms:modified', exceptionifnotfound=True )
         modifiedBy = rdfxml.xmlrdf_get_resource_uri( content_x,'.//dcterms:contributor', exceptionifnotfound=True )
 #        component = rdfxml.xmlrdf_get_resource_uri( content_x,'.//oslc_config:component', exceptionifnotfound=True )
@@ -306,18 +426,9 @@ class TypeSystem(object):
                 # ignore system attributes - these don't start with the serverl external URI
                 continue
             atturls.append( att_u )
-            self.load_ad( serverconnection, att_u, iscacheable=iscacheable, isused=isused )
-        self.ots[url] = OT( url, ot_sameas, url, label, atturls, modified=modified, modifiedBy=modifiedBy, isused=isused)
-
-    def load_ad( self, serverconnection, url, iscacheable=True, isused=False ):
-        if url in self.ads:
-#            print( f"AD definition for {url} already present!" )
-            return
-        # get the URI and process all the attributes
-        content_x = serverconnection.execute_get_xml( url, params={'vvc.configuration':serverconnection.local_config},headers={'Configuration-Context': None}, cacheable=iscacheable )
-        if content_x is None:
-            raise Exception( "No XML!" )
+        return OT( url, ot_sameas, url, label, atturls, modified=modified, modifiedBy=modifiedBy ), [('AD',att_u) for att_u in atturls]
 
+    def _parse_ad( self, serverconnection, url, content_x ):
         modified = rdfxml.xmlrdf_get_resource_uri( content_x,'.//dcterms:modified', exceptionifnotfound=True )
         modifiedBy = rdfxml.xmlrdf_get_resource_uri( content_x,'.//dcterms:contributor', exceptionifnotfound=True )
 #        component = rdfxml.xmlrdf_get_resource_uri( content_x,'.//oslc_config:component', exceptionifnotfound=True )
@@ -330,21 +441,9 @@ class TypeSystem(object):
         ismultivalued = rdfxml.xmlrdf_get_resource_text( content_x, './/dng_types:multiValued' ) or False
         aturl = rdfxml.xmlrdf_get_resource_uri( content_x,'.//dng_types:range' )
 
-        self.load_at( serverconnection, aturl, isused=isused, iscacheable=iscacheable )
+        return AD( url, sameas, aturl, label, aturl, ismultivalued, modified=modified, modifiedBy=modifiedBy ), [('AT',aturl)]
 
-        self.ads[url] = AD( url, sameas, aturl, label, aturl, ismultivalued, modified=modified, modifiedBy=modifiedBy, isused=isused )
-
-    def load_at( self, serverconnection, url, iscacheable=True, isused=False ):
-#        print( f"load_at {url=}" )
-        if url in self.ats:
-#            print( f"AT definition for {url} already present!" )
-            return
-        if not serverconnection.app.is_server_uri( url ):
-#            print( f"AT Ignoring non-server URL {url}" )
-            return
-        content_x = serverconnection.execute_get_xml( url, params={'vvc.configuration':serverconnection.local_config},headers={'Configuration-Context': None}, cacheable=iscacheable )
-        if content_x is None:
-            raise Exception( "No XML!" )
+    def _parse_at( self, serverconnection, url, content_x ):
         modified = rdfxml.xmlrdf_get_resource_uri( content_x,'.//dcterms:modified', exceptionifnotfound=True )
         modifiedBy = rdfxml.xmlrdf_get_resource_uri( content_x,'.//dcterms:contributor', exceptionifnotfound=True )
 #        component = rdfxml.xmlrdf_get_resource_uri( content_x,'.//oslc_config:component', exceptionifnotfound=True )
@@ -369,8 +468,8 @@ class TypeSystem(object):
 #                print( f"enum_x={ET.tostring(enum_x)=}" )
                 enum_u = rdfxml.xmlrdf_get_resource_uri( enum_x, exceptionifnotfound=True )
 #                print( f"{enum_u=}" )
-                enumlabel = rdfxml.xmlrdf_get_resource_uri( content_x,'.//rdfs:label', exceptionifnotfound=True )
-                value = rdfxml.xmlrdf_get_resource_uri( content_x,'.//rdf:value', exceptionifnotfound=True )
+                enumlabel = rdfxml.xmlrdf_get_resource_uri( enum_x,'./rdfs:label', exceptionifnotfound=True )
+                value = rdfxml.xmlrdf_get_resource_uri( enum_x,'./rdf:value', exceptionifnotfound=True )
                 # this enum value doesn't have a URI if its rdf:about is a server-local URL
                 if serverconnection.app.is_server_uri( enum_u ):
                     # if the enum url is a server URL, then it's not an RDF URI, which means there isn't a uri
@@ -380,17 +479,9 @@ class TypeSystem(object):
                     esameas = enum_u
                 enumvalues[ enum_u ] = EnumValue( enum_u, enumlabel, value, esameas )
 
-        self.ats[url] = AT( url, sameas, url, label, basetype_u, isenum, enumvalues, modified=modified, modifiedBy=modifiedBy, isused=isused )
-#        print( f"{self.ats=}" )
+        return AT( url, sameas, url, label, basetype_u, isenum, enumvalues, modified=modified, modifiedBy=modifiedBy ), []
 
-    def load_lt( self, serverconnection, url, iscacheable=True, isused=False ):
-#        print( f"load_lt {url=}" )
-        if url in self.lts:
-#            print( f"LT definition for {url} already present!" )
-            return
-        content_x = serverconnection.execute_get_xml( url, params={'vvc.configuration':serverconnection.local_config},headers={'Configuration-Context': None}, cacheable=iscacheable )
-        if content_x is None:
-            raise Exception( "No XML!" )
+    def _parse_lt( self, serverconnection, url, content_x ):
         modified = rdfxml.xmlrdf_get_resource_uri( content_x,'.//dcterms:modified', exceptionifnotfound=True )
         modifiedBy = rdfxml.xmlrdf_get_resource_uri( content_x,'.//dcterms:contributor', exceptionifnotfound=True )
 #        component = rdfxml.xmlrdf_get_resource_uri( content_x,'.//oslc_config:component', exceptionifnotfound=True )
@@ -400,8 +491,64 @@ class TypeSystem(object):
 #        print( f"{sameas=}" )
 #    def __init__( self, url, uri, name, label, modified=None, modifiedBy=None, isused=False ):
 
-        self.lts[url] = LT( url, sameas, url, label, modified=modified, modifiedBy=modifiedBy, isused=isused )
-#        print( f"{self.lts=}" )
+        return LT( url, sameas, url, label, modified=modified, modifiedBy=modifiedBy ), []
+
+    # structural fingerprints (hashes) of this typesystem: one for each OT, AD, AT (including its enum values), LT and each enum AT's
+    # enum value set, then one for each kind and one for the whole typesystem. Metadata (modified, modifiedBy, isused) isn't included
+    # so two configurations with the same types have the same fingerprint even if the types were modified and then changed back
+    # returns { 'types': { kind: { url: fingerprint } }, 'kind': { kind: fingerprint }, 'typesystem': fingerprint } where kind is OT, AD, AT, LT or ENUMS
+    def fingerprints( self ):
+        if self._fingerprints is None:
+            types = {}
+            types['OT'] = { url: _fingerprint( ot.name, ot.uri, ot.label, sorted( ot.attriburls ) ) for url,ot in self.ots.items() }
+            types['AD'] = { url: _fingerprint( ad.name, ad.uri, ad.label, ad.basetypeurl, ad.ismultivalued ) for url,ad in self.ads.items() }
+            types['ENUMS'] = { url: _fingerprint( sorted( ( e.url, e.name, e.value, e.uri ) for e in at.enumvalues.values() ) ) for url,at in self.ats.items() if at.isenum }
+            types['AT'] = { url: _fingerprint( at.name, at.uri, at.label, at.basetypeurl, at.isenum, types['ENUMS'].get( url ) ) for url,at in self.ats.items() }
+            types['LT'] = { url: _fingerprint( lt.name, lt.uri, lt.label ) for url,lt in self.lts.items() }
+            kinds = { kind: _fingerprint( sorted( fps.items() ) ) for kind,fps in types.items() }
+            self._fingerprints = { 'types': types, 'kind': kinds, 'typesystem': _fingerprint( sorted( kinds.items() ) ) }
+        return self._fingerprints
+
+    # compare this typesystem (A) with another (B) by fingerprint, only drilling down into kinds/types whose fingerprints differ
+    # returns a list of differences, each a dictionary (so it can be saved as JSON):
+    #   { 'kind': OT/AD/AT/LT, 'url': url, 'name': name, 'change': 'added'/'removed'/'changed', 'fields': { field: [a value, b value] } }
+    # 'added' means only in B, 'removed' means only in A. An OT with changed attributes has 'attributes': {'added': [urls], 'removed': [urls]}
+    # and an AT with changed enum values has 'enums': { 'added': [urls], 'removed': [urls], 'changed': { enum url: { field: [a value, b value] } } }
+    def diff( self, other ):
+        afps = self.fingerprints()
+        bfps = other.fingerprints()
+        results = []
+        if afps['typesystem'] == bfps['typesystem']:
+            return results
+        for kind,attrs,fields in ( ('OT','ots',('name','uri','label')), ('AD','ads',('name','uri','label','basetypeurl','ismultivalued')), ('AT','ats',('name','uri','label','basetypeurl','isenum')), ('LT','lts',('name','uri','label')) ):
+            # (an AT's fingerprint includes its enum values)
+            if afps['kind'][kind] == bfps['kind'][kind]:
+                continue
+            atypes = getattr( self, attrs )
+            btypes = getattr( other, attrs )
+            aurlfps = afps['types'][kind]
+            burlfps = bfps['types'][kind]
+            for url in sorted( set( aurlfps ) | set( burlfps ) ):
+                if aurlfps.get( url ) == burlfps.get( url ):
+                    continue
+                if url not in btypes:
+                    results.append( { 'kind': kind, 'url': url, 'name': atypes[url].label, 'change': 'removed' } )
+                    continue
+                if url not in atypes:
+                    results.append( { 'kind': kind, 'url': url, 'name': btypes[url].label, 'change': 'added' } )
+                    continue
+                a = atypes[url]
+                b = btypes[url]
+                difference = { 'kind': kind, 'url': url, 'name': b.label, 'change': 'changed', 'fields': {} }
+                for field in fields:
+                    if getattr( a, field ) != getattr( b, field ):
+                        difference['fields'][field] = [ getattr( a, field ), getattr( b, field ) ]
+                if kind == 'OT' and set( a.attriburls ) != set( b.attriburls ):
+                    difference['attributes'] = { 'added': sorted( set( b.attriburls ) - set( a.attriburls ) ), 'removed': sorted( set( a.attriburls ) - set( b.attriburls ) ) }
+                if kind == 'AT' and afps['types']['ENUMS'].get( url ) != bfps['types']['ENUMS'].get( url ):
+                    difference['enums'] = _diff_enums( a.enumvalues, b.enumvalues )
+                results.append( difference )
+        return results
 
     def checkinternalconsistency( self ):
         '''
@@ -419,29 +566,29 @@ class TypeSystem(object):
         self.atnames = {}
         self.ltnames = {}
         for a in self.ots:
-            self.names.update(self.ots[a].name)
+            self.names.update([self.ots[a].name])
             if self.ots[a].uri:
-                self.uris.update(self.ots[a].uri)
+                self.uris.update([self.ots[a].uri])
                 
         for a in self.ads:
-            self.names.update(self.ads[a].name)
+            self.names.update([self.ads[a].name])
             if self.ads[a].uri:
-                uself.ris.update(self.ads[a].uri)
+                self.uris.update([self.ads[a].uri])
                 
         for a in self.ats:
-            self.names.update(self.ats[a].name)
+            self.names.update([self.ats[a].name])
             if self.ats[a].uri:
-                self.uris.update(self.ats[a].uri)
+                self.uris.update([self.ats[a].uri])
             # collect URIs from enums
             for ae, aev in self.ats[a].enumvalues.items():
-                print( f"{ae=} {aev=}" )
+#                print( f"{ae=} {aev=}" )
                 if aev.uri:
-                    self.uris.update( aev.uri )
+                    self.uris.update( [aev.uri] )
                     
         for a in self.lts:
-            self.names.update(self.lts[a].label)
+            self.names.update([self.lts[a].label])
             if self.lts[a].uri:
-                self.uris.update(self.lts[a].uri)
+                self.uris.update([self.lts[a].uri])
                 
         # start by checking OTs
         for aurl in self.ots.keys():
@@ -491,9 +638,9 @@ class TypeSystem(object):
             enumvalues = collections.Counter()
             for ae, aev in self.ats[aurl].enumvalues.items():
                 if aev.uri:
-                    enumuris.update( aev.uri )
-                enumnames.update( aev.name )
-                enumvalues.update( aev.value )
+                    enumuris.update( [aev.uri] )
+                enumnames.update( [aev.name] )
+                enumvalues.update( [aev.value] )
 
             # check the enums
             for ae, aev in self.ats[aurl].enumvalues.items():
@@ -525,6 +672,24 @@ class TypeSystem(object):
             print( f"{result=}" )
         return results
 
+    # lookups for matchtype - the url of the first type in registry (one of another typesystem's ots/ads/ats/lts) with each URI, and with each name
+    def _matchlookups( self, registry ):
+        byuri = {}
+        byname = {}
+        for url,othertype in registry.items():
+            if othertype.uri:
+                byuri.setdefault( othertype.uri, url )
+            byname.setdefault( othertype.name, url )
+        return byuri, byname
+
+    # find the type which matches thetype using lookups from _matchlookups - the one with the same URI if there is one,
+    # otherwise the one with the same name - returns its url or None
+    def matchtype( self, thetype, lookups ):
+        byuri, byname = lookups
+        if thetype.uri and thetype.uri in byuri:
+            return byuri[thetype.uri]
+        return byname.get( thetype.name )
+
     def checkagainstothertypesystem( self, theothertypesystem, verbose=False, comparewithref=False, allowmoreina=True ):
         '''
         This comparison is based around unique URLs for types, which are/can be common to both typesystems
@@ -533,19 +698,32 @@ class TypeSystem(object):
 #        print( f"CAOTS {self=} {theothertypesystem=}" )
         # compares self (A) with other (B)
         results = []
+        # types with the same URL and fingerprint can't have any differences so are skipped (and if the whole typesystem has the same fingerprint there's nothing to do)
+        if not comparewithref:
+            afps = self.fingerprints()
+            bfps = theothertypesystem.fingerprints()
+            if afps['typesystem'] == bfps['typesystem']:
+                return results
+        else:
+            # built once so matching each type is a lookup rather than a scan of the other typesystem
+            blookups = { kind: self._matchlookups( getattr( theothertypesystem, kind ) ) for kind in ( 'ots', 'ads', 'ats', 'lts' ) }
+        def unchanged( kind, url ):
+            return not comparewithref and afps['types'][kind].get( url ) is not None and afps['types'][kind].get( url ) == bfps['types'][kind].get( url )
         # checks e.g. that types with the same UUID have the same URI
 
         # Artifact Types
         for aurl in self.ots.keys():
             # for all the types in A
 #            print( f"{aurl=}" )
+            if unchanged( 'OT', aurl ):
+                continue
             # try to find the a OT in b
             if comparewithref:
                 # try to find the b type using a's URI or name
-                burl = self.matchtype( self.ots(aurl), theothertypesystem.ots )
+                burl = self.matchtype( self.ots[aurl], blookups['ots'] )
             else:
                 # simple lookup of aurl in bots
-                burl = theothertypesystem.ots.get( aurl )
+                burl = aurl if aurl in theothertypesystem.ots else None
             if burl:
                 # if the type is also in B, we can compare
 #                print( f"matched {aurl=}" )
@@ -582,12 +760,14 @@ class TypeSystem(object):
         for aurl in self.ads.keys():
             # for all the types in A
 #            print( f"{aurl=}" )
+            if unchanged( 'AD', aurl ):
+                continue
             if comparewithref:
                 # try to find the b type using a's URI or name
-                burl = self.matchtype( self.ads(aurl), theothertypesystem.ads )
+                burl = self.matchtype( self.ads[aurl], blookups['ads'] )
             else:
                 # simple lookup of aurl in bots
-                burl = theothertypesystem.ads.get( aurl )
+                burl = aurl if aurl in theothertypesystem.ads else None
             if burl:
                 # if the type is also in B, we can compare
 #                print( f"matched {aurl=}" )
@@ -623,12 +803,14 @@ class TypeSystem(object):
         for aurl in self.ats.keys():
             # for all the types in A
 #            print( f"{aurl=}" )
+            if unchanged( 'AT', aurl ):
+                continue
             if comparewithref:
                 # try to find the b type using a's URI or name
-                burl = self.matchtype( self.ats(aurl), theothertypesystem.ats )
+                burl = self.matchtype( self.ats[aurl], blookups['ats'] )
             else:
                 # simple lookup of aurl in bots
-                burl = theothertypesystem.ats.get( aurl )
+                burl = aurl if aurl in theothertypesystem.ats else None
             if burl:
                 # if the type is also in B, we can compare
 #                print( f"matched {aurl=}" )
@@ -684,12 +866,14 @@ class TypeSystem(object):
         for aurl in self.lts.keys():
             # for all the types in A
 #            print( f"{aurl=}" )
+            if unchanged( 'LT', aurl ):
+                continue
             if comparewithref:
                 # try to find the b type using a's URI or name
-                burl = self.matchtype( self.lts(aurl), theothertypesystem.lts )
+                burl = self.matchtype( self.lts[aurl], blookups['lts'] )
             else:
                 # simple lookup of aurl in b
-                burl = theothertypesystem.lts.get( aurl )
+                burl = aurl if aurl in theothertypesystem.lts else None
             if burl:
                 # if the type is also in B, we can compare
 #                print( f"matched {aurl=}" )
@@ -720,6 +904,55 @@ class TypeSystem(object):
             print( f"{result=}" )
         return results
 
+# the fingerprint of some values (strings, bools, None and lists/tuples of them)
+def _fingerprint( *values ):
+    return hashlib.sha256( repr( values ).encode() ).hexdigest()
+
+def _diff_enums( aenums, benums ):
+    result = { 'added': sorted( set( benums ) - set( aenums ) ), 'removed': sorted( set( aenums ) - set( benums ) ), 'changed': {} }
+    for e in sorted( set( aenums ) & set( benums ) ):
+        changes = { field: [ getattr( aenums[e], field ), getattr( benums[e], field ) ] for field in ( 'name', 'value', 'uri' ) if getattr( aenums[e], field ) != getattr( benums[e], field ) }
+        if changes:
+            result['changed'][e] = changes
+    return result
+
+# compare many typesystems (e.g. all the streams and baselines of a component) - typesystems with the same fingerprint are grouped
+# and only one of each group is compared. Each group is compared with reference (a TypeSystem) if specified, otherwise with the first
+# group, or if pairwise is True every group is compared with every other group
+# returns a report dictionary which can be saved as JSON:
+#   { 'groups': [ { 'fingerprint': fp, 'configs': [ {'name': config name, 'uri': config uri } ] } ],
+#     'diffs': [ { 'a': fingerprint, 'b': fingerprint, 'differences': [ see TypeSystem.diff() ] } ] }
+def diff_typesystems( typesystems, *, reference=None, pairwise=False ):
+    groups = {}
+    for ts in typesystems:
+        groups.setdefault( ts.fingerprints()['typesystem'], [] ).append( ts )
+    report = { 'groups': [ { 'fingerprint': fp, 'configs': [ { 'name': ts.config_name, 'uri': ts.config_u } for ts in tss ] } for fp,tss in groups.items() ], 'diffs': [] }
+    representatives = [ tss[0] for tss in groups.values() ]
+    if reference is not None:
+        pairs = [ ( reference, ts ) for ts in representatives ]
+    elif pairwise:
+        pairs = [ ( a, b ) for i,a in enumerate( representatives ) for b in representatives[i+1:] ]
+    else:
+        pairs = [ ( representatives[0], ts ) for ts in representatives[1:] ]
+    for a,b in pairs:
+        differences = a.diff( b )
+        if differences:
+            report['diffs'].append( { 'a': a.fingerprints()['typesystem'], 'b': b.fingerprints()['typesystem'], 'differences': differences } )
+    return report
+
+# check the internal consistency of many typesystems - the check is only done once for each distinct fingerprint because
+# typesystems with the same fingerprint have the same results
+# returns a dictionary keyed by config uri of the results from checkinternalconsistency
+def check_typesystems_consistency( typesystems ):
+    byfingerprint = {}
+    results = {}
+    for ts in typesystems:
+        fp = ts.fingerprints()['typesystem']
+        if fp not in byfingerprint:
+            byfingerprint[fp] = ts.checkinternalconsistency()
+        results[ts.config_u] = byfingerprint[fp]
+    return results
+
 class ComponentTypeSytem( object ):
     # has a local config tree of TypeSystem objects
     localconfigtree = None
@@ -4,10 +4,15 @@
 ##
 
 
+import concurrent.futures
+import copy
+import hashlib
 import logging
+import os
 
 import lxml.etree as ET
 import requests
+import tqdm
 
 from . import _typesystem
 from . import httpops
@@ -17,6 +22,12 @@ from . import utils
 
 logger = logging.getLogger(__name__)
 
+# max number of parallel GETs when loading a typesystem
+TYPESYSTEM_LOAD_WORKERS = 8
+
+# max number of parallel GETs when discovering components and configurations
+CONFIG_LOAD_WORKERS = 8
+
 #################################################################################################
 
 @utils.mixinomatic
@@ -43,6 +54,8 @@ class _Project( oslcqueryapi._OSLCOperations_Mixin, _typesystem.Type_System_Mixi
         self.appcatalog_xml = None
         self.hooks = []
         self.configTree = None # for a walkable tree of configs, alternating baseline->stream->baseline->... - the name property is the UUID, the textname is the visible name, configURL, ismutable, children
+        self.typesystem_snapshot_folder = None # if set, the loaded typesystem is saved to/restored from a snapshot in this folder
+        self.typesystem_snapshot_freshness = "etags"
         # copy the server from the app - this is so OSLC query can be done on either a project including component) or app
         self.server = app.server
 #        self.default_query_sort_property = None
@@ -61,7 +74,201 @@ class _Project( oslcqueryapi._OSLCOperations_Mixin, _typesystem.Type_System_Mixi
         pass
 
     def load_types(self):
-        self._load_types()
+        if self.typesystem_snapshot_folder and not self.typesystem_loaded:
+            if self._restore_typesystem_snapshot():
+                return
+            self._load_types()
+            self._save_typesystem_snapshot()
+        else:
+            self._load_types()
+
+    # use snapshots of the typesystem saved in folder - a later load_types in the same context (server/project/component/configuration)
+    # will restore the snapshot if it is still fresh, instead of retrieving all the type definitions
+    # freshness is how the snapshot is checked before it's used:
+    #   "etags" - the list of shapes in services.xml must be unchanged, and a conditional GET for each retrieved type definition must return 304 Not Modified
+    #             (if no ETags were recorded when the typesystem was loaded - e.g. for QM - the snapshot can't be checked so isn't used)
+    #   "shapes" - only the list of shapes in services.xml must be unchanged
+    #   "none" - not checked, the snapshot is always used (delete the snapshot to force a reload)
+    # the snapshots are JSON - the folder should still only be writable by you, because a snapshot is trusted to describe the typesystem
+    def enable_typesystem_snapshots(self, folder, *, freshness="etags"):
+        if freshness not in ["etags","shapes","none"]:
+            raise Exception( f"Typesystem snapshot freshness must be one of etags, shapes or none not '{freshness}'" )
+        self.typesystem_snapshot_folder = folder
+        self.typesystem_snapshot_freshness = freshness
+
+    # the key identifying the context of the typesystem
+    def _typesystem_snapshot_key(self):
+        project_uri = self.component_project.project_uri if self.component_project else self.project_uri
+        return ( self.app.baseurl, project_uri, self.project_uri, self.local_config, self.global_config )
+
+    def _typesystem_snapshot_filename(self):
+        keyhash = hashlib.sha256( repr( self._typesystem_snapshot_key() ).encode() ).hexdigest()[:32]
+        return os.path.join( self.typesystem_snapshot_folder, f"typesystem_{keyhash}.json" )
+
+    # the shape uris in services.xml - used to detect added/removed shapes
+    def _typesystem_shape_uris(self):
+        sx = self.get_services_xml()
+        if sx is None:
+            return []
+        return sorted( set( rdfxml.xmlrdf_get_resource_uri( el ) for el in rdfxml.xml_find_elements( sx, './/oslc:resourceShape' ) ) )
+
+    def _save_typesystem_snapshot(self):
+        try:
+            shapeuris = self._typesystem_shape_uris()
+        except Exception as e:
+            logger.info( f"Not saving typesystem snapshot - no shape list {e}" )
+            return
+        etags = dict(self._typeetags)
+        if not etags and self.typesystem_snapshot_freshness == "etags":
+            logger.warning( "No ETags were recorded while loading the typesystem so the snapshot won't be used with freshness 'etags' - use 'shapes' for this app" )
+        etags['+-+services+-+'] = shapeuris
+        try:
+            self.save_typesystem_snapshot( self._typesystem_snapshot_filename(), key=self._typesystem_snapshot_key(), etags=etags )
+        except Exception as e:
+            logger.info( f"Not saving typesystem snapshot {e}" )
+
+    # returns True if a fresh snapshot was restored
+    def _restore_typesystem_snapshot(self):
+        filename = self._typesystem_snapshot_filename()
+        snapshot = self.read_typesystem_snapshot( filename, key=self._typesystem_snapshot_key() )
+        if snapshot is None:
+            return False
+        etags = dict(snapshot['etags'])
+        shapeuris = etags.pop( '+-+services+-+', None )
+        if self.typesystem_snapshot_freshness != "none":
+            if shapeuris != self._typesystem_shape_uris():
+                logger.info( f"Typesystem snapshot {filename} is stale - shapes have changed" )
+                return False
+            if self.typesystem_snapshot_freshness == "etags":
+                if not etags:
+                    # e.g. an app which doesn't retrieve its type definitions using _get_typeuri_rdf so no ETags were recorded
+                    logger.warning( f"Typesystem snapshot {filename} has no ETags so can't be checked for freshness - not used (use freshness 'shapes' for this app)" )
+                    return False
+                changed = self._changed_type_uris( etags )
+                if changed:
+                    logger.info( f"Typesystem snapshot {filename} is stale - {len(changed)} changed e.g. {changed[0]}" )
+                    return False
+        snapshot['etags'] = etags
+        self.restore_typesystem_snapshot( snapshot )
+        logger.info( f"Restored typesystem snapshot {filename}" )
+        return True
+
+    # incrementally refresh a loaded typesystem, e.g. so a long-running service picks up new attributes/enumeration values, rather than
+    # using load_types(force=True) which clears and retrieves everything:
+    #  - the shape list in services.xml is compared with the one the typesystem was loaded from
+    #  - each retrieved type definition (shapes, link types, ranges holding enumeration values) is checked with a conditional GET using its ETag,
+    #    or if the server didn't provide an ETag it is retrieved and its dcterms:modified (or if none its content) compared
+    #  - if anything has changed only the changed definitions are retrieved again, and the registries are rebuilt from the cached definitions
+    #    and updated in place
+    # so on a stable project the cost is a GET of services.xml plus a conditional GET per type definition, and nothing is re-registered
+    # (after restoring a snapshot the type definitions aren't cached, so if anything has changed they are all retrieved again)
+    # returns the sorted list of uris which had changed (empty if nothing changed)
+    def refresh_types(self, *, workers=None):
+        if not self.typesystem_loaded:
+            self.load_types()
+            return []
+        oldshapeuris = self._typesystem_shape_uris()
+        self._get_typesystem_services_xml()
+        newshapeuris = self._typesystem_shape_uris()
+        retrieved = {}
+        changed = self._changed_type_uris( self._typeetags, workers=workers, retrieved=retrieved )
+        changed += self._changed_unvalidated_type_uris( workers=workers )
+        if not changed and oldshapeuris == newshapeuris:
+            logger.info( "refresh_types no changes" )
+            return []
+        if oldshapeuris != newshapeuris:
+            changed += [u for u in sorted( set( oldshapeuris ) ^ set( newshapeuris ) ) if u not in changed]
+        logger.info( f"refresh_types {len(changed)} changed {changed[:10]}" )
+        for uri in changed:
+            realuri = uri.rsplit( '#',1 )[0]
+            # changed definitions may already have been re-retrieved while checking, otherwise they will be retrieved when loading
+            if realuri in self._typeetags:
+                self._gettypecache.pop( realuri, None )
+            self._typeetags.pop( realuri, None )
+        # the new definitions returned by the conditional GETs are used rather than retrieving them again
+        for realuri,( xml, etag ) in retrieved.items():
+            self._gettypecache[realuri] = xml
+            if etag:
+                self._typeetags[realuri] = etag
+        # rebuild into new registries keeping the type cache, then update the current registries in place
+        current = ( self.shapes, self.properties, self.linktypes, self.enums, self.values, self.enumdefs )
+        self._preserve_typecache = True
+        try:
+            self._load_types( force=True )
+        finally:
+            self._preserve_typecache = False
+        new = ( self.shapes, self.properties, self.linktypes, self.enums, self.values, self.enumdefs )
+        self.shapes, self.properties, self.linktypes, self.enums, self.values, self.enumdefs = current
+        self.update_typesystem_registries( *new )
+        self.typesystem_loaded = True
+        if self.typesystem_snapshot_folder:
+            self._save_typesystem_snapshot()
+        return sorted( changed )
+
+    # retrieve services.xml (in the local config if there is one) into self.services_xml as the app _load_types do
+    def _get_typesystem_services_xml(self):
+        if self.local_config:
+            return self.get_services_xml(force=True,headers={'Configuration.Context': self.local_config, 'net.jazz.jfs.owning-context': None})
+        return self.get_services_xml(force=True)
+
+    # check (in parallel) the type definitions in the type cache which don't have an ETag by retrieving them again and comparing
+    # dcterms:modified, or if that isn't present the content. Changed definitions are updated in the type cache.
+    # returns a list of the uris which have changed
+    def _changed_unvalidated_type_uris(self, *, workers=None):
+        workers = workers or TYPESYSTEM_LOAD_WORKERS
+        uris = [uri for uri,xml in self._gettypecache.items() if xml is not None and uri not in self._typeetags]
+        def get_modified(xml):
+            return [el.text for el in rdfxml.xml_find_elements( xml, './/dcterms:modified' )]
+        def is_changed(uri):
+            try:
+                newxml = self.execute_get_rdf_xml( uri, intent="Check if type definition has changed", cacheable=False, no_error_log=True )
+            except ( requests.HTTPError, ET.XMLSyntaxError ) as e:
+                logger.info( f"Type {uri} check failed {e}" )
+                return True, None
+            oldxml = self._gettypecache[uri]
+            if get_modified( oldxml ) and get_modified( newxml ):
+                return get_modified( oldxml ) != get_modified( newxml ), newxml
+            return ET.tostring( oldxml ) != ET.tostring( newxml ), newxml
+        changed = []
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = { executor.submit(is_changed,uri): uri for uri in uris }
+            for future in concurrent.futures.as_completed(futures):
+                ischanged, newxml = future.result()
+                if ischanged:
+                    uri = futures[future]
+                    changed.append( uri )
+                    self._gettypecache[uri] = newxml
+        return sorted(changed)
+
+    # do conditional GETs in parallel for the uris, returning a list of those which have changed (or can't be checked)
+    # etags is a dictionary keyed by uri of the etag when the uri was last retrieved
+    # if retrieved is a dictionary the new definition of each changed uri is put in it as ( xml, etag ) so it doesn't have to be retrieved again
+    def _changed_type_uris(self, etags, *, workers=None, retrieved=None):
+        workers = workers or TYPESYSTEM_LOAD_WORKERS
+        def is_changed(uri,etag):
+            try:
+                response = self.execute_get_raw( uri, headers={'Accept': 'application/rdf+xml', 'If-None-Match': etag}, intent="Check if type definition has changed", cacheable=False, no_error_log=True )
+            except requests.HTTPError as e:
+                logger.info( f"Type {uri} check failed {e}" )
+                return True, None
+            if response.status_code == 304 or response.headers.get('ETag') == etag:
+                return False, None
+            if retrieved is None:
+                return True, None
+            try:
+                return True, ( ET.ElementTree( ET.fromstring( response.content ) ), response.headers.get('ETag') )
+            except ET.XMLSyntaxError:
+                return True, None
+        changed = []
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = { executor.submit(is_changed,uri,etag): uri for uri,etag in etags.items() }
+            for future in concurrent.futures.as_completed(futures):
+                ischanged, newdefinition = future.result()
+                if ischanged:
+                    changed.append(futures[future])
+                    if newdefinition is not None:
+                        retrieved[futures[future]] = newdefinition
+        return sorted(changed)
 
     # this is a local cache only for the typesystem retrieval
     # the cache deliberately strips off the fragment because it's irrelevant for the GET
@@ -75,7 +282,13 @@ class _Project( oslcqueryapi._OSLCOperations_Mixin, _typesystem.Type_System_Mixi
             logger.info( utils.callers() )
             try:
                 # try to retrieve the rdf using no_error_log=True becase some urls don't exist and we don't really mind if it can't be retrieved, e.g. /jts/users/unassigned which never exits in JTS
-                self._gettypecache[realuri] = self.execute_get_rdf_xml(uri, intent="Retrieve type definition", no_error_log=True) if uri.startswith( "https://") else None
+                if uri.startswith( "https://"):
+                    self._gettypecache[realuri],headers = self.execute_get_rdf_xml(uri, intent="Retrieve type definition", no_error_log=True, return_headers=True)
+                    # remember the etag so the typesystem snapshot can be checked for freshness
+                    if headers.get('ETag'):
+                        self._typeetags[realuri] = headers['ETag']
+                else:
+                    self._gettypecache[realuri] = None
                 logger.info( f"Retrieved:" )
             except ET.XMLSyntaxError:
                  self._gettypecache[realuri] = None
@@ -87,6 +300,57 @@ class _Project( oslcqueryapi._OSLCOperations_Mixin, _typesystem.Type_System_Mixi
 #        print( f"Returning {realuri} {self._gettypecache[realuri]} {ET.tostring(self._gettypecache[realuri])}" )
         return self._gettypecache[realuri]
 
+    # retrieve a list of type uris in parallel into the typesystem cache so that subsequent _get_typeuri_rdf calls for them
+    # don't need to GET - the order of the uris doesn't matter and ones already in the cache aren't retrieved again
+    # returns the number of uris retrieved
+    def _prefetch_typeuris(self, uris, *, workers=None, verbose=False, desc="Retrieving types"):
+        workers = workers or TYPESYSTEM_LOAD_WORKERS
+        toget = {}
+        for uri in uris:
+            realuri = uri.rsplit( '#',1 )[0]
+            if realuri not in self._gettypecache and realuri not in toget:
+                toget[realuri] = uri
+        logger.info( f"Prefetching {len(toget)} type uris {workers=}" )
+        if len(toget)==0:
+            return 0
+        if verbose:
+            pbar = tqdm.tqdm(initial=0, total=len(toget),smoothing=1,unit=" results",desc=desc)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(self._get_typeuri_rdf,uri) for uri in toget.values()]
+            for future in concurrent.futures.as_completed(futures):
+                # raise any unexpected exception
+                future.result()
+                if verbose:
+                    pbar.update(1)
+        if verbose:
+            pbar.close()
+        return len(toget)
+
+    # call get(uri) for each of uris in parallel, returning a dictionary keyed by uri (in the order of uris) of the result or of the
+    # exception raised, so the caller can decide which failures to ignore - None is ignored and duplicate uris are only retrieved once
+    # (uris can be any hashable keys, e.g. tuples of identifiers)
+    def _get_concurrently(self, get, uris, *, workers=None, verbose=False, desc="Retrieving"):
+        workers = workers or CONFIG_LOAD_WORKERS
+        touris = list( dict.fromkeys( uri for uri in uris if uri is not None ) )
+        results = {}
+        if len(touris)==0:
+            return results
+        logger.info( f"Retrieving {len(touris)} uris concurrently {workers=}" )
+        if verbose:
+            pbar = tqdm.tqdm(initial=0, total=len(touris),smoothing=1,unit=" results",desc=desc)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=min(workers,len(touris))) as executor:
+            futures = {executor.submit(get,uri): uri for uri in touris}
+            for future in concurrent.futures.as_completed(futures):
+                try:
+                    results[futures[future]] = future.result()
+                except Exception as e:
+                    results[futures[future]] = e
+                if verbose:
+                    pbar.update(1)
+        if verbose:
+            pbar.close()
+        return { uri: results[uri] for uri in touris }
+
     def report_type_system( self ):
         self.load_types()
         qcdetails = self.get_query_capability_uris()
@@ -243,6 +507,124 @@ class _Project( oslcqueryapi._OSLCOperations_Mixin, _typesystem.Type_System_Mixi
 #        print( f"{results=}" )
         return results
         
+    # record that _configurations has been changed (entries added/replaced, or the dictionary assigned) so the name index is rebuilt
+    def _configurations_changed(self):
+        self._confgeneration = getattr(self,'_confgeneration',0) + 1
+
+    # return the uris of the loaded configurations which have uri or name name_or_uri (and conftype, if specified) using an index
+    # by name - the index is rebuilt when _configurations_changed() has been called, or when _configurations is a different dictionary
+    def _find_loaded_configs(self, name_or_uri, conftype=None):
+        configurations = self._configurations or {}
+        indexfor = ( id(configurations), len(configurations), getattr(self,'_confgeneration',0) )
+        if getattr(self,'_confindexfor',None) != indexfor:
+            self._confsbyname = {}
+            for cu, cd in configurations.items():
+                self._confsbyname.setdefault(cd['name'],[]).append(cu)
+            self._confindexfor = indexfor
+        results = [name_or_uri] if name_or_uri in configurations else []
+        results.extend( cu for cu in self._confsbyname.get(name_or_uri,[]) if cu not in results )
+        if conftype:
+            results = [cu for cu in results if configurations[cu]['conftype'] == conftype]
+        return results
+
+    # make an independent copy of this project/component to run a query in another local config
+    # the copy shares the app/server/session but has its own config, services xml, typesystem and folders
+    # so that several copies can be used in parallel threads without interfering
+    def _copy_for_config(self, configuri):
+        result = copy.copy(self)
+        if result.local_config != configuri:
+            # typesystem and folders can differ between configurations so load them afresh in the copy
+            result.clear_typesystem()
+            result._folders = None
+        result.headers = dict(self.headers)
+        result.set_local_config(configuri)
+        return result
+
+    # run the same query in each of several local configurations, using a bounded pool of threads, and merge the results
+    # configs is a list of local config uris or [configuri,componenturi] pairs (as returned by get_our_contributions)
+    #   or specify gcuri to query each of this app's contributions to that global configuration
+    # each query runs in a copy of the component (found from the componenturi if provided, otherwise this project/component)
+    #   so the per-config headers/typesystem in each thread don't interfere
+    # each row of the results has columns $contriburi and $compuri added
+    # if a query in one config fails the other configs continue - errors is a dictionary keyed by config uri of the exception
+    # returns results,errors
+    def do_fanout_query(self, queryresource, *, configs=None, gcuri=None, workers=4, show_progress=True, crossproject=False, skipinaccessible=True, **queryargs):
+        if configs is None and gcuri is None:
+            raise Exception( "You must provide either configs or gcuri for a fan-out query" )
+        if configs is not None and gcuri is not None:
+            raise Exception( "You can't provide both configs and gcuri for a fan-out query" )
+        if 'addcolumns' in queryargs:
+            addcolumns = queryargs.pop('addcolumns') or {}
+        else:
+            addcolumns = {}
+        if gcuri is not None:
+            configs = self.get_our_contributions(gcuri)
+        # normalise to a list of [configuri,componenturi] sorted on configuri so the merged results are deterministic
+        targets = []
+        for config in configs:
+            if isinstance(config, str):
+                targets.append( [config,None] )
+            else:
+                targets.append( [config[0],config[1]] )
+        targets.sort(key=lambda v: v[0])
+        logger.info( f"Fan-out query {queryresource=} over {len(targets)} configs with {workers=}" )
+
+        # resolve the component for each target in this thread - this may retrieve component details so it isn't done in parallel
+        jobs = []
+        errors = {}
+        for configuri,compuri in targets:
+            queryon = self
+            if compuri is not None and compuri != self.project_uri:
+                queryon = self.find_local_component(compuri)
+                if queryon is None:
+                    if crossproject and hasattr(self,'add_external_component'):
+                        queryon = self.add_external_component(compuri)
+                    if queryon is None:
+                        errors[configuri] = Exception( f"Component {compuri} not found in current project - maybe you need to use crossproject?" )
+                        logger.info( f"Fan-out skipping {configuri} {errors[configuri]}" )
+                        continue
+            if skipinaccessible and ( ( compuri and not self.app.is_accessible(compuri) ) or not self.app.is_accessible(configuri) ):
+                # could be archived
+                errors[configuri] = Exception( f"Configuration {configuri} or component {compuri} isn't accessible (archived?)" )
+                logger.info( f"Fan-out skipping {configuri} {errors[configuri]}" )
+                continue
+            jobs.append( [queryon,configuri,compuri or queryon.project_uri] )
+
+        def query_one(queryon,configuri,compuri):
+            logger.info( f"Fan-out query start {configuri}" )
+            thisqueryon = queryon._copy_for_config(configuri)
+            thisaddcolumns = dict(addcolumns)
+            thisaddcolumns.update( {'$contriburi':configuri,'$compuri':compuri} )
+            result = thisqueryon.do_complex_query( queryresource, addcolumns=thisaddcolumns, show_progress=False, **queryargs )
+            logger.info( f"Fan-out query finish {configuri} {len(result)} results" )
+            return result
+
+        if show_progress:
+            pbar = tqdm.tqdm(initial=0, total=len(jobs),smoothing=1,unit=" configs",desc="Querying configs ")
+        perconfig = {}
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max(1,workers)) as executor:
+            futures = { executor.submit(query_one,queryon,configuri,compuri): configuri for queryon,configuri,compuri in jobs }
+            for future in concurrent.futures.as_completed(futures):
+                configuri = futures[future]
+                try:
+                    perconfig[configuri] = future.result()
+                except Exception as e:
+                    logger.info( f"Fan-out query failed for {configuri} {e}" )
+                    errors[configuri] = e
+                if show_progress:
+                    pbar.update(1)
+        if show_progress:
+            pbar.close()
+
+        # merge in config order, regardless of the order the queries completed
+        # NOTE (as for a sequential per-contribution query) if the same artifact uri is returned from more than one config the last config wins
+        results = {}
+        for configuri,compuri in targets:
+            if configuri in perconfig:
+                results.update(perconfig[configuri])
+        logger.info( f"Fan-out query completed for {len(perconfig)} of {len(targets)} configuration(s) with {len(results)} results" )
+        return results, errors
+
     def set_local_config(self, name_or_uri, global_config_uri=None):
         if name_or_uri:
             if global_config_uri is None:
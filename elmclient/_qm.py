@@ -110,6 +110,7 @@ class QMProject( _project._Project, _qmrestapi.QM_REST_API_Mixin, resource.Resou
             return
         self._components = {}
         self._configurations = {}
+        self._configurations_changed()
         ncomps = 0
         nconfs = 0
         # retrieve components and configurations for this project
@@ -153,8 +154,10 @@ class QMProject( _project._Project, _qmrestapi.QM_REST_API_Mixin, resource.Resou
                     conftype = "Stream"
                 self._components[compuri]['configurations'][confu] = {'name': conftitle, 'conftype': conftype, 'confXml': thisconfx}
                 self._configurations[confu] = self._components[compuri]['configurations'][confu]
+                self._configurations_changed()
                 nconfs += 1
             self._configurations = self._components[compuri]['configurations']
+            self._configurations_changed()
         else: # full optin
             logger.debug( f"full optin" )
             cmsp_xml = self.app.retrieve_cm_service_provider_xml()
@@ -194,22 +197,33 @@ class QMProject( _project._Project, _qmrestapi.QM_REST_API_Mixin, resource.Resou
                 confu = rdfxml.xmlrdf_get_resource_uri(component_el, './/oslc_config:configurations')
                 self._components[compu] = {'name': comptitle, 'configurations': {}, 'confs_to_load': [confu]}
 
-                configs_xml = self.execute_get_rdf_xml( confu, intent="Retrieve all project/component configuration definitions" )
-                # Each config:     <ldp:contains rdf:resource="https://jazz.ibm.com:9443/qm/oslc_config/resources/com.ibm.team.vvc.Configuration/_qT1EcEB4Eeus6Zk4qsm_Cw"/>
-
-                for confmemberx in rdfxml.xml_find_elements(configs_xml, './/ldp:contains'):
-                    thisconfu = rdfxml.xmlrdf_get_resource_uri( confmemberx )
-                    try:
-                        thisconfx = self.execute_get_rdf_xml( thisconfu, intent="Retrieve a configuration definition" )
-                        conftitle = rdfxml.xmlrdf_get_resource_text(thisconfx, './/dcterms:title')
-                        conftype = rdfxml.xmlrdf_get_resource_uri(thisconfx, './/rdf:type')
-                        logger.info( f"Found config {conftitle} {conftype} {thisconfu}" )
-                        self._components[compu]['configurations'][thisconfu] = {'name': conftitle, 'conftype': conftype,
-                                                                                'confXml': thisconfx}
-                        self._configurations[thisconfu] = self._components[compu]['configurations'][thisconfu]
-                        nconfs += 1
-                    except requests.exceptions.HTTPError as e:
-                        pass
+            # retrieve the configuration lists of all the components in parallel
+            configs_xmls = self._get_concurrently( lambda confu: self.execute_get_rdf_xml( confu, intent="Retrieve all project/component configuration definitions" ), [cd['confs_to_load'][0] for cd in self._components.values()] )
+            # Each config:     <ldp:contains rdf:resource="https://jazz.ibm.com:9443/qm/oslc_config/resources/com.ibm.team.vvc.Configuration/_qT1EcEB4Eeus6Zk4qsm_Cw"/>
+            compconfus = {}
+            for compu,cd in self._components.items():
+                configs_xml = configs_xmls.get( cd['confs_to_load'][0] )
+                if isinstance( configs_xml, Exception ):
+                    raise configs_xml
+                compconfus[compu] = [rdfxml.xmlrdf_get_resource_uri( confmemberx ) for confmemberx in rdfxml.xml_find_elements(configs_xml, './/ldp:contains')]
+
+            # then retrieve all the configuration definitions in parallel
+            thisconfxs = self._get_concurrently( lambda thisconfu: self.execute_get_rdf_xml( thisconfu, intent="Retrieve a configuration definition" ), [thisconfu for confus in compconfus.values() for thisconfu in confus] )
+            for compu,confus in compconfus.items():
+                for thisconfu in confus:
+                    thisconfx = thisconfxs[thisconfu]
+                    if isinstance( thisconfx, requests.exceptions.HTTPError ):
+                        continue
+                    if isinstance( thisconfx, Exception ):
+                        raise thisconfx
+                    conftitle = rdfxml.xmlrdf_get_resource_text(thisconfx, './/dcterms:title')
+                    conftype = rdfxml.xmlrdf_get_resource_uri(thisconfx, './/rdf:type')
+                    logger.info( f"Found config {conftitle} {conftype} {thisconfu}" )
+                    self._components[compu]['configurations'][thisconfu] = {'name': conftitle, 'conftype': conftype,
+                                                                            'confXml': thisconfx}
+                    self._configurations[thisconfu] = self._components[compu]['configurations'][thisconfu]
+                    self._configurations_changed()
+                    nconfs += 1
 
         # now create the "components"
         for cu, cd in self._components.items():
@@ -240,65 +254,70 @@ class QMProject( _project._Project, _qmrestapi.QM_REST_API_Mixin, resource.Resou
                 raise Exception( 'Cannot find configuration [%s] in project [%s]' % (name_or_uri, self.uri))
             return config_uri
         else:
-            for cu, cd in self._configurations.items():
-                logger.debug( f"{cu=} {cd=} {name_or_uri=}" )
-                if cu == name_or_uri or cd['name'] == name_or_uri:
-                    return cu
+            # NOTE if more than one loaded configuration has this name the first one loaded is returned - use the uri to be certain
+            results = self._find_loaded_configs( name_or_uri )
+            logger.debug( f"{results=} {name_or_uri=}" )
+            if len( results ) > 1:
+                logger.info( f"Config {name_or_uri} isn't unique - using the first one {results[0]}" )
+            if results:
+                return results[0]
         return None
 
     def load_configs(self):
-        # load configurations
+        # load configurations a level at a time - the configurations to load in each level are retrieved in parallel then processed
+        # in order, adding the streams/baselines/changesets they reference to the next level. Each uri is only retrieved once
+        visited = set()
         while self._confs_to_load:
-            confu = self._confs_to_load.pop()
-            if not confu:
-                # skip None in list
-                continue
-            logger.debug( f"Retrieving config {confu}" )
-            try:
-                configs_xml = self.execute_get_rdf_xml(confu, intent="Retrieve a configuration definition")
-            except:
-                logger.info( f"Config ERROR {thisconfu} !!!!!!!" )
-                continue
-            confmemberx = rdfxml.xml_find_elements(configs_xml, './/rdfs:member[@rdf:resource]')
-            if confmemberx:
-                #  a list of members
+            thislevel = [confu for confu in dict.fromkeys( self._confs_to_load ) if confu and confu not in visited]
+            self._confs_to_load = []
+            visited.update( thislevel )
+            logger.debug( f"Retrieving configs {thislevel}" )
+            configs_xmls = self._get_concurrently( lambda confu: self.execute_get_rdf_xml(confu, intent="Retrieve a configuration definition"), thislevel )
+            for confu,configs_xml in configs_xmls.items():
+                if isinstance( configs_xml, Exception ):
+                    logger.info( f"Config ERROR {confu} !!!!!!!" )
+                    continue
+                confmemberx = rdfxml.xml_find_elements(configs_xml, './/rdfs:member[@rdf:resource]')
+                if confmemberx:
+                    #  a list of members
+                    for confmember in confmemberx:
+                        thisconfu = confmember.get("{%s}resource" % rdfxml.RDF_DEFAULT_PREFIX["rdf"])
+                        self._confs_to_load.append(thisconfu)
+                # maybe it's got configuration(s)
+                confmemberx = rdfxml.xml_find_elements(configs_xml, './/oslc_config:Configuration') + rdfxml.xml_find_elements(configs_xml, './/oslc_config:Stream') + rdfxml.xml_find_elements(configs_xml, './/oslc_config:Baseline') + rdfxml.xml_find_elements(configs_xml, './/oslc_config:ChangeSet')
+
                 for confmember in confmemberx:
-                    thisconfu = confmember.get("{%s}resource" % rdfxml.RDF_DEFAULT_PREFIX["rdf"])
-                    self._confs_to_load.append(thisconfu)
-            # maybe it's got configuration(s)
-            confmemberx = rdfxml.xml_find_elements(configs_xml, './/oslc_config:Configuration') + rdfxml.xml_find_elements(configs_xml, './/oslc_config:Stream') + rdfxml.xml_find_elements(configs_xml, './/oslc_config:Baseline') + rdfxml.xml_find_elements(configs_xml, './/oslc_config:ChangeSet')
-
-            for confmember in confmemberx:
-                thisconfu = rdfxml.xmlrdf_get_resource_uri( confmember )
-                logger.debug( f"{thisconfu=}" )
-                conftitle = rdfxml.xmlrdf_get_resource_text(confmember, './/dcterms:title')
-                if rdfxml.xmlrdf_get_resource_uri( confmember,'.//rdf:type[@rdf:resource="http://open-services.net/ns/config#ChangeSet"]') is not None:
-                    conftype = "ChangeSet"
-                elif rdfxml.xmlrdf_get_resource_uri( confmember,'.//rdf:type[@rdf:resource="http://open-services.net/ns/config#Baseline"]') is not None:
-                    conftype = "Baseline"
-                elif rdfxml.xmlrdf_get_resource_uri( confmember,'.//rdf:type[@rdf:resource="http://open-services.net/ns/config#Stream"]') is not None:
-                    conftype = "Stream"
-                elif rdfxml.xmlrdf_get_resource_uri( confmember,'.//rdf:type[@rdf:resource="http://open-services.net/ns/config#Configuration"]') is not None:
-                    conftype = "Stream"
-                else:
-                    print( ET.tostring(confmember) )
-                    raise Exception( f"Unrecognized configuration type" )
-                created = rdfxml.xmlrdf_get_resource_uri(confmember, './/dcterms:created')
-                if thisconfu not in self._configurations:
-                    logger.debug( f"Adding {conftitle}" )
-                    self._configurations[thisconfu] = {
-                                                                                'name': conftitle
-                                                                                , 'conftype': conftype
-                                                                                ,'confXml': confmember
-                                                                                ,'created': created
-                                                                            }
-#                    self._configurations[thisconfu] = self._components[self.project_uri]['configurations'][thisconfu]
-                else:
-                    logger.debug( f"Skipping {thisconfu} because already defined" )
-                # add baselines and changesets
-                self._confs_to_load.append( rdfxml.xmlrdf_get_resource_uri(confmember, './oslc_config:streams') )
-                self._confs_to_load.append( rdfxml.xmlrdf_get_resource_uri(confmember, './oslc_config:baselines') )
-                self._confs_to_load.append( rdfxml.xmlrdf_get_resource_uri(confmember, './rm_config:changesets') )
+                    thisconfu = rdfxml.xmlrdf_get_resource_uri( confmember )
+                    logger.debug( f"{thisconfu=}" )
+                    conftitle = rdfxml.xmlrdf_get_resource_text(confmember, './/dcterms:title')
+                    if rdfxml.xmlrdf_get_resource_uri( confmember,'.//rdf:type[@rdf:resource="http://open-services.net/ns/config#ChangeSet"]') is not None:
+                        conftype = "ChangeSet"
+                    elif rdfxml.xmlrdf_get_resource_uri( confmember,'.//rdf:type[@rdf:resource="http://open-services.net/ns/config#Baseline"]') is not None:
+                        conftype = "Baseline"
+                    elif rdfxml.xmlrdf_get_resource_uri( confmember,'.//rdf:type[@rdf:resource="http://open-services.net/ns/config#Stream"]') is not None:
+                        conftype = "Stream"
+                    elif rdfxml.xmlrdf_get_resource_uri( confmember,'.//rdf:type[@rdf:resource="http://open-services.net/ns/config#Configuration"]') is not None:
+                        conftype = "Stream"
+                    else:
+                        print( ET.tostring(confmember) )
+                        raise Exception( f"Unrecognized configuration type" )
+                    created = rdfxml.xmlrdf_get_resource_uri(confmember, './/dcterms:created')
+                    if thisconfu not in self._configurations:
+                        logger.debug( f"Adding {conftitle}" )
+                        self._configurations[thisconfu] = {
+                                                                                    'name': conftitle
+                                                                                    , 'conftype': conftype
+                                                                                    ,'confXml': confmember
+                                                                                    ,'created': created
+                                                                                }
+                        self._configurations_changed()
+#                        self._configurations[thisconfu] = self._components[self.project_uri]['configurations'][thisconfu]
+                    else:
+                        logger.debug( f"Skipping {thisconfu} because already defined" )
+                    # add baselines and changesets
+                    self._confs_to_load.append( rdfxml.xmlrdf_get_resource_uri(confmember, './oslc_config:streams') )
+                    self._confs_to_load.append( rdfxml.xmlrdf_get_resource_uri(confmember, './oslc_config:baselines') )
+                    self._confs_to_load.append( rdfxml.xmlrdf_get_resource_uri(confmember, './rm_config:changesets') )
 
 
     def list_configs( self ):
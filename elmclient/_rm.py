@@ -3,8 +3,12 @@
 # SPDX-License-Identifier: MIT
 ##
 
+import concurrent.futures
 import datetime
+import hashlib
+import json
 import logging
+import os
 import re
 import sys
 import time
@@ -28,6 +32,20 @@ from . import utils
 from . import _newtypesystem
 from . import resource
 
+# the number of folder queries retrieved in parallel when loading folders
+FOLDER_LOAD_WORKERS = 8
+
+# increment this when the format of the saved folder index changes, so old indexes are ignored
+FOLDER_INDEX_VERSION = 1
+
+# identifier queries (see resolve_reqids) put no more than this many characters of (url-encoded) identifiers in each query, so the query url isn't too long for the server
+IDENTIFIER_QUERY_MAXLENGTH = 2000
+# the number of identifier queries run in parallel
+IDENTIFIER_QUERY_WORKERS = 4
+
+# increment this when the format of the saved module structures changes, so old ones are ignored
+MODULE_STRUCTURE_VERSION = 1
+
 # used for OSLC Query on types
 typeresources = {
     'http://jazz.net/ns/rm/dng/types#ArtifactType':        ('ArtifactType'       ,'OT'),
@@ -75,6 +93,15 @@ class RMLinkCodec( resource.Codec ):
 #        print( f"Encode {targetid=} {result_x=} {ET.tostring( result_x )=}" )
         return result_x
         
+    # the identifier of a link target never changes
+    memoise = True
+    def prefetch( self, uris ):
+        # retrieve the link targets in parallel
+        arts = self.projorcomp._get_concurrently( lambda linkurl: self.projorcomp.execute_get_rdf_xml( linkurl, cacheable=True ), [uri for uri in uris if self._memokey( uri ) not in self._memo] )
+        for linkurl,art_x in arts.items():
+            if not isinstance( art_x, Exception ):
+                self._memo[self._memokey( linkurl )] = rdfxml.xmlrdf_get_resource_text( art_x, './/dcterms:identifier')
+
     def decode( self, linkurl_x ):
         linkurl = rdfxml.xmlrdf_get_resource_uri( linkurl_x )
 #        print( f"Decode {linkurl=}" )
@@ -139,9 +166,13 @@ class EnumCodec( resource.Codec ):
         enumvalue_u = None
 #        print( f"{self=}" )
 #        for enum_u in self.enums[self.prop_u]:
-        for enum_u in self.projorcomp.enums:
-            if self.projorcomp.enums[enum_u]['name']==pythonvalue:
-                enumvalue_u = enum_u
+        if self.prop_u in self.projorcomp.properties:
+            enumvalue_u = self.projorcomp.get_enum_uri( pythonvalue, self.prop_u )
+        if enumvalue_u is None:
+            # not one of this property's enums - fall back to the name anywhere in the typesystem
+            for enum_u in self.projorcomp.enums:
+                if self.projorcomp.enums[enum_u]['name']==pythonvalue:
+                    enumvalue_u = enum_u
         if enumvalue_u is None:
             raise Exception( f"Enumeration vlue {pythonvalue} not found in typesystem!" )
         thetag=rdfxml.uri_to_tag( self.prop_u )
@@ -196,6 +227,24 @@ class _Folder(anytree.NodeMixin):
 
 #################################################################################################
 
+# a binding in a module structure (see RMProject.get_module_structure) - the root is the structure itself
+class _ModuleBinding(anytree.NodeMixin):
+    def __init__(self, uri=None, module=None, boundartifact=None, isheading=False, identifier=None, title=None, parent=None):
+        super().__init__()
+        self.uri = uri
+        self.module = module
+        self.boundartifact = boundartifact
+        self.isheading = isheading
+        self.identifier = identifier
+        self.title = title
+        self.section = None
+        self.parent = parent
+
+    def __repr__( self ):
+        return f"<Binding {self.section} {self.identifier} {self.title}>"
+
+#################################################################################################
+
 if False:
     @utils.mixinomatic
     class _RM_PA_stream( _config._Stream,_RMProject ):
@@ -224,11 +273,19 @@ class RMProject(_project._Project, resource.Resources_Mixin ):
         self._configurations = {} # keyed on the config name
         self._folders = None
         self._foldersnotyetloaded = None
+        self._folderqueries = {} # keyed by folder query uri, the etag and folders (uri, name, subfolder query uris) from the query - saved in the folder index
+        self.folder_index_folder = None # if set, the folders are saved to/restored from an index in this folder
+        self.folder_index_freshness = "etags"
         self.is_singlemode = False # this is only true if config enabled is true and single mode is true
         self.gcconfiguri = None
         self.default_query_resource = "oslc_rm:Requirement"
         self._iscomponent=False
         self._confs_to_load = []
+        self._changesets_to_load = [] # changeset lists, only loaded once all the streams and baselines have been loaded
+        self._reqids = {} # keyed by local config, of identifier -> {'core': uri, 'bindings': [uris]} (or None if not found) from resolve_reqids
+        self._reqiduris = {} # keyed by local config, of artifact uri -> identifier
+        self._modulestructures = {} # keyed by (local config, module uri), of the module structure tree from get_module_structure
+        self.module_structure_cache_folder = None # if set, module structures are saved to/restored from this folder
         self._confstoparent = []
         self.configTree = None
         # unmodifiable (system) properties
@@ -252,6 +309,14 @@ class RMProject(_project._Project, resource.Resources_Mixin ):
             'wrappedResourceRevision',
             
         ]
+    # as for _Project, plus make sure the copy doesn't continue the folder loading of the original config
+    def _copy_for_config(self, configuri):
+        result = super()._copy_for_config(configuri)
+        if result._folders is None:
+            result._foldersnotyetloaded = None
+        result._folderqueries = {}
+        return result
+
     # save a folder details, and return the new folder instance
     def _savefolder( self, parent, fname, folderuri ):
         ROOTNAME = "+-+root+-+"
@@ -340,49 +405,220 @@ class RMProject(_project._Project, resource.Resources_Mixin ):
                 return None
             logger.debug( f"Root folder query= {qcuri}" )
             self._foldersnotyetloaded=[qcuri] # this list becomes None once all folders are loaded - as folders are loaded, their subfolders are added here
+            self._folderqcuri = qcuri
+            if force:
+                self._folderqueries = {}
+            elif self.folder_index_folder:
+                # read the index - the indexed folder queries are used (checked if freshness is etags) as the search reaches them
+                self._read_folder_index()
 
         # load more folders until either the name_or_uri is matched or there aren't any more to load
-        while len(self._foldersnotyetloaded)>0:
+        # folders are loaded breadth-first a level at a time, retrieving the folder queries of each level in parallel
+        # if name_or_uri is a path then only the folders on that path are expanded - the others are left to be loaded if needed later
+        loaded = False
+        while len(self._foldersnotyetloaded)>0 and name_or_uri not in self._folders:
             logger.info( "-----------------------" )
-            # retrieve the next fodler query result
-            queryuri = self._foldersnotyetloaded.pop(0)
-            parent = self._folders.get(queryuri) # parent is None for the first query for the root folder
+            if name_or_uri.startswith( "/" ):
+                thislevel = [q for q in self._foldersnotyetloaded if self._is_on_folder_path( self._folders.get(q), name_or_uri )]
+                if not thislevel:
+                    # no more folders on the path to load - the path doesn't exist (yet)
+                    logger.info( f"No more folders to load on path {name_or_uri}" )
+                    break
+                inlevel = set(thislevel)
+                self._foldersnotyetloaded = [q for q in self._foldersnotyetloaded if q not in inlevel]
+            else:
+                thislevel = self._foldersnotyetloaded
+                self._foldersnotyetloaded = []
 
-            logger.info( f"Retrieving {queryuri=} parent {self._folders.get(queryuri)}" )
-            # get these with caching enabled
-            folderxml = self.execute_get_xml( queryuri, cacheable=True, intent="Retrieve folder definition" ).getroot()
-
-            # find the contained folders
-            folderels = rdfxml.xml_find_elements(folderxml,'.//rm_nav:folder')
-
-            # process the contained folders
-            for folderel in folderels:
-                # get this folder details - name, queryuri
-                fname = rdfxml.xmlrdf_get_resource_text(folderel,'.//dcterms:title')
-                folderuri = rdfxml.xmlrdf_get_resource_uri( folderel )
-                logger.info( f"{fname=} {folderuri=}" )
-
-                thisfolder = self._savefolder( parent, fname, folderuri )
-
-                # insert the subfolder query uris into the list still to be loaded
-                for subel in rdfxml.xml_find_elements(folderel,'.//rm_nav:subfolders'):
-                    # add the subfolder query queryuri onto the list of folders to retrieve
-                    subqueryuri = rdfxml.xmlrdf_get_resource_uri( subel )
-                    # add at start of folders to load so search goes deep first
-                    self._foldersnotyetloaded.insert( 0,subqueryuri )
-                    # for the queryuri, record the folder which is its parent
-                    self._folders[subqueryuri] = thisfolder
-
-            # now this response has been processed check if name_or_uri has been matched
-            if name_or_uri in self._folders:
-                if self._folders[name_or_uri] is None:
-                    logger.info( f"Retrieved {name_or_uri} as Ambiguous" )
-                    # ambiguous
-                    return None
-                logger.info( f"Retrieved {name_or_uri} as {self._folders[name_or_uri]}" )
-                return self._folders[name_or_uri]
+            loaded = self._load_folder_level( thislevel ) or loaded
+
+        if loaded:
+            self._save_folder_index()
+
+        if name_or_uri in self._folders:
+            if self._folders[name_or_uri] is None:
+                logger.info( f"Retrieved {name_or_uri} as Ambiguous" )
+                # ambiguous
+                return None
+            logger.info( f"Retrieved {name_or_uri} as {self._folders[name_or_uri]}" )
+            return self._folders[name_or_uri]
         return None
 
+    # True if the subfolders of parent (a _Folder, or None for the root folder query) could be on path
+    def _is_on_folder_path( self, parent, path ):
+        if parent is None or parent.pathname == "/":
+            return True
+        return path == parent.pathname or path.startswith( parent.pathname+"/" )
+
+    # retrieve folder queries in parallel, saving the folders as each response arrives and adding their subfolder queries to the
+    # folders still to load. If a retrieval fails the queries not processed are put back to be loaded later
+    def _load_folder_queries( self, queryuris, workers=None ):
+        workers = workers or FOLDER_LOAD_WORKERS
+        def retrieve( queryuri ):
+            logger.info( f"Retrieving {queryuri=}" )
+            # get these with caching enabled
+            response = self.execute_get_raw( queryuri, headers={'Accept': 'application/xml'}, cacheable=True, intent="Retrieve folder definition" )
+            return response.headers.get( 'ETag' ), self._parse_folder_query( ET.fromstring( response.content ) )
+        notprocessed = list( queryuris )
+        try:
+            with concurrent.futures.ThreadPoolExecutor( max_workers=min( workers, max( len( queryuris ), 1 ) ) ) as executor:
+                futures = { executor.submit( retrieve, queryuri ): queryuri for queryuri in queryuris }
+                for future in concurrent.futures.as_completed( futures ):
+                    queryuri = futures[future]
+                    etag,folders = future.result()
+                    self._folderqueries[queryuri] = { 'etag': etag, 'folders': folders }
+                    # parent is None for the first query for the root folder
+                    self._process_folder_query( self._folders.get(queryuri), folders )
+                    notprocessed.remove( queryuri )
+        finally:
+            if notprocessed:
+                self._foldersnotyetloaded = notprocessed + self._foldersnotyetloaded
+
+    # return the folders in a folder query response as a list of [folderuri, name, [subfolder query uris]]
+    def _parse_folder_query( self, folderxml ):
+        folders = []
+        # find the contained folders
+        folderels = rdfxml.xml_find_elements(folderxml,'.//rm_nav:folder')
+        for folderel in folderels:
+            # get this folder details - name, queryuri
+            fname = rdfxml.xmlrdf_get_resource_text(folderel,'.//dcterms:title')
+            folderuri = rdfxml.xmlrdf_get_resource_uri( folderel )
+            logger.info( f"{fname=} {folderuri=}" )
+            subqueryuris = [rdfxml.xmlrdf_get_resource_uri( subel ) for subel in rdfxml.xml_find_elements(folderel,'.//rm_nav:subfolders')]
+            folders.append( [folderuri, fname, subqueryuris] )
+        return folders
+
+    # save the folders from a folder query
+    def _process_folder_query( self, parent, folders ):
+        # process the contained folders
+        for folderuri, fname, subqueryuris in folders:
+            thisfolder = self._savefolder( parent, fname, folderuri )
+
+            # add the subfolder query uris to the list still to be loaded
+            for subqueryuri in subqueryuris:
+                # add at end of folders to load so search goes breadth first
+                self._foldersnotyetloaded.append( subqueryuri )
+                # for the queryuri, record the folder which is its parent
+                self._folders[subqueryuri] = thisfolder
+
+    # use an index of the folders saved in folder - a later find_folder in the same context (server/project/component/configuration)
+    # rebuilds the folders from the index instead of retrieving every folder query again, and only folders not in the index are retrieved
+    # freshness is how the indexed folders are checked:
+    #   "etags" - each folder query in the index is checked with a conditional GET (in parallel) and only changed ones are used from the response
+    #   "none" - not checked, use invalidate_folders() to make changed folders be retrieved again (or delete the index)
+    def enable_folder_index( self, folder, *, freshness="etags" ):
+        if freshness not in ["etags","none"]:
+            raise Exception( f"Folder index freshness must be one of etags or none not '{freshness}'" )
+        self.folder_index_folder = folder
+        self.folder_index_freshness = freshness
+
+    # forget the indexed subfolders of a folder and all its descendants so they are retrieved again when next needed, e.g. when
+    # a TRS feed or a changeset delivery shows they've changed. With no name_or_path_or_uri the whole index is forgotten
+    def invalidate_folders( self, name_or_path_or_uri=None ):
+        if name_or_path_or_uri is None:
+            self._folderqueries = {}
+        else:
+            folder = self._load_folders( name_or_path_or_uri )
+            if folder is None:
+                return
+            invalid = set( id(f) for f in ( folder, ) + folder.descendants )
+            # the subfolder query uris are keys in _folders for their parent folder
+            for queryuri,parent in list( self._folders.items() ):
+                if parent is not None and id(parent) in invalid and queryuri in self._folderqueries:
+                    del self._folderqueries[queryuri]
+        self._save_folder_index()
+        self._folders = None
+        self._foldersnotyetloaded = None
+
+    def _folder_index_filename( self ):
+        keyhash = hashlib.sha256( repr( self._typesystem_snapshot_key() ).encode() ).hexdigest()[:32]
+        return os.path.join( self.folder_index_folder, f"folders_{keyhash}.json" )
+
+    # save the index (written to a temporary file then renamed so a reader never sees a partial file)
+    # only the queries for the currently known folders are saved
+    def _save_folder_index( self ):
+        if not self.folder_index_folder or self._folders is None:
+            return
+        queries = { q: v for q,v in self._folderqueries.items() if q == self._folderqcuri or q in self._folders }
+        index = { 'version': FOLDER_INDEX_VERSION, 'key': list( self._typesystem_snapshot_key() ), 'qcuri': self._folderqcuri, 'queries': queries }
+        filename = self._folder_index_filename()
+        os.makedirs( self.folder_index_folder, exist_ok=True )
+        tmpfilename = f"{filename}.{os.getpid()}.tmp"
+        with open( tmpfilename, "w" ) as f:
+            json.dump( index, f )
+        os.replace( tmpfilename, filename )
+        logger.info( f"Saved folder index {filename} {len(queries)} folder queries" )
+
+    # read the folder queries from the index (if they aren't already known)
+    def _read_folder_index( self ):
+        if self._folderqueries:
+            return
+        filename = self._folder_index_filename()
+        if not os.path.isfile( filename ):
+            return
+        try:
+            with open( filename, "r" ) as f:
+                index = json.load( f )
+        except Exception as e:
+            logger.info( f"Folder index {filename} not readable {e}" )
+            return
+        if index.get( 'version' ) != FOLDER_INDEX_VERSION or index.get( 'key' ) != list( self._typesystem_snapshot_key() ) or index.get( 'qcuri' ) != self._folderqcuri:
+            logger.info( f"Folder index {filename} is for a different version/context" )
+            return
+        self._folderqueries = index['queries']
+        logger.info( f"Read folder index {filename} {len(self._folderqueries)} folder queries" )
+
+    # load one level of folder queries - the ones in the index are checked (if freshness is etags) and used from the index, the
+    # others (and any which couldn't be checked) are retrieved. Returns True if the index has changed
+    def _load_folder_level( self, queryuris ):
+        indexed = [q for q in queryuris if q in self._folderqueries]
+        changed = False
+        if indexed and self.folder_index_freshness == "etags":
+            changed = self._revalidate_folder_queries( indexed )
+        toretrieve = []
+        for queryuri in queryuris:
+            if queryuri in self._folderqueries and queryuri in indexed:
+                self._process_folder_query( self._folders.get(queryuri), self._folderqueries[queryuri]['folders'] )
+            else:
+                toretrieve.append( queryuri )
+        if toretrieve:
+            self._load_folder_queries( toretrieve )
+            changed = True
+        return changed
+
+    # check indexed folder queries in parallel using conditional GETs - changed ones are updated in the index, ones which can't be
+    # checked are removed from the index. Returns True if any changed
+    def _revalidate_folder_queries( self, queryuris, workers=None ):
+        workers = workers or FOLDER_LOAD_WORKERS
+        def check( queryuri ):
+            headers = {'Accept': 'application/xml'}
+            etag = self._folderqueries[queryuri].get( 'etag' )
+            if etag:
+                headers['If-None-Match'] = etag
+            try:
+                response = self.execute_get_raw( queryuri, headers=headers, cacheable=False, no_error_log=True, intent="Check if folder has changed" )
+            except requests.HTTPError as e:
+                logger.info( f"Folder query {queryuri} check failed {e}" )
+                return None
+            if response.status_code == 304:
+                return False
+            return { 'etag': response.headers.get( 'ETag' ), 'folders': self._parse_folder_query( ET.fromstring( response.content ) ) }
+        changed = False
+        with concurrent.futures.ThreadPoolExecutor( max_workers=min( workers, max( len( queryuris ), 1 ) ) ) as executor:
+            futures = { executor.submit( check, queryuri ): queryuri for queryuri in queryuris }
+            for future in concurrent.futures.as_completed( futures ):
+                queryuri = futures[future]
+                result = future.result()
+                if result is None:
+                    del self._folderqueries[queryuri]
+                    changed = True
+                elif result:
+                    if result['folders'] != self._folderqueries[queryuri]['folders']:
+                        logger.info( f"Folder query {queryuri} has changed" )
+                    self._folderqueries[queryuri] = result
+                    changed = True
+        return changed
+
     def find_folder( self, name_or_path_or_uri, force=False ):
         return self._load_folders( name_or_path_or_uri, force=force )
 
@@ -439,6 +675,10 @@ xmlns:calm="http://jazz.net/xmlns/prod/jazz/calm/1.0/"
 
                 # insert the new folder into the known folders
                 newfolder = self._savefolder( parent, pathels[n], thefolder_u )
+                # the indexed subfolders of the parent are now out of date so they'll be retrieved again if the index is used
+                for queryuri in [q for q,f in self._folders.items() if f is parent and q in self._folderqueries]:
+                    del self._folderqueries[queryuri]
+                self._save_folder_index()
                 parent = newfolder
             else:
                 logger.info( f"Path exists {thispath=}" )
@@ -466,6 +706,7 @@ xmlns:calm="http://jazz.net/xmlns/prod/jazz/calm/1.0/"
         logger.info( f"load_components_and_configurations {self=} {self.is_optin=}" )
         self._components = {}
         self._configurations = {}
+        self._configurations_changed()
         ncomps = 0
         nconfs = 0
         # retrieve components and configurations for this project
@@ -495,14 +736,18 @@ xmlns:calm="http://jazz.net/xmlns/prod/jazz/calm/1.0/"
                 else:
                     confs = [ids['@id']]
                 logger.debug( "{confs=}" )
-            for confu in confs:
+            # retrieve the configuration definitions in parallel
+            confxs = self._get_concurrently( lambda confu: self.execute_get_xml(confu, intent="Retrieve a configuration definition", cacheable=cacheable), confs )
+            for confu,confx in confxs.items():
 #                confu = aconf['value']
-                confx = self.execute_get_xml(confu, intent="Retrieve a configuration definition", cacheable=cacheable)
+                if isinstance( confx, Exception ):
+                    raise confx
                 conftitle = rdfxml.xmlrdf_get_resource_text(confx,'.//dcterms:title')
                 conftype = 'Stream' if 'stream' in confu else 'Baseline'
                 created = rdfxml.xmlrdf_get_resource_uri(confx, './/dcterms:created')
                 self._components[defaultcompu]['configurations'][confu] = {'name': conftitle, 'conftype': conftype, 'confXml': confx, 'created': created}
                 self._configurations[defaultcompu] = self._components[defaultcompu]['configurations'][confu]
+                self._configurations_changed()
                 nconfs += 1
         elif self.singlemode:
             #get the single component from a QueryCapability
@@ -523,11 +768,11 @@ xmlns:calm="http://jazz.net/xmlns/prod/jazz/calm/1.0/"
             ncomps += 1
             self._components[compuri] = {'name': self.name, 'configurations': {}, 'confs_to_load': []}
             configs = self.execute_get_xml(compuri+"/configurations", intent="Retrieve project/component's list of all configurations", cacheable=cacheable)
-            for conf in rdfxml.xml_find_elements(configs,'.//rdfs:member'):
-                confu = rdfxml.xmlrdf_get_resource_uri(conf)
-                try:
-                    thisconfx = self.execute_get_xml(confu, intent="Retrieve a configuration definition", cacheable=cacheable)
-                except:
+            # retrieve the configuration definitions in parallel
+            confus = [rdfxml.xmlrdf_get_resource_uri(conf) for conf in rdfxml.xml_find_elements(configs,'.//rdfs:member')]
+            thisconfxs = self._get_concurrently( lambda confu: self.execute_get_xml(confu, intent="Retrieve a configuration definition", cacheable=cacheable), confus )
+            for confu,thisconfx in thisconfxs.items():
+                if isinstance( thisconfx, Exception ):
                     logger.info( f"Singlemode config ERROR probably archived {confu} !!!!!!!" )
                     continue
                 conftitle= rdfxml.xmlrdf_get_resource_text(thisconfx,'.//dcterms:title')
@@ -540,8 +785,10 @@ xmlns:calm="http://jazz.net/xmlns/prod/jazz/calm/1.0/"
                     conftype = "Stream"
                 self._components[compuri]['configurations'][confu] = {'name': conftitle, 'conftype': conftype, 'confXml': thisconfx, 'created':created}
                 self._configurations[confu] = self._components[compuri]['configurations'][confu]
+                self._configurations_changed()
                 nconfs += 1
             self._configurations = self._components[compuri]['configurations']
+            self._configurations_changed()
         else: # optin but could be single component
             cmsp_xml = self.app.retrieve_cm_service_provider_xml()
             components_uri = rdfxml.xmlrdf_get_resource_uri(cmsp_xml, './/oslc:ServiceProvider')
@@ -577,6 +824,7 @@ xmlns:calm="http://jazz.net/xmlns/prod/jazz/calm/1.0/"
                     created = rdfxml.xmlrdf_get_resource_uri(confx, './/dcterms:created')
                     self._components[defaultcompu]['configurations'][confu] = {'name': conftitle, 'conftype': conftype, 'confXml': confx, 'created': created}
                     self._configurations[defaultcompu] = self._components[defaultcompu]['configurations'][confu]
+                    self._configurations_changed()
                     nconfs += 1
                     raise Exception( "Something odd in an old 6.0.3-style project" )
             else:
@@ -584,9 +832,12 @@ xmlns:calm="http://jazz.net/xmlns/prod/jazz/calm/1.0/"
                 cru = rdfxml.xmlrdf_get_resource_uri(projcx, 'oslc:creation')
                 crx = self.execute_get_rdf_xml(cru, intent="Retrieve project's oslc:creation RDF", cacheable=cacheable)
 
-                for component_el in rdfxml.xml_find_elements(crx, './/ldp:contains'):
-                    compu = component_el.get("{%s}resource" % rdfxml.RDF_DEFAULT_PREFIX["rdf"])
-                    compx = self.execute_get_rdf_xml(compu, intent="Retrieve component definition to find all configurations", action="Retrieve each configuration", cacheable=cacheable)
+                # retrieve the component definitions in parallel - their configurations are loaded by load_configs()
+                compus = [component_el.get("{%s}resource" % rdfxml.RDF_DEFAULT_PREFIX["rdf"]) for component_el in rdfxml.xml_find_elements(crx, './/ldp:contains')]
+                compxs = self._get_concurrently( lambda compu: self.execute_get_rdf_xml(compu, intent="Retrieve component definition to find all configurations", action="Retrieve each configuration", cacheable=cacheable), compus )
+                for compu,compx in compxs.items():
+                    if isinstance( compx, Exception ):
+                        raise compx
                     comptitle = rdfxml.xmlrdf_get_resource_text(compx, './/dcterms:title')
                     confu = rdfxml.xmlrdf_get_resource_uri(compx, './/oslc_config:configurations')
                     self._components[compu] = {'name': comptitle, 'configurations': {}, 'confs_to_load': [confu]}
@@ -640,6 +891,7 @@ xmlns:calm="http://jazz.net/xmlns/prod/jazz/calm/1.0/"
                                                                                                 ,'created': created
                                                                                             }
                                     self._configurations[thisconfu] = self._components[compu]['configurations'][thisconfu]
+                                    self._configurations_changed()
                                 else:
                                     logger.debug( f"Skipping {thisconfu} because already defined" )
                                 # add baselines and changesets
@@ -687,135 +939,129 @@ xmlns:calm="http://jazz.net/xmlns/prod/jazz/calm/1.0/"
             self.configTree = anytree.AnyNode(name='theroot',title='root', created=None, typesystem=None, ismutable=False, ischangeset=False )
         result = False
         
-        # now load configs
-        while True:
-            if verbose:
-                print( ".",end="" )
+        # now load configs a level at a time - the configurations to load in each level are retrieved in parallel then processed
+        # in order, adding the streams/baselines/changesets they reference to the next level. Each uri is only retrieved once
+        visited = set()
+        while not result:
+            if not self._confs_to_load and load_changesets and self._changesets_to_load:
+                # all the streams and baselines have been loaded so now load the changesets
+                self._confs_to_load, self._changesets_to_load = self._changesets_to_load, []
             if not self._confs_to_load:
                 break
-            confu = self._confs_to_load.pop()
-            if not confu:
-                # skip None in list
-                continue
-
-#            print( f"Retrieving config {confu}" )
-            logger.debug( f"Retrieving config {confu}" )
-            try:
-                configs_xml = self.execute_get_rdf_xml(confu, intent="Retrieve a configuration definition", cacheable=cacheable)
-            except:
-                logger.info( f"Config ERROR {thisconfu} ignored (the config was probably archived) !!!!!!!" )
-                continue
-
-            confmemberx = rdfxml.xml_find_elements(configs_xml, './/rdfs:member[@rdf:resource]')
-            if confmemberx:
-                #  a list of members
-                for confmember in confmemberx:
-                    thisconfu = confmember.get("{%s}resource" % rdfxml.RDF_DEFAULT_PREFIX["rdf"])
-                    self._confs_to_load.append(thisconfu)
-#                    print( f"   Adding {thisconfu=}" )
-#                    print( f"   Now {self._confs_to_load=}" )
-
-            # maybe it's got configuration(s)
-            confmembers_x = list( set( rdfxml.xml_find_elements(configs_xml, './/oslc_config:Configuration') + rdfxml.xml_find_elements(configs_xml, './/oslc_config:Stream') + rdfxml.xml_find_elements(configs_xml, './/oslc_config:Baseline') + rdfxml.xml_find_elements(configs_xml, './/oslc_config:ChangeSet') ) )
-
-            for confmember_x in confmembers_x:
+            thislevel = [confu for confu in dict.fromkeys( self._confs_to_load ) if confu and confu not in visited]
+            self._confs_to_load = []
+            visited.update( thislevel )
+            logger.debug( f"Retrieving configs {thislevel}" )
+            configs_xmls = self._get_concurrently( lambda confu: self.execute_get_rdf_xml(confu, intent="Retrieve a configuration definition", cacheable=cacheable), thislevel )
+            for confu,configs_xml in configs_xmls.items():
                 if verbose:
-                    print( ">",end="",flush=True )
-                logger.info( f"========================\n{confmember_x=}" )
-                logger.info( f"tree= {anytree.RenderTree(self.configTree, style=anytree.AsciiStyle())}" )
+                    print( ".",end="" )
+                if isinstance( configs_xml, Exception ):
+                    logger.info( f"Config ERROR {confu} ignored (the config was probably archived) !!!!!!!" )
+                    continue
+
+                confmemberx = rdfxml.xml_find_elements(configs_xml, './/rdfs:member[@rdf:resource]')
+                if confmemberx:
+                    #  a list of members
+                    for confmember in confmemberx:
+                        thisconfu = confmember.get("{%s}resource" % rdfxml.RDF_DEFAULT_PREFIX["rdf"])
+                        self._confs_to_load.append(thisconfu)
+
+                # maybe it's got configuration(s)
+                confmembers_x = list( dict.fromkeys( rdfxml.xml_find_elements(configs_xml, './/oslc_config:Configuration') + rdfxml.xml_find_elements(configs_xml, './/oslc_config:Stream') + rdfxml.xml_find_elements(configs_xml, './/oslc_config:Baseline') + rdfxml.xml_find_elements(configs_xml, './/oslc_config:ChangeSet') ) )
+
+                for confmember_x in confmembers_x:
+                    if verbose:
+                        print( ">",end="",flush=True )
+                    logger.info( f"========================\n{confmember_x=}" )
+                    logger.info( f"tree= {anytree.RenderTree(self.configTree, style=anytree.AsciiStyle())}" )
 #                print( f"{confmember_x.tag=}" )
 #                print( "XML=",ET.tostring( confmember_x ) )
-                thisconfu = rdfxml.xmlrdf_get_resource_uri( confmember_x )
-                logger.info( f"Member {thisconfu=}" )
-                # add baselines and changesets
-                self._confs_to_load=list(set(self._confs_to_load))
-#                print( f"1 {len(self._confs_to_load)} {self._confs_to_load=}" )
-                self._confs_to_load.append( rdfxml.xmlrdf_get_resource_uri(confmember_x, './oslc_config:streams') )
-                self._confs_to_load.append( rdfxml.xmlrdf_get_resource_uri(confmember_x, './oslc_config:baselines') )
-                if load_changesets:
-                    self._confs_to_load.append( rdfxml.xmlrdf_get_resource_uri(confmember_x, './rm_config:changesets') )
-                self._confs_to_load=list(set(self._confs_to_load))
-#                print( f"2 {len(self._confs_to_load)} {self._confs_to_load=}" )
-                logger.debug( f"{thisconfu=}" )
-                ismutable = False
-                ischangeset = False
-                conftitle = rdfxml.xmlrdf_get_resource_text(confmember_x, './dcterms:title')
+                    thisconfu = rdfxml.xmlrdf_get_resource_uri( confmember_x )
+                    logger.info( f"Member {thisconfu=}" )
+                    # add baselines and changesets
+                    self._confs_to_load.append( rdfxml.xmlrdf_get_resource_uri(confmember_x, './oslc_config:streams') )
+                    self._confs_to_load.append( rdfxml.xmlrdf_get_resource_uri(confmember_x, './oslc_config:baselines') )
+                    # there may be very many changesets so they're deferred until all streams and baselines are loaded
+                    self._changesets_to_load.append( rdfxml.xmlrdf_get_resource_uri(confmember_x, './rm_config:changesets') )
+                    logger.debug( f"{thisconfu=}" )
+                    ismutable = False
+                    ischangeset = False
+                    conftitle = rdfxml.xmlrdf_get_resource_text(confmember_x, './dcterms:title')
                 
-                if stopatnameoruri and ( conftitle==stopatnameoruri or thisconfu==stopatnameoruri ):
-                    result = True
+                    if stopatnameoruri and ( conftitle==stopatnameoruri or thisconfu==stopatnameoruri ):
+                        result = True
                     
-                created = rdfxml.xmlrdf_get_resource_uri(confmember_x, './dcterms:created', exceptionifnotfound=True)
+                    created = rdfxml.xmlrdf_get_resource_uri(confmember_x, './dcterms:created', exceptionifnotfound=True)
 #                print( f"{conftitle=}" )
 #                print( f"{created=}" )
-                if confmember_x.tag == '{http://open-services.net/ns/config#}ChangeSet':
-                    conftype = "ChangeSet"
-                    ischangeset=True
-                    ismutable=True
-                elif confmember_x.tag == '{http://open-services.net/ns/config#}Baseline':
-                    conftype = "Baseline"
-                elif confmember_x.tag == '{http://open-services.net/ns/config#}Stream' or rdfxml.xmlrdf_get_resource_uri( confmember_x,'.//rdf:type[@rdf:resource="http://open-services.net/ns/config#Stream"]') is not None:
-                    conftype = "Stream"
-                    ismutable=True
-                else:
-#                    print( f"{confmember_x.tag=}" )
-#                    print( ET.tostring(confmember_x) )
-                    if '/baseline/' in thisconfu:
+                    if confmember_x.tag == '{http://open-services.net/ns/config#}ChangeSet':
+                        conftype = "ChangeSet"
+                        ischangeset=True
+                        ismutable=True
+                    elif confmember_x.tag == '{http://open-services.net/ns/config#}Baseline':
                         conftype = "Baseline"
+                    elif confmember_x.tag == '{http://open-services.net/ns/config#}Stream' or rdfxml.xmlrdf_get_resource_uri( confmember_x,'.//rdf:type[@rdf:resource="http://open-services.net/ns/config#Stream"]') is not None:
+                        conftype = "Stream"
+                        ismutable=True
                     else:
-                        raise Exception( f"Unrecognized configuration type {confmember_x.tag}" )
+#                    print( f"{confmember_x.tag=}" )
+#                    print( ET.tostring(confmember_x) )
+                        if '/baseline/' in thisconfu:
+                            conftype = "Baseline"
+                        else:
+                            raise Exception( f"Unrecognized configuration type {confmember_x.tag}" )
 
-                # use wasDerivedfrom to find the source or eaither a stream or baseline - there isn't one for the Initial Stream!
-                theparent_u = rdfxml.xmlrdf_get_resource_uri( confmember_x,'./prov:wasDerivedFrom')
+                    # use wasDerivedfrom to find the source or eaither a stream or baseline - there isn't one for the Initial Stream!
+                    theparent_u = rdfxml.xmlrdf_get_resource_uri( confmember_x,'./prov:wasDerivedFrom')
 #                print( f"{theparent_u=}" )
 
-                if thisconfu in self._configurations:
-                    logger.debug( f"Skipping {thisconfu} because already defined" )
+                    if thisconfu in self._configurations:
+                        logger.debug( f"Skipping {thisconfu} because already defined" )
 #                    print( f"Skipping {thisconfu} because already defined" )
-                else:
-                    logger.debug( f"Adding {conftitle}" )
+                    else:
+                        logger.debug( f"Adding {conftitle}" )
 #                    print( f"Adding {conftitle} {theparent_u=}" )
 
-                    self._configurations[thisconfu] = {
-                                                        'name': conftitle
-                                                        ,'conftype': conftype
-                                                        ,'confXml': confmember_x
-                                                        ,'created': created
-                                                        ,'parentConfig': theparent_u
-                                                    }
+                        self._configurations[thisconfu] = {
+                                                            'name': conftitle
+                                                            ,'conftype': conftype
+                                                            ,'confXml': confmember_x
+                                                            ,'created': created
+                                                            ,'parentConfig': theparent_u
+                                                        }
+                        self._configurations_changed()
 #                    self._configurations[thisconfu] = self._components[self.project_uri]['configurations'][thisconfu]
-                # use wasDerivedfrom to find the source or eaither a stream or baseline - there isn't one for the Initial Stream!
+                    # use wasDerivedfrom to find the source or eaither a stream or baseline - there isn't one for the Initial Stream!
 #                theparent_u = rdfxml.xmlrdf_get_resource_uri( confmember_x,'./prov:wasDerivedFrom')
 #                print( f"{theparent_u=}" )
-                if not theparent_u:
-                    # this is the initial stream
-                    parentnode = self.configTree
-                    logger.info( f"Config {conftitle} used theroot {parentnode=}" )
-                else:
-                    parentnode = anytree.search.find( self.configTree, filter_=lambda n: n.name==theparent_u )
-                    logger.info( f"Config {conftitle} found {parentnode=}" )
-
-                # try to find this config url to see if it's already known
-                if anytree.search.find( self.configTree, filter_=lambda n: n.name==thisconfu ):
-                    # already in the tree!
-                    logger.info( f"Config {conftitle} Config has parent in configtree {thisconfu} parent={parentnode}" )
-                    pass
-                else:
-                    logger.info( f"Not already in tree {thisconfu=}" )
-                    # need to find the parent to attach to
-                    # create the node - if we don't attach it now we'll attach it later - typesystem is set to None so if needed this can be filled in later.
-                    thisnode = anytree.AnyNode( None, name=thisconfu, title=conftitle, conftype=conftype, created=created, typesystem=_newtypesystem.TypeSystem(conftitle, thisconfu), ismutable=ismutable ) #TypeSystem(conftitle, thisconfu), ismutable=ismutable, ischangeset=ischangeset )
-                    logger.info( f"New node {id(thisnode)=} {thisnode=}" )
-                    if parentnode is None:
-                        # do this one later
-                        self._confstoparent.append( ( thisnode, theparent_u ) )
-                        logger.info( f"\nSaved for later {id(thisnode)=} {self._confstoparent[-1]=}" )
+                    if not theparent_u:
+                        # this is the initial stream
+                        parentnode = self.configTree
+                        logger.info( f"Config {conftitle} used theroot {parentnode=}" )
                     else:
-                        # parent is known so attach to it
-                        thisnode.parent = parentnode
-                        logger.info( f"\nConfig {conftitle} Added config {thisconfu} {id(parentnode)=} parent={parentnode}" )
-            # now check if stopatnameoururi is present and if so set result True
-            if result:
-                break
+                        parentnode = anytree.search.find( self.configTree, filter_=lambda n: n.name==theparent_u )
+                        logger.info( f"Config {conftitle} found {parentnode=}" )
+
+                    # try to find this config url to see if it's already known
+                    if anytree.search.find( self.configTree, filter_=lambda n: n.name==thisconfu ):
+                        # already in the tree!
+                        logger.info( f"Config {conftitle} Config has parent in configtree {thisconfu} parent={parentnode}" )
+                        pass
+                    else:
+                        logger.info( f"Not already in tree {thisconfu=}" )
+                        # need to find the parent to attach to
+                        # create the node - if we don't attach it now we'll attach it later - typesystem is set to None so if needed this can be filled in later.
+                        thisnode = anytree.AnyNode( None, name=thisconfu, title=conftitle, conftype=conftype, created=created, typesystem=_newtypesystem.TypeSystem(conftitle, thisconfu), ismutable=ismutable ) #TypeSystem(conftitle, thisconfu), ismutable=ismutable, ischangeset=ischangeset )
+                        logger.info( f"New node {id(thisnode)=} {thisnode=}" )
+                        if parentnode is None:
+                            # do this one later
+                            self._confstoparent.append( ( thisnode, theparent_u ) )
+                            logger.info( f"\nSaved for later {id(thisnode)=} {self._confstoparent[-1]=}" )
+                        else:
+                            # parent is known so attach to it
+                            thisnode.parent = parentnode
+                            logger.info( f"\nConfig {conftitle} Added config {thisconfu} {id(parentnode)=} parent={parentnode}" )
 
         # now iterate over the unparented nodes repeatedly finding their parents until there are none left because all have been parented
         while self._confstoparent:
@@ -878,7 +1124,11 @@ xmlns:calm="http://jazz.net/xmlns/prod/jazz/calm/1.0/"
             
         return result
 
-    def load_configtree( self, *, fromconfig_u=None, loadbaselines=False, followsubstreams=False, loadchangesets=False, alwayscaching=False ):
+    # load the typesystem (artifact types, attribute definitions, attribute types and link types) of each configuration in the config tree
+    # the definitions are retrieved concurrently (workers at a time) into cache, a _newtypesystem.TypeDefinitionCache shared by all
+    # the configurations so a definition which is unchanged in another configuration isn't retrieved again - returns the cache
+    def load_configtree( self, *, fromconfig_u=None, loadbaselines=False, followsubstreams=False, loadchangesets=False, alwayscaching=False, cache=None, workers=None ):
+        cache = cache or _newtypesystem.TypeDefinitionCache()
         # show the config tree
 #        print( f"tree= {anytree.RenderTree(self.configTree, style=anytree.AsciiStyle())}" )
 #        print( f"{self.configTree=}" )
@@ -909,6 +1159,8 @@ xmlns:calm="http://jazz.net/xmlns/prod/jazz/calm/1.0/"
             # GET the typesystem - caching is determinded by ismutable
     #typeresources = {
     #    'http://jazz.net/ns/rm/dng/types#ArtifactType':        ('ArtifactType'       ,'OT'),        
+            todo = []
+            modifieds = {}
             for resourcetype,typedetails in typeresources.items():
                 # QUERY to get the types
     #            print( f"Getting {typedetails[0]} {typedetails[1]=}" )
@@ -921,19 +1173,16 @@ xmlns:calm="http://jazz.net/xmlns/prod/jazz/calm/1.0/"
                         # ignore non-local references
 #                        print( f"Ignoring non-local {typedetails[1]} {k}" )
                         continue
-                    if typedetails[1]=='OT':
-                        # find the attributes and record them
-                        conf.typesystem.load_ot( self, k, iscacheable=alwayscaching or not conf.ismutable, isused=True )
-                    elif typedetails[1]=='AD':
-                        conf.typesystem.load_ad( self, k, iscacheable=alwayscaching or not conf.ismutable, isused=False )
-                    elif typedetails[1]=='AT':
-#                        print( f"Loading AT {k=}" )
-                        conf.typesystem.load_at( self, k, iscacheable=alwayscaching or not conf.ismutable, isused=False )
-                    elif typedetails[1]=='LT':
-#                        print( f"Loading LT {k=}" )
-                        conf.typesystem.load_lt( self, k, iscacheable=alwayscaching or not conf.ismutable, isused=False )
-                    else:
+                    if typedetails[1] not in ('OT','AD','AT','LT'):
                         raise Exception( f"Unknown type {typedetails[1]}" )
+                    # only the artifact types are used - attribute definitions/types are used if an artifact type uses them
+                    todo.append( ( typedetails[1], k, typedetails[1]=='OT' ) )
+                    # the modified time lets the cache reuse an unchanged definition already retrieved in another configuration
+                    if isinstance( v.get( 'dcterms:modified' ), str ):
+                        modifieds[k] = v['dcterms:modified']
+            # load all the types for this config - the cache is shared across the configs
+            conf.typesystem.load_types( self, todo, iscacheable=alwayscaching or not conf.ismutable, modifieds=modifieds, cache=cache, workers=workers )
+        return cache
 
 
     def get_local_config(self, name_or_uri, global_config_uri=None, verbose=False ):
@@ -964,18 +1213,22 @@ xmlns:calm="http://jazz.net/xmlns/prod/jazz/calm/1.0/"
                 filter="ChangeSet"
                 name_or_uri = name_or_uri[2:]
 
+            # look in the configs loaded so far, and if not found load more configs (streams and baselines before changesets)
+            # stopping as soon as the config is found - for a stream or baseline the changesets aren't loaded at all
+            # (the configuration query capability isn't used to find a name because servers differ in what it supports)
+            # NOTE a name is only accepted once the whole level of configurations it was found in has been loaded, and is checked
+            # for uniqueness against all the configurations loaded so far - so e.g. two streams with the same name are reported
+            # but a baseline or changeset further down the tree which has the same name as the stream found isn't - prefix the name
+            # with S:/B:/C: or use the uri to be certain of getting the one you want
             while result is None:
-                for cu, cd in self._configurations.items():
-    #                print( f"{cu=} {cd=}" )
-                    if filter and cd['conftype'] != filter:
-                        continue
-                    if cu == name_or_uri or cd['name'] == name_or_uri:
-                        if result:
-                            raise Exception( f"Config {name_or_uri} isn't unique - you could try prefixing it with S: for stream, B: for baseline, or C: for changeset")
-                        result = cu
-                if result is None:
+                results = self._find_loaded_configs( name_or_uri, filter )
+                if len( results ) > 1:
+                    raise Exception( f"Config {name_or_uri} isn't unique - you could try prefixing it with S: for stream, B: for baseline, or C: for changeset")
+                if results:
+                    result = results[0]
+                else:
 #                    if not self.load_configs( stopatnameoruri=name_or_uri, verbose=verbose, incremental=incremental ):
-                    if not self.load_configs( stopatnameoruri=name_or_uri, verbose=verbose, incremental=True ):
+                    if not self.load_configs( stopatnameoruri=name_or_uri, verbose=verbose, incremental=True, load_changesets=filter not in ( "Stream", "Baseline" ) ):
                         # config not found - give up (if found, this loops back to scan for the config again
                         break
 #        print( f"GLC {result} {self=} {name_or_uri=}" )
@@ -1007,6 +1260,14 @@ xmlns:calm="http://jazz.net/xmlns/prod/jazz/calm/1.0/"
             sx = self.get_services_xml(force=True)
         if sx:
             shapes_to_load = rdfxml.xml_find_elements(sx, './/oslc:resourceShape' )
+
+            # the definitions are retrieved in parallel in two waves into the type cache: first the shapes, then the
+            # linktype and range (enumeration) definitions they reference. Then the shapes are registered one by one in
+            # services.xml order, exactly as if loaded sequentially, but without waiting for any GETs
+            shape_uris = [rdfxml.xmlrdf_get_resource_uri( el ) for el in shapes_to_load]
+            self._prefetch_typeuris( [u for u in shape_uris if u], verbose=verbose, desc="Retrieving DN shapes" )
+            self._prefetch_typeuris( self._referenced_type_uris( shape_uris ), verbose=verbose, desc="Retrieving DN types" )
+
             if verbose:
                 pbar = tqdm.tqdm(initial=0, total=len(shapes_to_load),smoothing=1,unit=" results",desc="Loading DN shapes")
 
@@ -1024,6 +1285,26 @@ xmlns:calm="http://jazz.net/xmlns/prod/jazz/calm/1.0/"
 
         return None
 
+    # find the uris which _load_type_from_resource_shape will need to retrieve for these (already retrieved) shapes:
+    # the local link type definitions and local ranges (which hold enumeration values)
+    def _referenced_type_uris(self, shape_uris):
+        results = []
+        for uri in shape_uris:
+            if not uri:
+                continue
+            shapedef = self._gettypecache.get( uri.rsplit( '#',1 )[0] )
+            if shapedef is None:
+                continue
+            for el in rdfxml.xml_find_elements(shapedef, './/oslc:Property/dcterms:title/..') + rdfxml.xml_find_elements(shapedef, './/oslc:Property/oslc:name/..'):
+                propuri = rdfxml.xmlrdf_get_resource_uri( el, 'oslc:propertyDefinition')
+                if propuri is not None and propuri.startswith( self.reluri() ) and rdfxml.xml_find_element( el, "oslc:representation[@rdf:resource='http://open-services.net/ns/core#Reference']") is not None and ( rdfxml.xml_find_element( el, "oslc:range[@rdf:resource='http://open-services.net/ns/core#Resource']" ) is not None or rdfxml.xml_find_element( el, "oslc:valueType[@rdf:resource='http://open-services.net/ns/core#Resource']" ) is not None):
+                    results.append( propuri )
+                for range_el in rdfxml.xml_find_elements(el, 'oslc:range'):
+                    range_uri = rdfxml.xmlrdf_get_resource_uri( range_el )
+                    if range_uri and range_uri.startswith( self.app.baseurl ):
+                        results.append( range_uri )
+        return results
+
     # pick all the attributes from a resource shape definition
     # and for enumerated attributes get all the enumeration values
     def _load_type_from_resource_shape(self, el, supershape=None):
@@ -1294,8 +1575,12 @@ xmlns:calm="http://jazz.net/xmlns/prod/jazz/calm/1.0/"
         return False
 
     # for OSLC query, given a resource URI, return the requirement dcterms:identifier
+    # identifiers are remembered for the current configuration (see resolve_reqids) so a uri is only retrieved once
     def resource_id_from_uri(self, uri):
         if self.is_resource_uri(uri):
+            known = self._reqiduris.setdefault( self.local_config, {} )
+            if uri in known:
+                return known[uri]
             try:
                 resource_xml = self.execute_get_rdf_xml(reluri=uri, intent="Retrieve type RDF to get its id (dcterms:identifier)")
             except requests.HTTPError as e:
@@ -1306,47 +1591,96 @@ xmlns:calm="http://jazz.net/xmlns/prod/jazz/calm/1.0/"
                 else:
                     raise
             id = rdfxml.xmlrdf_get_resource_text(resource_xml, ".//dcterms:identifier")
+            known[uri] = id
             return id
         raise Exception(f"Bad resource uri {uri}")
 
+    # the identifiers of many resource uris, retrieving the ones not already known in parallel
+    # returns a dictionary keyed by uri (in the order of uris) of the identifier, or None if the resource doesn't exist
+    def resource_ids_from_uris( self, uris, *, workers=None, verbose=False ):
+        results = self._get_concurrently( self.resource_id_from_uri, uris, workers=workers or IDENTIFIER_QUERY_WORKERS, verbose=verbose, desc="Retrieving identifiers" )
+        for uri,result in results.items():
+            if isinstance( result, Exception ):
+                raise result
+        return results
+
     def is_folder_uri(self, uri):
         if uri and uri.startswith(self.app.baseurl) and '/folders/' in uri:
             return True
         return False
     # {'https://jazz.ibm.com:9443/rm/resources/BI_STtIxNd8EeqV5_5cfWW9rw': {}, 'https://jazz.ibm.com:9443/rm/resources/TX_SRBoRdd8EeqV5_5cfWW9rw': {'rm_nav:parent': 'https://jazz.ibm.com:9443/rm/folders/FR_SS9iOdd8EeqV5_5cfWW9rw'}}
 
-    def resolve_reqid_to_core_uri( self, reqid ):
-        # get the query capability base URL
-        qcbase = self.get_query_capability_uri("oslc_rm:Requirement")
-        results = self.execute_oslc_query( qcbase, whereterms=[['dcterms:identifier','=',str(reqid)]],select=['rm_nav:parent'], prefixes={rdfxml.RDF_DEFAULT_PREFIX["dcterms"]:'dcterms',rdfxml.RDF_DEFAULT_PREFIX["rm_nav"]:'rm_nav'})
-        logger.debug( f"{results=}" )
-        if len( results.keys() ) == 0:
-            result = None
-        else:
-            # need to find the entry with a non-empty rm_nav:parent - that's the core artifact
-            result = None
-            for k in results.keys():
-                if results[k].get('rm_nav:parent',None):
-                    if not result:
-                        result = k
+    # split identifiers into lists which each give an identifier query with no more than maxlength characters of url-encoded identifiers
+    def _chunk_identifiers( self, identifiers, maxlength=IDENTIFIER_QUERY_MAXLENGTH ):
+        chunks = []
+        length = 0
+        for reqid in identifiers:
+            # +3 for the url-encoded comma
+            if not chunks or length+len(reqid)+3 > maxlength:
+                chunks.append( [] )
+                length = 0
+            chunks[-1].append( reqid )
+            length += len(reqid)+3
+        return chunks
+
+    # find the core artifact uri and module binding uris for many identifiers, using dcterms:identifier in [...] queries run in parallel
+    # rather than a query per identifier. The results (and the uri->identifier mapping) are remembered for the current configuration so
+    # an identifier is only queried once unless force is True
+    # returns a dictionary keyed by identifier (as a string, in the order of reqids) of {'core': uri or None, 'bindings': [uris]}, or None if the identifier isn't found
+    def resolve_reqids( self, reqids, *, force=False, workers=None, verbose=False ):
+        reqids = [str(reqid) for reqid in reqids]
+        for reqid in reqids:
+            if not utils.isint( reqid ):
+                raise Exception( f"value '{reqid}' is not an integer!" )
+        known = self._reqids.setdefault( self.local_config, {} )
+        knownuris = self._reqiduris.setdefault( self.local_config, {} )
+        toresolve = list( dict.fromkeys( reqid for reqid in reqids if force or reqid not in known ) )
+        if toresolve:
+            # get the query capability base URL
+            qcbase = self.get_query_capability_uri("oslc_rm:Requirement")
+            chunks = self._chunk_identifiers( toresolve )
+            logger.info( f"Resolving {len(toresolve)} identifiers using {len(chunks)} queries" )
+            queryresults = self._get_concurrently( lambda chunk: self.execute_oslc_query( qcbase, whereterms=[['dcterms:identifier','in',list( chunk )]], select=['dcterms:identifier','rm_nav:parent'], prefixes={rdfxml.RDF_DEFAULT_PREFIX["dcterms"]:'dcterms',rdfxml.RDF_DEFAULT_PREFIX["rm_nav"]:'rm_nav'}, intent="Resolve identifiers" ), [tuple( chunk ) for chunk in chunks], workers=workers or IDENTIFIER_QUERY_WORKERS, verbose=verbose, desc="Resolving identifiers" )
+            resolved = { reqid: None for reqid in toresolve }
+            for results in queryresults.values():
+                if isinstance( results, Exception ):
+                    raise results
+                logger.debug( f"{results=}" )
+                for uri,props in results.items():
+                    reqid = str( props.get('dcterms:identifier') )
+                    if reqid not in resolved:
+                        logger.info( f"Ignoring {uri} with unexpected identifier {reqid}" )
+                        continue
+                    if resolved[reqid] is None:
+                        resolved[reqid] = { 'core': None, 'bindings': [] }
+                    # the entry with a non-empty rm_nav:parent is the core artifact, ones without are module bindings
+                    if props.get('rm_nav:parent',None):
+                        if resolved[reqid]['core']:
+                            raise Exception( f"More than one core artifact returned for id {reqid}!" )
+                        resolved[reqid]['core'] = uri
                     else:
-                        raise Exception( f"More than one core artifact returned for id {reqid}!" )
-        return result
+                        resolved[reqid]['bindings'].append( uri )
+                    knownuris[uri] = reqid
+            known.update( resolved )
+        return { reqid: known[reqid] for reqid in reqids }
+
+    # forget the identifiers resolved by resolve_reqids (and the identifiers found by resource_id_from_uri) for the current configuration,
+    # or for all configurations if allconfigs is True - e.g. after creating/deleting artifacts
+    def invalidate_reqids( self, *, allconfigs=False ):
+        if allconfigs:
+            self._reqids = {}
+            self._reqiduris = {}
+        else:
+            self._reqids.pop( self.local_config, None )
+            self._reqiduris.pop( self.local_config, None )
+
+    def resolve_reqid_to_core_uri( self, reqid ):
+        resolved = self.resolve_reqids( [reqid] )[str(reqid)]
+        return resolved['core'] if resolved else None
 
     def resolve_reqid_to_module_uris( self, reqid ):
-        # get the query capability base URL
-        qcbase = self.get_query_capability_uri("oslc_rm:Requirement")
-        results = self.execute_oslc_query( qcbase, whereterms=[['dcterms:identifier','=',str(reqid)]],select=['rm_nav:parent'], prefixes={rdfxml.RDF_DEFAULT_PREFIX["dcterms"]:'dcterms',rdfxml.RDF_DEFAULT_PREFIX["rm_nav"]:'rm_nav'})
-        logger.debug( f"resolve_reqid_to_module_uris {results=}" )
-        if len( results.keys() ) == 0:
-            requris = None
-        else:
-            # need to find the entrs with a empty rm_nav:parent - these are module artifacts
-            requris = []
-            for k in results.keys():
-                if results[k].get('rm_nav:parent',None) is None:
-                    requris.append(k)
-        return requris
+        resolved = self.resolve_reqids( [reqid] )[str(reqid)]
+        return list( resolved['bindings'] ) if resolved else None
 
     def resolve_modulename_to_uri( self, modulename ):
         # get the query capability base URL
@@ -1362,6 +1696,138 @@ xmlns:calm="http://jazz.net/xmlns/prod/jazz/calm/1.0/"
             logger.info( f"rmtu {result=}" )
         return result
 
+    # the headers needed for the module structure API - have to remove the OSLC-Core-Version and Configuration-Context headers, and provide vvc.configuration header
+    def _module_structure_headers( self ):
+        return {'vvc.configuration': self.local_config,'DoorsRP-Request-Type':'public 2.0', 'Referer': None, 'OSLC-Core-Version': None, 'Configuration-Context': None}
+
+    def enable_module_structure_cache( self, folder ):
+        self.module_structure_cache_folder = folder
+
+    def _module_structure_filename( self, module_u ):
+        keyhash = hashlib.sha256( repr( ( self._typesystem_snapshot_key(), module_u ) ).encode() ).hexdigest()[:32]
+        return os.path.join( self.module_structure_cache_folder, f"module_{keyhash}.json" )
+
+    def _read_module_structure_cache( self, module_u ):
+        if not self.module_structure_cache_folder:
+            return None
+        filename = self._module_structure_filename( module_u )
+        if not os.path.isfile( filename ):
+            return None
+        try:
+            with open( filename, "r" ) as f:
+                cached = json.load( f )
+        except Exception as e:
+            logger.info( f"Module structure cache {filename} not readable {e}" )
+            return None
+        if cached.get( 'version' ) != MODULE_STRUCTURE_VERSION or cached.get( 'key' ) != list( self._typesystem_snapshot_key() ) or cached.get( 'module' ) != module_u:
+            logger.info( f"Module structure cache {filename} is for a different version/context" )
+            return None
+        return cached
+
+    # (written to a temporary file then renamed so a reader never sees a partial file)
+    def _save_module_structure_cache( self, module_u, cached ):
+        if not self.module_structure_cache_folder:
+            return
+        filename = self._module_structure_filename( module_u )
+        os.makedirs( self.module_structure_cache_folder, exist_ok=True )
+        tmpfilename = f"{filename}.{os.getpid()}.tmp"
+        with open( tmpfilename, "w" ) as f:
+            json.dump( { 'version': MODULE_STRUCTURE_VERSION, 'key': list( self._typesystem_snapshot_key() ), 'module': module_u, **cached }, f )
+        os.replace( tmpfilename, filename )
+        logger.info( f"Saved module structure {filename} {len(cached['entries'])} entries" )
+
+    # retrieve the (JSON) module structure, and the identifier and title of every binding in it
+    # the bindings are resolved by one OSLC query for the artifacts in the module (paged as usual), and any which the query doesn't return are
+    # retrieved in parallel. If the module structure cache is enabled the structure and binding details are saved, and then only retrieved
+    # again if the structure has changed (checked using its etag - not checked at all for a baseline because it can't change)
+    # in a stream/changeset the identifiers/titles can change without the structure changing, so they're always queried again
+    # returns a dictionary with 'structure' (the structure uri), 'etag', 'entries' (the structure list) and 'details' (binding uri->[identifier,title])
+    def _load_module_structure( self, module_u, *, workers=None, verbose=False ):
+        cached = self._read_module_structure_cache( module_u )
+        if cached and self.local_config and self.getconfigtype( self.local_config ) == "Baseline":
+            logger.info( f"Using cached module structure for {module_u} in baseline" )
+            return cached
+        if cached:
+            structure_u = cached['structure']
+        else:
+            mod_x = self.execute_get_rdf_xml( module_u, cacheable=False, headers=self._module_structure_headers(), intent="Retrieve the module RDF-XML to get the structure URI" )
+            structure_u = rdfxml.xmlrdf_get_resource_uri( mod_x, ".//rm_modules:structure" )
+            if structure_u is None:
+                raise Exception( f"No module structure found for {module_u} - is it a module?" )
+        headers = self._module_structure_headers()
+        headers['Accept'] = 'text/json'
+        if cached and cached.get( 'etag' ):
+            headers['If-None-Match'] = cached['etag']
+        response = self.execute_get_raw( structure_u, headers=headers, cacheable=False, intent="Retrieve module structure (JSON)" )
+        if response.status_code == 304:
+            logger.info( f"Module structure for {module_u} is unchanged" )
+            etag = cached['etag']
+            entries = cached['entries']
+        else:
+            etag = response.headers.get( 'ETag' )
+            entries = json.loads( response.content )
+        bindings = [ entry['uri'] for entry in entries if not entry.get( 'isStructureRoot' ) ]
+        details = {}
+
+        # get the query capability base URL
+        qcbase = self.get_query_capability_uri("oslc_rm:Requirement")
+        results = self.execute_oslc_query( qcbase, whereterms=[['rm:module','=',f'<{module_u}>']], select=['dcterms:identifier','dcterms:title'], prefixes={rdfxml.RDF_DEFAULT_PREFIX["dcterms"]:'dcterms',rdfxml.RDF_DEFAULT_PREFIX["rm"]:'rm'}, show_progress=verbose, intent="Retrieve the identifiers and titles of the module's artifacts" )
+        for uri,props in results.items():
+            details[uri] = [ props.get( 'dcterms:identifier' ), props.get( 'dcterms:title' ) ]
+
+        # fallback - retrieve any bindings the query didn't return
+        def getdetail( uri ):
+            req_x = self.execute_get_rdf_xml( uri, intent="Retrieve artifact details to get the title and identifier" )
+            return [ rdfxml.xmlrdf_get_resource_text( req_x,'.//dcterms:identifier'), rdfxml.xmlrdf_get_resource_text( req_x,'.//dcterms:title') ]
+        missing = [ uri for uri in bindings if uri not in results ]
+        if missing:
+            logger.info( f"Module query didn't return {len(missing)} of {len(bindings)} bindings - retrieving them" )
+        for uri,detail in self._get_concurrently( getdetail, missing, workers=workers, verbose=verbose, desc="Retrieving bindings" ).items():
+            if isinstance( detail, Exception ):
+                raise detail
+            details[uri] = detail
+        result = { 'structure': structure_u, 'etag': etag, 'entries': entries, 'details': { uri: details[uri] for uri in bindings } }
+        self._save_module_structure_cache( module_u, result )
+        return result
+
+    # return the structure of a module (name or uri) as a tree of _ModuleBinding - the root is the structure root, its children
+    # are the top-level bindings. Each binding has its identifier, title, boundartifact, isheading and section number (as shown
+    # by the Section column in DN). The tree is remembered for the configuration, so it's only retrieved again if force is True
+    # use enable_module_structure_cache() to also remember it between runs
+    def get_module_structure( self, module_name_or_uri, *, force=False, workers=None, verbose=False ):
+        module_u = module_name_or_uri if module_name_or_uri.startswith( "http" ) else self.resolve_modulename_to_uri( module_name_or_uri )
+        if module_u is None:
+            raise Exception( f"Module {module_name_or_uri} not found" )
+        key = ( self.local_config, module_u )
+        if key in self._modulestructures and not force:
+            return self._modulestructures[key]
+        loaded = self._load_module_structure( module_u, workers=workers, verbose=verbose )
+        entries = { entry['uri']: entry for entry in loaded['entries'] }
+
+        root = _ModuleBinding( uri=loaded['structure'], module=module_u )
+        # heading level is a list of two-element lists - first is the heading number, second is the non-heading number
+        # NOTE NOTE NOTE the section number calculation has not been fully verified/checked - it seems to work after superficial inspection
+        headinglevel = []
+        def addchildren( parentnode, childuris ):
+            headinglevel.append( [0,0] )
+            for uri in childuris:
+                entry = entries[uri]
+                if entry.get( 'isHeading' ):
+                    # increment the heading number and reset the sub-number
+                    headinglevel[-1][0] += 1
+                    headinglevel[-1][1] = 0
+                else:
+                    # increment the sub-number
+                    headinglevel[-1][1] += 1
+                identifier, title = loaded['details'].get( uri, [None,None] )
+                node = _ModuleBinding( uri=uri, module=module_u, boundartifact=entry.get( 'boundArtifact' ), isheading=entry.get( 'isHeading', False ), identifier=identifier, title=title, parent=parentnode )
+                node.section = ".".join( f"{hn}-{tn}" if tn else f"{hn}" for hn,tn in headinglevel )
+                addchildren( node, entry.get( 'childBindings', [] ) )
+            headinglevel.pop()
+        addchildren( root, entries[loaded['structure']].get( 'childBindings', [] ) )
+        self._modulestructures[key] = root
+        return root
+
 #    def resolve_configname_to_uri( self, configname ):
         # configname syntax is domain/project/component/config
         # for example (remove the')  'rm:rm23/rm_optin_p1/rm_optin_p1 comp2/rm_optin_p1 comp2 Initial Stream'
@@ -1380,7 +1846,7 @@ xmlns:calm="http://jazz.net/xmlns/prod/jazz/calm/1.0/"
 
 
     def resolve_uri_to_reqid( self, requri ):
-        pass
+        return self.resource_id_from_uri( requri )
 
     def folder_nametouri_resolver(self, path_or_uri):
         logger.debug( f"Finding uri {path_or_uri}" )
@@ -1471,24 +1937,23 @@ xmlns:calm="http://jazz.net/xmlns/prod/jazz/calm/1.0/"
             if not utils.isint( str(i) ):
                 raise Exception( "value '{i}' is not an integer!" )
                         
-        # use OSLC Query then if necessary post-processes the results
+        # use OSLC Query (via resolve_reqids, so the identifiers are remembered for the configuration) then if necessary post-processes the results
         # return Resources!
-        # query
-            # get the query capability base URL for requirements
-        qcbase = self.get_query_capability_uri("oslc_rm:Requirement")
-        
-        # query for the identifiers
-        artifacts = self.execute_oslc_query(
-            qcbase,
-            whereterms=[['dcterms:identifier','in',identifiers]],
-#            select=['*'],
-            select=[],
-            prefixes={rdfxml.RDF_DEFAULT_PREFIX["dcterms"]:'dcterms'} # note this is reversed - url to prefix
-            )
+        artifacts = []
+        for resolved in self.resolve_reqids( identifiers ).values():
+            if resolved:
+                if resolved['core']:
+                    artifacts.append( resolved['core'] )
+                artifacts.extend( resolved['bindings'] )
+        artifacts = list( dict.fromkeys( artifacts ) )
         results = []
 #        print( f"{artifacts=}" )
+        # retrieve the artifacts in parallel
+        artresources = self.resourceFactory_many( artifacts, self, verbose=False )
         for art in artifacts:
-            artres = self.resourceFactory( art, self )
+            artres = artresources[art]
+            if isinstance( artres, Exception ):
+                raise artres
             keep = False
             keep = keep or ( returnCoreResources and type( artres ) == CoreResource )
             keep = keep or ( returnBindings and type( artres ) == BindingResource )
@@ -4,8 +4,11 @@
 ##
 
 
+import importlib
+import json
 import logging
 import keyword
+import os
 
 from . import rdfxml
 from . import utils
@@ -13,6 +16,12 @@ from . import utils
 
 logger = logging.getLogger(__name__)
 
+# increment this when the format of the typesystem registries changes, so old snapshots are ignored
+TYPESYSTEM_SNAPSHOT_VERSION = 2
+
+# in a typesystem snapshot (which is JSON) a codec class is saved as a dictionary with this key and value module:classname
+SNAPSHOT_CLASS_KEY = "+-+class+-+"
+
 #################################################################################################
 
 def makeSafeAttributeName( name, propuri ):
@@ -28,6 +37,26 @@ def makeSafeAttributeName( name, propuri ):
 #    print( f"Make safe name fror {name } {res}" )
     return res
 
+# json.dump default for a typesystem snapshot - the only values in the registries which aren't JSON are codec classes
+def _snapshot_encode( value ):
+    if isinstance( value, type ):
+        return { SNAPSHOT_CLASS_KEY: f"{value.__module__}:{value.__qualname__}" }
+    raise TypeError( f"Typesystem snapshot can't save {value!r}" )
+
+# json.load object_hook for a typesystem snapshot - a saved class is only looked up in the elmclient modules
+def _snapshot_decode( d ):
+    if len( d ) != 1 or SNAPSHOT_CLASS_KEY not in d:
+        return d
+    modulename, _, classname = d[SNAPSHOT_CLASS_KEY].partition( ":" )
+    if modulename.split( "." )[0] != __package__:
+        raise Exception( f"Typesystem snapshot refers to {d[SNAPSHOT_CLASS_KEY]} which isn't an elmclient class" )
+    result = importlib.import_module( modulename )
+    for name in classname.split( "." ):
+        result = getattr( result, name )
+    if not isinstance( result, type ):
+        raise Exception( f"Typesystem snapshot refers to {d[SNAPSHOT_CLASS_KEY]} which isn't a class" )
+    return result
+
 #################################################################################################
 
 class No_Type_System_Mixin():
@@ -47,8 +76,146 @@ class Type_System_Mixin():
         self.enums = {}
         self.values = {}
         self.typesystem_loaded = False
-        self._gettypecache = {}
+        if not getattr( self, '_preserve_typecache', False ):
+            # (while the typesystem is being refreshed the retrieved type definitions are kept so only changed ones are retrieved again)
+            self._gettypecache = {}
+            self._typeetags = {}
         self.enumdefs = {}
+        self._clear_typesystem_indexes()
+
+    # secondary indexes so name->uri lookups don't have to scan the registries
+    # each index maps a name (or a tuple containing a name) to a list of candidate uris in registration order
+    # candidates are always checked against the registry when looked up, so an index entry which has become stale
+    # (e.g. because a property was re-registered with a different name) is harmless
+    def _clear_typesystem_indexes(self):
+        self._shapesbyname = {}
+        self._propertiesbyname = {}
+        self._propertiesbyaltname = {}
+        self._shapeattributes = {}
+        self._linktypesbyname = {}
+        self._enumsbyname = {}
+        self._clear_attribute_schemas()
+
+    # the compiled attribute schemas (see get_shape_schema) depend on the whole typesystem so are discarded when anything is registered
+    # typesystem_generation is incremented at the same time so other things derived from the typesystem (e.g. the creation index)
+    # can tell they are out of date - the registries are sometimes updated in place so their identity can't be used for this
+    def _clear_attribute_schemas(self):
+        self._shapeschemas = {}
+        self._attributeschemas = {}
+        self.typesystem_generation = getattr( self, 'typesystem_generation', 0 ) + 1
+
+    def _addtoindex( self, index, key, uri ):
+        uris = index.setdefault( key, [] )
+        if uri not in uris:
+            uris.append( uri )
+        self._clear_attribute_schemas()
+
+    def _index_property( self, property_uri, shape_uri=None ):
+        prop = self.properties[property_uri]
+        self._addtoindex( self._propertiesbyname, prop['name'], property_uri )
+        if prop.get('altname'):
+            self._addtoindex( self._propertiesbyaltname, prop['altname'], property_uri )
+        if shape_uri is not None:
+            self._addtoindex( self._shapeattributes, (shape_uri,prop['name']), property_uri )
+            if prop.get('safeName'):
+                self._addtoindex( self._shapeattributes, (shape_uri,prop['safeName']), property_uri )
+
+    def _index_linktype( self, linktype_uri ):
+        lt = self.linktypes[linktype_uri]
+        self._addtoindex( self._linktypesbyname, lt['name'], linktype_uri )
+        if lt.get('safeName'):
+            self._addtoindex( self._linktypesbyname, lt['safeName'], linktype_uri )
+
+    # rebuild all the indexes from the registries (e.g. after restoring a snapshot)
+    def _index_typesystem(self):
+        self._clear_typesystem_indexes()
+        for shape_uri,shape in self.shapes.items():
+            self._addtoindex( self._shapesbyname, shape['name'], shape_uri )
+        for property_uri in self.properties:
+            self._index_property( property_uri )
+            for enum_uri in self.properties[property_uri]['enums']:
+                if enum_uri in self.enums:
+                    self._addtoindex( self._enumsbyname, (property_uri,self.enums[enum_uri]['name']), enum_uri )
+        for shape_uri,shape in self.shapes.items():
+            for property_uri in shape['properties']:
+                if property_uri in self.properties:
+                    self._index_property( property_uri, shape_uri )
+        for linktype_uri in self.linktypes:
+            self._index_linktype( linktype_uri )
+
+    # return a snapshot of the loaded typesystem registries as a dictionary which can be saved using save_typesystem_snapshot
+    # (the type retrieval cache isn't included because it holds parsed XML)
+    # key identifies the context the typesystem was loaded in, etags are the ETags of the retrieved type definitions (keyed by uri)
+    def get_typesystem_snapshot(self, *, key=None, etags=None):
+        snapshot = {
+                'version': TYPESYSTEM_SNAPSHOT_VERSION,
+                'key': key,
+                'etags': etags if etags is not None else dict(self._typeetags),
+                'shapes': self.shapes,
+                'properties': self.properties,
+                'linktypes': self.linktypes,
+                'enums': self.enums,
+                'values': self.values,
+                'enumdefs': self.enumdefs,
+            }
+        return snapshot
+
+    # update the typesystem registries in place (so the dictionaries keep their identity) with those from another
+    # typesystem's registries, e.g. a freshly loaded one - the indexes are rebuilt
+    def update_typesystem_registries(self, shapes, properties, linktypes, enums, values, enumdefs):
+        for current,new in ( (self.shapes,shapes), (self.properties,properties), (self.linktypes,linktypes), (self.enums,enums), (self.values,values), (self.enumdefs,enumdefs) ):
+            if current is not new:
+                current.clear()
+                current.update( new )
+        self._index_typesystem()
+
+    # replace the typesystem registries with those from a snapshot
+    def restore_typesystem_snapshot(self, snapshot):
+        self.clear_typesystem()
+        self.shapes = snapshot['shapes']
+        self.properties = snapshot['properties']
+        self.linktypes = snapshot['linktypes']
+        self.enums = snapshot['enums']
+        self.values = snapshot['values']
+        self.enumdefs = snapshot['enumdefs']
+        self._typeetags = dict(snapshot['etags'])
+        self._index_typesystem()
+        self.typesystem_loaded = True
+
+    # save a snapshot of the typesystem to a file (written to a temporary file then renamed so a reader never sees a partial file)
+    def save_typesystem_snapshot(self, filename, *, key=None, etags=None):
+        snapshot = self.get_typesystem_snapshot( key=key, etags=etags )
+        folder = os.path.split(os.path.abspath(filename))[0]
+        if not os.path.isdir( folder ):
+            os.makedirs( folder, exist_ok=True )
+        tmpfilename = f"{filename}.{os.getpid()}.tmp"
+        try:
+            with open( tmpfilename, "w", encoding="utf-8" ) as f:
+                json.dump( snapshot, f, default=_snapshot_encode )
+        except Exception:
+            os.remove( tmpfilename )
+            raise
+        os.replace( tmpfilename, filename )
+        logger.info( f"Saved typesystem snapshot {filename} {key=} {len(self.shapes)} shapes" )
+
+    # read a snapshot from a file - returns None if the file doesn't exist or is unreadable or is a different version, or has a different key
+    # snapshots are JSON so reading one doesn't run any code - the only classes it can refer to are elmclient codecs
+    def read_typesystem_snapshot(self, filename, *, key=None):
+        if not os.path.isfile( filename ):
+            return None
+        try:
+            with open( filename, "r", encoding="utf-8" ) as f:
+                snapshot = json.load( f, object_hook=_snapshot_decode )
+        except Exception as e:
+            logger.info( f"Typesystem snapshot {filename} not readable {e}" )
+            return None
+        if not isinstance( snapshot, dict ) or snapshot.get('version') != TYPESYSTEM_SNAPSHOT_VERSION:
+            logger.info( f"Typesystem snapshot {filename} is the wrong version" )
+            return None
+        if key is not None and snapshot.get('key') != list( key ):
+            logger.info( f"Typesystem snapshot {filename} is for {snapshot.get('key')} not {key}" )
+            return None
+        return snapshot
 
     def textreport(self):
 
@@ -202,10 +369,11 @@ class Type_System_Mixin():
             raise Exception( f"Shape {shape_uri} already defined!" )
         # add the URI as the main registration for the shape
         self.shapes[shape_uri] = {'name':shape_name,'shape':shape_uri, 'sameas': rdfuri, 'shape_formats': shape_formats, 'properties':[], 'linktypes':[]}
+        self._addtoindex( self._shapesbyname, shape_name, shape_uri )
 
     def get_shape_uri( self, shape_name ):
         logger.info( f"get_shape_uri {shape_name=}" )
-        shapes = [k for k,v in self.shapes.items()  if v['name']==shape_name ]
+        shapes = [k for k in self._shapesbyname.get( shape_name, [] ) if self.shapes[k]['name']==shape_name ]
         if len(shapes)==1:
             result = shapes[0]
         else:
@@ -251,14 +419,20 @@ class Type_System_Mixin():
         if not do_not_overwrite or property_uri not in self.properties:
 #            self.properties[property_uri] = {'name': property_name, 'shape': shape_uri, 'enums': [], 'value_type': property_value_type, 'altname':altname, 'isMultiValued':isMultiValued, 'typeCodec': typeCodec }
             self.properties[property_uri] = {'name': property_name, 'safeName': safeName, 'enums': [], 'value_type': property_value_type, 'altname':altname, 'isMultiValued':isMultiValued, 'typeCodec': typeCodec }
+            self._index_property( property_uri )
 
         if altname and property_definition_uri and ( not do_not_overwrite or property_definition_uri not in self.properties):
             self.properties[property_definition_uri] = {'name': altname, 'enums': [], 'value_type': property_value_type, 'altname':None, 'isMultiValued':isMultiValued, 'typeCodec': typeCodec }
             self.properties[rdfxml.uri_to_default_prefixed_tag(property_definition_uri)] = {'name': altname, 'enums': [], 'value_type': property_value_type, 'altname':None, 'isMultiValued':isMultiValued, 'typeCode': typeCodec }
+            self._index_property( property_definition_uri )
+            self._index_property( rdfxml.uri_to_default_prefixed_tag(property_definition_uri) )
             
         # make sure the property is recorded on the shape
         if shape_uri is not None and property_uri not in self.shapes[shape_uri]['properties']:
             self.shapes[shape_uri]['properties'].append(property_uri)
+        if shape_uri is not None:
+            # (index even if already on the shape because mapUnknownProperty adds to the shape before registering)
+            self._index_property( property_uri, shape_uri )
 
 #    def register_property_codec( self, property_name, property_uri, codec, shape_uri=None ):
     def register_property_codec( self, property_name, property_uri, codec ):
@@ -270,6 +444,7 @@ class Type_System_Mixin():
                 raise Exception( f"Codec for {property_name} {property_uri} already set to {self.properties[property_uri]['typeCodec']} so can't set again to {codec}!" )
         else:
             self.properties[property_uri]['typeCodec'] = codec
+            self._clear_attribute_schemas()
     
 #    def register_linktype( self, linktype_name, linktype_uri, label, *, inverselabel=None, rdfuri=None, shape_uri=None, isMultiValued=False, typeCodec=None ):
     def register_linktype( self, linktype_name, linktype_uri, label, *, inverselabel=None, rdfuri=None, isMultiValued=False, typeCodec=None ):
@@ -282,6 +457,7 @@ class Type_System_Mixin():
         if linktype_uri not in self.linktypes:
 #            self.linktypes[linktype_uri] = {'name': label, 'inverselabel': inverselabel, 'shape': shape_uri, 'rdfuri': rdfuri }
             self.linktypes[linktype_uri] = {'name': linktype_name, 'safeName': safeName, 'label': label, 'inverselabel': inverselabel, 'rdfuri': rdfuri, 'typeCodec': typeCodec }
+            self._index_linktype( linktype_uri )
 #        if shape_uri is not None:
 #            self.shapes[shape_uri]['linktypes'].append(linktype_uri)
         
@@ -300,11 +476,11 @@ class Type_System_Mixin():
 #        shape_uri = self.normalise_uri( shape_uri )
 #        properties = [k for k,v in self.properties.items() if v['name']==property_name and v['shape']==shape_uri]
         if shape_uri:
-            properties = [k for k,v in self.properties.items() if v['name']==property_name and k in self.shapes[shape_uri]['properties']]
+            properties = [k for k in self._shapeattributes.get( (shape_uri,property_name), [] ) if self.properties[k]['name']==property_name and k in self.shapes[shape_uri]['properties']]
 #            print( f"0{self.shapes[shape_uri]['properties']=}" )
 #            print( f"1 {properties=}" )
         else:
-            properties = [k for k,v in self.properties.items() if v['name']==property_name]
+            properties = [k for k in self._propertiesbyname.get( property_name, [] ) if self.properties[k]['name']==property_name]
             
 #            print( f"1 {properties=}" )
             
@@ -312,7 +488,7 @@ class Type_System_Mixin():
             result = properties[0]
         else:
             # try using altname
-            altproperties = [k for k,v in self.properties.items() if v['altname']==property_name]
+            altproperties = [k for k in self._propertiesbyaltname.get( property_name, [] ) if self.properties[k]['altname']==property_name]
             if len(altproperties)==1:
                 result = altproperties[0]
                 logger.info( f"Property {property_name} found using altname" )
@@ -330,6 +506,60 @@ class Type_System_Mixin():
         logger.info( f"get_property_uri {property_name=} returning {result=}" )
         return result
 
+    # find the property (in the shape) or linktype for a Resource attribute name, which can be the name or the safeName
+    # returns (uri, definition) or (None, None) if not found
+    def get_attribute_definition( self, shape_uri, name ):
+        for prop_u in self._shapeattributes.get( (shape_uri,name), [] ):
+            prop = self.properties[prop_u]
+            if ( prop['name']==name or prop.get('safeName',"")==name ) and prop_u in self.shapes[shape_uri]['properties']:
+                return prop_u, prop
+        for lt_u in self._linktypesbyname.get( name, [] ):
+            lt = self.linktypes[lt_u]
+            if lt['name']==name or lt.get('safeName',"")==name:
+                return lt_u, lt
+        return None, None
+
+    # the compiled attribute schema for Resources with shape shape_uri - a dictionary keyed by every attribute name (name or safeName
+    # of the shape's properties and of the linktypes) of the attribute's compiled definition (see _compile_attribute)
+    # names are resolved exactly as get_attribute_definition does. Built when first needed after the typesystem is loaded/changed
+    def get_shape_schema( self, shape_uri ):
+        schema = self._shapeschemas.get( shape_uri )
+        if schema is None:
+            schema = {}
+            names = []
+            for prop_u in self.shapes[shape_uri]['properties'] if shape_uri in self.shapes else []:
+                if prop_u in self.properties:
+                    names.extend( [self.properties[prop_u]['name'], self.properties[prop_u].get('safeName')] )
+            for lt in self.linktypes.values():
+                names.extend( [lt['name'], lt.get('safeName')] )
+            for name in names:
+                if name and name not in schema:
+                    uri, definition = self.get_attribute_definition( shape_uri, name )
+                    if uri is not None:
+                        schema[name] = self.get_attribute_schema( shape_uri, uri, definition )
+            self._shapeschemas[shape_uri] = schema
+        return schema
+
+    # the compiled definition of the property/linktype uri for Resources with shape shape_uri
+    def get_attribute_schema( self, shape_uri, uri, definition=None ):
+        result = self._attributeschemas.get( (shape_uri,uri) )
+        if result is None:
+            result = self._compile_attribute( shape_uri, uri, definition or self.properties.get( uri ) or self.linktypes[uri] )
+            self._attributeschemas[(shape_uri,uri)] = result
+        return result
+
+    # 'uri', 'definition' (the property or linktype), 'codec' (an instance, or None), 'isMultiValued' and 'enumnames' (a set, None if not an enumeration)
+    def _compile_attribute( self, shape_uri, uri, definition ):
+        codec = definition.get( 'typeCodec' )
+        enums = definition.get( 'enums' )
+        return {
+                'uri': uri
+                ,'definition': definition
+                ,'codec': codec( self, shape_uri, uri ) if codec is not None else None
+                ,'isMultiValued': definition.get( 'isMultiValued', False )
+                ,'enumnames': frozenset( self.enums[e]['name'] for e in enums ) if enums else None
+            }
+
     def get_property_name( self, property_uri, shape_uri=None ):
         logger.info( f"get_property_name {property_uri=} {shape_uri=}" )
         property_uri = self.normalise_uri( property_uri )
@@ -359,14 +589,19 @@ class Type_System_Mixin():
             self.enums[id] = {'name': enum_name, 'id':id, 'property': property_uri}
         if enum_uri not in self.properties[property_uri]['enums']:
             self.properties[property_uri]['enums'].append(enum_uri)
+        self._addtoindex( self._enumsbyname, (property_uri,enum_name), enum_uri )
+
+    # return the first enum uri of property_uri with name enum_name (in the order they are on the property), or None
+    def _find_enum_uri( self, enum_name, property_uri ):
+        candidates = [e for e in self._enumsbyname.get( (property_uri,enum_name), [] ) if self.enums[e]['name']==enum_name and e in self.properties[property_uri]['enums']]
+        if len(candidates)>1:
+            enums = self.properties[property_uri]['enums']
+            candidates.sort( key=enums.index )
+        return candidates[0] if candidates else None
 
     def get_enum_uri(self, enum_name, property_uri):
         property_uri = self.normalise_uri( property_uri )
-        result = None
-        for enumuri in self.properties[property_uri]['enums']:
-            if self.enums[enumuri]['name']==enum_name:
-                result = enumuri
-                break
+        result = self._find_enum_uri( enum_name, property_uri )
         return result
 
     def get_enum_name( self, enum_uri ):
@@ -382,11 +617,10 @@ class Type_System_Mixin():
 #        print( f"{self.properties[property_uri]=}" )
         logger.info( f"{self.properties[property_uri]['enums']=}" )
 #        print( f"{self.properties[property_uri]['enums']=}" )
-        for enum_uri in self.properties[property_uri]['enums']:
-            if self.enums[enum_uri]['name']==enum_name:
-                result = self.enums[enum_uri]['id'] or enum_uri
-#                result = enum_uri # this makes ccm queries for e.g. rc:cm:type=Defect not work - ccm doens't like getting a URI - # unfortunately I can't remember why I added this line :-(
-                break
+        enum_uri = self._find_enum_uri( enum_name, property_uri )
+        if enum_uri is not None:
+            result = self.enums[enum_uri]['id'] or enum_uri
+#            result = enum_uri # this makes ccm queries for e.g. rc:cm:type=Defect not work - ccm doens't like getting a URI - # unfortunately I can't remember why I added this line :-(
         logger.info( f"get_enum_id {enum_name=} {property_uri=} {result=}" )
 #        print( f"get_enum_id {enum_name=} {property_uri=} {result=}" )
         return result
@@ -418,7 +652,7 @@ class Type_System_Mixin():
 
 #    def get_linktype_uri( self, name, shape_uri=None ):
     def get_linktype_uri( self, name ):
-        linktypes = [k for k,v in self.linktypes.items() if v['name']==name]
+        linktypes = [k for k in self._linktypesbyname.get( name, [] ) if self.linktypes[k]['name']==name]
         if len(linktypes) > 1:
             raise Exception( f"Multiple link types with same name '{name}'" )
         if len(linktypes) == 0:
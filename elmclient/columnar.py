@@ -0,0 +1,280 @@
+##
+## © Copyright 2025- IBM Inc. All rights reserved
+# SPDX-License-Identifier: MIT
+##
+
+#
+# Columnar output of query results - Arrow tables/record batches, Parquet, Feather and pandas DataFrame
+#
+# Query results (as returned by do_complex_query, i.e. a dictionary keyed by resource URI of dictionaries of values,
+# or any iterable of (uri,rowdict) pairs) are converted directly into Arrow columns, typed using the typesystem
+# of the project/component which did the query: dateTimes become timestamps, integers int64, booleans bool and
+# enumerations become dictionary-encoded (pandas categorical) columns. List (multi-valued) columns become lists of strings.
+#
+# pyarrow (and pandas for DataFrames) are optional - they're only needed if you use these functions
+#
+
+import logging
+import os
+
+import dateutil.parser
+import pytz
+
+from . import rdfxml
+
+logger = logging.getLogger(__name__)
+
+# column kinds
+STRING = "string"
+DATETIME = "datetime"
+INTEGER = "integer"
+BOOLEAN = "boolean"
+ENUM = "enum"
+
+# number of rows converted in each record batch
+BATCHSIZE = 10000
+
+# map from xsd value type to column kind
+_valuetype_to_kind = {
+    'http://www.w3.org/2001/XMLSchema#dateTime': DATETIME,
+    'http://www.w3.org/2001/XMLSchema#integer':  INTEGER,
+    'http://www.w3.org/2001/XMLSchema#int':      INTEGER,
+    'http://www.w3.org/2001/XMLSchema#long':     INTEGER,
+    'http://www.w3.org/2001/XMLSchema#boolean':  BOOLEAN,
+}
+
+# map from codec class name to column kind - uses the name to avoid importing the app modules here
+_codec_to_kind = {
+    'DateTimeCodec': DATETIME,
+    'IntegerCodec':  INTEGER,
+    'BooleanCodec':  BOOLEAN,
+    'EnumCodec':     ENUM,
+}
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+    except ImportError:
+        raise Exception( "Columnar output needs pyarrow - install it using 'pip install pyarrow'" )
+    return pyarrow
+
+def _import_pandas():
+    try:
+        import pandas
+    except ImportError:
+        raise Exception( "DataFrame output needs pandas - install it using 'pip install pandas'" )
+    return pandas
+
+# work out the kind for each column name using the typesystem of queryon (a project/component)
+# the column names may be property names, altnames or prefixed tags; if a name maps to properties with different kinds it's a string
+def column_kinds( queryon, columns ):
+    kinds = {}
+    if queryon is None or not getattr( queryon, 'has_typesystem', False ):
+        return { col: STRING for col in columns }
+    bynames = {}
+    for propuri,prop in queryon.properties.items():
+        if prop.get('enums'):
+            kind = ENUM
+        elif prop.get('value_type') in _valuetype_to_kind:
+            kind = _valuetype_to_kind[prop['value_type']]
+        elif prop.get('typeCodec') is not None:
+            kind = _codec_to_kind.get( prop['typeCodec'].__name__, STRING )
+        else:
+            kind = STRING
+        names = [prop.get('name'),prop.get('altname')]
+        if propuri.startswith( "http://" ) or propuri.startswith( "https://" ):
+            names.append( rdfxml.uri_to_default_prefixed_tag( propuri ) )
+        else:
+            names.append( propuri )
+        for name in names:
+            if name:
+                bynames.setdefault( name, set() ).add( kind )
+    for col in columns:
+        colkinds = bynames.get( col )
+        kinds[col] = colkinds.pop() if colkinds and len( colkinds )==1 else STRING
+    logger.info( f"column_kinds {kinds=}" )
+    return kinds
+
+# convert an ISO dateTime string (e.g. 2024-12-02T14:01:07.627Z) to a UTC datetime
+def _to_datetime( value ):
+    if value is None or value == "":
+        return None
+    dt = dateutil.parser.isoparse( value )
+    if dt.tzinfo is None:
+        dt = pytz.utc.localize( dt )
+    return dt.astimezone( pytz.utc )
+
+def _to_integer( value ):
+    if value is None or value == "":
+        return None
+    return int( value )
+
+def _to_boolean( value ):
+    if value is None or value == "":
+        return None
+    if isinstance( value, bool ):
+        return value
+    if value == "true":
+        return True
+    if value == "false":
+        return False
+    raise ValueError( f"Not a valid boolean '{value}'" )
+
+def _to_string( value ):
+    if value is None:
+        return None
+    return str( value )
+
+# build an arrow array for one column of values - if the values don't convert to the kind's type the column falls back to string
+# aslist forces the column to be a list column (True) or a scalar column (False) - None means decide from the values
+def _make_array( pa, name, values, kind, aslist=None ):
+    if aslist is None:
+        aslist = any( isinstance( v, list ) for v in values )
+    if aslist:
+        # multi-valued column - list of strings (None for empty)
+        return pa.array( [ None if v is None or v == "" else [ _to_string( lv ) for lv in ( v if isinstance( v, list ) else [v] ) ] for v in values ], type=pa.list_( pa.string() ) )
+    # a list value in a scalar column is joined into a single string
+    values = [ "\n".join( _to_string( lv ) for lv in v ) if isinstance( v, list ) else v for v in values ]
+    if kind == STRING and values and all( v is None or ( isinstance( v, int ) and not isinstance( v, bool ) ) for v in values ) and any( v is not None for v in values ):
+        # e.g. a totalized column
+        kind = INTEGER
+    try:
+        if kind == DATETIME:
+            return pa.array( [ _to_datetime( v ) for v in values ], type=pa.timestamp( 'ms', tz='UTC' ) )
+        if kind == INTEGER:
+            return pa.array( [ _to_integer( v ) for v in values ], type=pa.int64() )
+        if kind == BOOLEAN:
+            return pa.array( [ _to_boolean( v ) for v in values ], type=pa.bool_() )
+        if kind == ENUM:
+            return pa.array( [ _to_string( v ) for v in values ], type=pa.string() ).dictionary_encode()
+    except ( ValueError, TypeError, OverflowError ) as e:
+        logger.info( f"Column {name} can't be converted to {kind} so using string {e}" )
+    return pa.array( [ _to_string( v ) for v in values ], type=pa.string() )
+
+def _iter_rows( results, urikey ):
+    # results is either a dictionary keyed by uri or an iterable of (uri,rowdict)
+    items = results.items() if isinstance( results, dict ) else results
+    for uri,row in items:
+        if urikey and urikey not in row:
+            row = dict( row )
+            row[urikey] = uri
+        yield row
+
+# find all the columns, and which of them are lists in any row
+def _discover_columns( rows, urikey ):
+    columns = {}
+    listcolumns = set()
+    if urikey:
+        columns[urikey] = True
+    for row in rows:
+        for k,v in row.items():
+            columns[k] = True
+            if isinstance( v, list ):
+                listcolumns.add( k )
+    return list( columns.keys() ), listcolumns
+
+# generate arrow record batches from the results
+# columns is the list of columns (in order) to output - if not specified then for a dictionary all columns are found,
+#   for an iterator the columns are found from the first batch (columns first appearing later are ignored)
+# the schema is fixed by the first batch so all batches can go in one table/file
+def results_to_record_batches( results, *, queryon=None, columns=None, urikey="$uri", batchsize=BATCHSIZE ):
+    pa = _import_pyarrow()
+    listcolumns = None
+    if isinstance( results, dict ):
+        # scan once to find the columns and which are lists, so every batch has the same schema
+        allcolumns,listcolumns = _discover_columns( results.values(), urikey )
+        columns = columns or allcolumns
+    kinds = None
+    schema = None
+    batch = []
+
+    def make_batch( rows ):
+        nonlocal columns, listcolumns, kinds, schema
+        if columns is None or listcolumns is None:
+            batchcolumns,listcolumns = _discover_columns( rows, urikey )
+            columns = columns or batchcolumns
+        if kinds is None:
+            kinds = column_kinds( queryon, columns )
+        arrays = []
+        for i,col in enumerate( columns ):
+            values = [ row.get( col ) for row in rows ]
+            arr = _make_array( pa, col, values, kinds[col], aslist=col in listcolumns )
+            if schema is not None and arr.type != schema.field( i ).type:
+                # later batches must match the types of the first batch
+                thetype = schema.field( i ).type
+                if pa.types.is_dictionary( thetype ):
+                    arr = arr.cast( pa.string() ).dictionary_encode()
+                else:
+                    try:
+                        arr = arr.cast( thetype )
+                    except ( pa.ArrowInvalid, pa.ArrowNotImplementedError ):
+                        # e.g. an integer column which has a non-integer value in this batch
+                        raise Exception( f"Column {col} values in a later batch don't match the type {thetype} of the first batch - try a larger batchsize" )
+            arrays.append( arr )
+        result = pa.RecordBatch.from_arrays( arrays, names=columns )
+        if schema is None:
+            schema = result.schema
+        return result
+
+    for row in _iter_rows( results, urikey ):
+        batch.append( row )
+        if len( batch ) >= batchsize:
+            yield make_batch( batch )
+            batch = []
+    if batch or schema is None:
+        yield make_batch( batch )
+
+# return the results as an arrow table
+def results_to_arrow_table( results, *, queryon=None, columns=None, urikey="$uri", batchsize=BATCHSIZE ):
+    pa = _import_pyarrow()
+    batches = list( results_to_record_batches( results, queryon=queryon, columns=columns, urikey=urikey, batchsize=batchsize ) )
+    return pa.Table.from_batches( batches )
+
+# return the results as a pandas DataFrame - enumerations become categoricals, the uri is a column (not the index)
+def results_to_dataframe( results, *, queryon=None, columns=None, urikey="$uri", batchsize=BATCHSIZE ):
+    _import_pandas()
+    table = results_to_arrow_table( results, queryon=queryon, columns=columns, urikey=urikey, batchsize=batchsize )
+    return table.to_pandas()
+
+# write the results to a Parquet file, a batch at a time
+def write_parquet( results, filename, *, queryon=None, columns=None, urikey="$uri", batchsize=BATCHSIZE, compression="snappy" ):
+    _import_pyarrow()
+    import pyarrow.parquet
+    writer = None
+    nrows = 0
+    try:
+        for batch in results_to_record_batches( results, queryon=queryon, columns=columns, urikey=urikey, batchsize=batchsize ):
+            if writer is None:
+                writer = pyarrow.parquet.ParquetWriter( filename, batch.schema, compression=compression )
+            writer.write_batch( batch )
+            nrows += batch.num_rows
+    finally:
+        if writer is not None:
+            writer.close()
+    logger.info( f"Written {nrows} rows to parquet {filename}" )
+    return nrows
+
+# write the results to a Feather (Arrow IPC) file
+# (the Arrow IPC file format needs a single dictionary per enum column so the batches are unified into one table first)
+def write_feather( results, filename, *, queryon=None, columns=None, urikey="$uri", batchsize=BATCHSIZE, compression="zstd" ):
+    _import_pyarrow()
+    import pyarrow.feather
+    table = results_to_arrow_table( results, queryon=queryon, columns=columns, urikey=urikey, batchsize=batchsize ).unify_dictionaries()
+    pyarrow.feather.write_feather( table, filename, compression=compression )
+    logger.info( f"Written {table.num_rows} rows to feather {filename}" )
+    return table.num_rows
+
+# write results to a file with the format decided by the file extension: .parquet, .feather/.arrow or .pkl (pickled pandas DataFrame)
+def write_columnar( results, filename, **kwargs ):
+    ext = os.path.splitext( filename )[1].lower()
+    if ext in ( ".parquet", ".pq" ):
+        return write_parquet( results, filename, **kwargs )
+    if ext in ( ".feather", ".arrow" ):
+        return write_feather( results, filename, **kwargs )
+    if ext in ( ".pkl", ".pickle" ):
+        for k in ( "compression", ):
+            kwargs.pop( k, None )
+        df = results_to_dataframe( results, **kwargs )
+        df.to_pickle( filename )
+        return len( df )
+    raise Exception( f"Unknown columnar output file type '{ext}' for {filename} - use .parquet, .feather, .arrow or .pkl" )
@@ -23,7 +23,6 @@ import sys
 import time
 import urllib3
 import webbrowser
-import concurrent.futures
 import zipfile
 
 import cryptography
@@ -33,6 +32,8 @@ import requests
 import urllib.parse
 
 from elmclient import __meta__
+from elmclient import columnar
+from elmclient import httpops
 from elmclient import rdfxml
 from elmclient import server
 from elmclient import utils
@@ -115,12 +116,18 @@ def do_oslc_query(inputargs=None):
     parser.add_argument('--pagesize', default=0, type=int, help="Page size for OSLC query (default 0) use 0 to suppress paging (server may still page)")
     parser.add_argument('--typesystemreport', default=None, help="Load the specified project/configuration and then produce a simple HTML type system report of resource shapes/properties/enumerations to this file" )
     parser.add_argument('--cachedays', default=7,type=int, help="The number of days for caching received data, default 7. To disable caching use -WW. To keep using a non-default cache period you must specify this value every time" )
-    parser.add_argument('--saverawresults', default=None, help="Save the raw results as XML to this path/file prefix - pages are numbered starting from 0000" )
+    parser.add_argument('--folderindex', default=None, help="Folder to save a DN folder index in - when re-run in the same component/configuration folders are found using the index (checked using ETags) instead of retrieving them all again" )
+    parser.add_argument('--typesnapshots', default=None, help="Folder to save typesystem snapshots in - when re-run in the same project/component/configuration the (fresh) snapshot is used instead of reloading the type system" )
+    parser.add_argument('--typesnapshotfreshness', default="etags", choices=["etags","shapes","none"], help="How a typesystem snapshot is checked before use: etags (default) checks every type definition is unchanged using ETags (a snapshot without ETags, e.g. for ETM, isn't used), shapes only checks the list of shapes, none doesn't check" )
+    parser.add_argument('--saverawresults', default=None, help="Save the raw results exactly as received to this path/file prefix - pages are numbered starting from 0000, and the file prefix+index.jsonl indexes the pages" )
+    parser.add_argument('--saverawcompress', action="store_true", help="For --saverawresults, gzip each saved page" )
     parser.add_argument('--saveprocessedresults', default=None, help="Save the processed results as JSON to this path/file" )
+    parser.add_argument('--columnaroutput', default=None, help="Save the results in columnar form typed using the type system - the format is decided by the extension .parquet, .feather/.arrow or .pkl (pandas DataFrame) - needs pyarrow (and pandas for .pkl) to be installed" )
     parser.add_argument('--percontribution', action="store_true", help="When querying a GC, query once for each app-domain contribution in the GC tree, with added component and configuration columns in the result")
+    parser.add_argument('--plaintextliterals', action="store_true", help="Output XML literal values (e.g. rich text like Primary Text) as plain text with all the markup removed")
     parser.add_argument('--cacheable', action="store_true", help="Query results can be cached - use when you know the data isn't changing and you need faster re-run")
     parser.add_argument('--crossproject', action="store_true", help="For --percontribution GC queries follow gc contributions to other projects and query those too (requires access permission of course)")
-    parser.add_argument('--threading', action="store_true", help="For --percontriubtion GC queries, use threading to parallelize queries with processing results UNTESTED")
+    parser.add_argument('--threading', action="store_true", help="For --percontribution GC queries, query up to 4 contributions in parallel")
 
     # saved credentials
     parser.add_argument('-0', '--savecreds', default=None, help="Save obfuscated credentials file for use with readcreds, then exit - this stores jazzurl, appstring, username and password")
@@ -467,6 +474,11 @@ def do_oslc_query(inputargs=None):
         if not app.has_typesystem:
             raise Exception( f"The {app.domain} application does not support application-level OSLC Queries - perhaps you meant to provide a project name using -p" )
 
+    if args.folderindex and hasattr(queryon,'enable_folder_index'):
+        queryon.enable_folder_index(args.folderindex)
+    if args.typesnapshots and hasattr(queryon,'enable_typesystem_snapshots'):
+        queryon.enable_typesystem_snapshots(args.typesnapshots,freshness=args.typesnapshotfreshness)
+
     #ensure type system is loaded, even if it won't be used
     queryon.load_types()
                                     
@@ -498,85 +510,31 @@ def do_oslc_query(inputargs=None):
     if args.outputfile and os.path.isfile(args.outputfile):
         os.remove(args.outputfile)
 
+    # capture the raw query results
+    rawcapture = httpops.RawCapture(args.saverawresults, compress=args.saverawcompress) if args.saverawresults else None
+
     if args.percontribution:
-        results = {}
-        futureresults = []
-        workers = 4 if args.threading else 1
-        def thread_fn(i,queryon,configuri):
-            print( f"Thread start {i}" )
-            queryon.set_local_config(configuri)
-            try:
-                thisresults = queryon.do_complex_query( args.resourcetype, querystring=args.query, searchterms=args.searchterms, select=args.select, isnulls=args.null, isnotnulls=args.value
-                            ,orderby=args.orderby
-                            ,show_progress=args.noprogressbar
-                            ,verbose=args.verbose
-                            ,maxresults=args.maxresults
-                            ,delaybetweenpages=args.delaybetweenpages
-                            ,pagesize=args.pagesize
-                            ,resolvenames = args.resolvenames
-                            ,totalize=args.totalize
-                            ,saverawresults=args.saverawresults
-                            ,addcolumns={'$contriburi':contriburi,'$compuri':compuri}
-                            ,cacheable=args.cacheable
-                            )
-            except KeyboardInterrupt:
-                raise Exception( "Control-c" )
-            print( f"Thread finish {i=}" )
-            return thisresults
-        with concurrent.futures.ThreadPoolExecutor(max_workers = workers) as executor:
-            # get all the contributions in this domain, and the component they're in - these will be added to the results
-            contribs = p.get_our_contributions(gcconfiguri)
-            for i,(contriburi,compuri) in enumerate(sorted(contribs,key=lambda v:v[0])):
-                print( f"{i+1}/{len(contribs)} {contriburi=} {compuri=}" )
-                # find the component in teh config
-                queryon = p.find_local_component(compuri)
-                if queryon is None:
-                    print( f"Component not found from {compuri}" )
-                    if args.crossproject:
-                        # this component isn't in our current project
-                        # try to create a component for it and add to current project
-                        queryon = p.add_external_component(compuri)
-                        if queryon is None:
-                            raise Exception( f"Can't add external component for {compuri}" )
-                        else:
-                            print( f"Added external component {queryon=} for {compuri}" )
-                    else:
-                        raise Exception( "Component {compuri} not found in current project - maybe you need to use --crossproject?" )
-                # check the comonent is accessible (may have been archived!)
-                if not app.is_accessible( compuri ):
-                    print( f"**** Archived component {compuri} !")
-                    continue
-                # check if the config is accessible (may have been archived!)
-                if not app.is_accessible( contriburi ):
-                    print( f"**** Archived configuration {contriburi} !")
-                    continue
-                if not args.threading:
-                    # work synchronously
-                    results.update(thread_fn(i,queryon,contriburi))
-                else:
-                    # get the results later
-                    futureresults.append(executor.submit(thread_fn,i,queryon,contriburi))
-            # now if working asynchronously retrieve the results
-            for res in futureresults:
-                results.update(res.result())
-        if False:
-            # set the config ready to do the query
-            queryon.set_local_config(contriburi)
-            # now do a query for each contribution
-            thisresults = queryon.do_complex_query( args.resourcetype, querystring=args.query, searchterms=args.searchterms, select=args.select, isnulls=args.null, isnotnulls=args.value
-                        ,orderby=args.orderby
+        # query each contribution to the gc in this app's domain - adds component and configuration columns to the results
+        results,errors = p.do_fanout_query( args.resourcetype, gcuri=gcconfiguri
+                        ,workers=4 if args.threading else 1
                         ,show_progress=args.noprogressbar
+                        ,crossproject=args.crossproject
+                        ,querystring=args.query, searchterms=args.searchterms, select=args.select, isnulls=args.null, isnotnulls=args.value
+                        ,orderby=args.orderby
                         ,verbose=args.verbose
                         ,maxresults=args.maxresults
                         ,delaybetweenpages=args.delaybetweenpages
                         ,pagesize=args.pagesize
                         ,resolvenames = args.resolvenames
                         ,totalize=args.totalize
-                        ,saverawresults=args.saverawresults
-                        ,addcolumns={'$contriburi':contriburi,'$compuri':compuri}
+                        ,saverawresults=rawcapture
                         ,cacheable=args.cacheable
+                        ,plaintextliterals=args.plaintextliterals
                         )
-            results.update(thisresults)
+        for configuri,error in errors.items():
+            print( f"**** Query failed/skipped for configuration {configuri}: {error}" )
+        if args.noprogressbar:
+            print( f"Fan-out query completed with {len(results)} results, {len(errors)} configuration(s) failed/skipped" )
     else:    
         # do the actual OSLC query
         results = queryon.do_complex_query( args.resourcetype, querystring=args.query, searchterms=args.searchterms, select=args.select, isnulls=args.null, isnotnulls=args.value
@@ -588,8 +546,9 @@ def do_oslc_query(inputargs=None):
                         ,pagesize=args.pagesize
                         ,resolvenames = args.resolvenames
                         ,totalize=args.totalize
-                        ,saverawresults=args.saverawresults
+                        ,saverawresults=rawcapture
                         ,cacheable=args.cacheable
+                        ,plaintextliterals=args.plaintextliterals
                         )
 
     if args.debugprint:
@@ -649,7 +608,7 @@ def do_oslc_query(inputargs=None):
     print( f"Query result has {len(results.keys())} {resultsentries}" )
 
     # COMPARE IS UNTESTED!
-    if args.outputfile or args.browser or args.compareresults:
+    if args.outputfile or args.browser or args.compareresults or args.columnaroutput:
         # write to CSV and/or compare with CSV
         # FIRST merge columns with same name - this merges types across components based on name
         # which is only need for queries in a GC. NOTE this doesn't attempt to use RDF URIs which it probably should :-o
@@ -697,6 +656,11 @@ def do_oslc_query(inputargs=None):
                 for k, v in results.items():
                     writer.writerow(v)
                     
+        if args.columnaroutput:
+            # produce a typed columnar file
+            nrows = columnar.write_columnar( results, args.columnaroutput, queryon=queryon, columns=fieldnames, urikey=None )
+            print( f"Written {nrows} rows to {args.columnaroutput}" )
+
         if args.browser:
             # produce an html file and also open it in your browser
             with open(args.browser, 'w', newline='', encoding='utf-8-sig') as htmlfile:
@@ -0,0 +1,71 @@
+##
+## © Copyright 2023- IBM Inc. All rights reserved
+# SPDX-License-Identifier: MIT
+##
+
+#######################################################################################################
+#
+# elmclient benchmark for post-processing OSLC query results - doesn't need a server
+#
+# builds a synthetic query result (by default up to 200k rows, 5 columns with list and non-list values which repeat
+# like enumerations/users/folders do) and times the post-processing (name resolution, list fixup, addcolumns and
+# isnull/isnotnull filtering) at several sizes, so you can check the time scales linearly with the number of rows
+#
+
+import argparse
+import time
+
+import elmclient.oslcqueryapi as oslcqueryapi
+
+# a stand-in for a project/component - the name resolution is in-process (the same number of distinct values
+# regardless of the number of rows) and counts how often it's called
+class _BenchmarkQuerier( oslcqueryapi._OSLCOperations_Mixin ):
+    def __init__( self ):
+        self.resolvecalls = 0
+
+    def resolve_uri_to_name( self, uri ):
+        self.resolvecalls += 1
+        if isinstance( uri, str ) and uri.startswith( "https://" ):
+            return uri.rsplit( "/", 1 )[-1].upper()
+        return uri
+
+def make_results( nrows, ndistinct=500 ):
+    results = {}
+    for i in range( nrows ):
+        row = {
+            'http://purl.org/dc/terms/identifier': str( i )
+            ,'http://purl.org/dc/terms/title': f"Artifact {i}"
+            ,'https://server/rm/types/status': f"https://server/rm/types/status/value{i%7}"
+            ,'http://purl.org/dc/terms/creator': f"https://server/jts/users/user{i%ndistinct}"
+        }
+        # every third row has a list of links, every fifth has a single (non-list) link, the rest have none
+        if i % 3 == 0:
+            row['https://server/rm/types/link'] = [ f"https://server/rm/resources/res{(i+j)%ndistinct}" for j in range( 3 ) ]
+        elif i % 5 == 0:
+            row['https://server/rm/types/link'] = f"https://server/rm/resources/res{i%ndistinct}"
+        results[f"https://server/rm/resources/artifact{i}"] = row
+    return results
+
+def main():
+    parser = argparse.ArgumentParser( description="Time the post-processing of a synthetic OSLC query result at several sizes" )
+    parser.add_argument( '-m', '--maxrows', type=int, default=200000, help='Largest number of rows (default 200000)' )
+    parser.add_argument( '-s', '--steps', type=int, default=4, help='Number of sizes - each is double the previous one, up to maxrows (default 4)' )
+    parser.add_argument( '-r', '--repeats', type=int, default=3, help='Repeat each size this many times and report the fastest (default 3)' )
+    args = parser.parse_args()
+
+    sizes = [ max( 1, args.maxrows // ( 2**n ) ) for n in reversed( range( args.steps ) ) ]
+    print( f"{'Rows':>10} {'Seconds':>10} {'us/row':>10} {'Resolves':>10} {'Kept':>10}" )
+    for nrows in sizes:
+        results = make_results( nrows )
+        best = None
+        for i in range( args.repeats ):
+            querier = _BenchmarkQuerier()
+            starttime = time.perf_counter()
+            mapped = querier._postprocess_results( results, addcolumns={'$project':'Benchmark'}, isnulls=['https://server/rm/types/missing'], isnotnulls=['http://purl.org/dc/terms/title'] )
+            elapsed = time.perf_counter() - starttime
+            if best is None or elapsed < best:
+                best = elapsed
+        print( f"{nrows:>10} {best:>10.3f} {best*1e6/nrows:>10.2f} {querier.resolvecalls:>10} {len(mapped):>10}" )
+
+if __name__ == '__main__':
+    main()
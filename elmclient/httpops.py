@@ -5,6 +5,7 @@
 
 
 import codecs
+import gzip
 import html.parser
 import http
 import inspect
@@ -217,6 +218,58 @@ class _FormParser(html.parser.HTMLParser):
             pass
 
 
+#################################################################################################
+
+# capture raw response bodies to disk exactly as received from the server - one file per response plus an index
+# files are named prefix followed by a four-digit sequence number starting from 0000 (plus .gz if compressed)
+# the index is prefix+"index.jsonl" (emptied when the instance is created, so it only describes this capture) with one JSON line per file giving the sequence number, filename, url, status, content type, etag, size and intent
+# the same instance can be used from several threads
+# pass an instance as rawcapture= to execute_get_rdf_xml (or as saverawresults= to an OSLC query)
+class RawCapture():
+    def __init__(self, prefix, *, compress=False):
+        self.prefix = prefix
+        self.compress = compress
+        self.indexfile = f"{prefix}index.jsonl"
+        self.n = 0
+        self._lock = threading.Lock()
+        folder = os.path.split(os.path.abspath(prefix))[0]
+        if not os.path.isdir( folder ):
+            os.makedirs( folder, exist_ok=True )
+        # start a new index - the numbered files from a previous capture with the same prefix are overwritten
+        open( self.indexfile, "wt", encoding="utf-8" ).close()
+
+    # write the body of the response, returns the filename
+    def capture(self, response, *, intent=None):
+        with self._lock:
+            # pages are numbered from 0000
+            seq = self.n
+            self.n += 1
+        filename = f"{self.prefix}{seq:04d}"
+        if self.compress:
+            filename += ".gz"
+            with gzip.open( filename, "wb" ) as f:
+                f.write( response.content )
+        else:
+            with open( filename, "wb" ) as f:
+                f.write( response.content )
+        entry = {
+                'seq': seq,
+                'file': os.path.basename(filename),
+                'url': response.url,
+                'status': response.status_code,
+                'content-type': response.headers.get('Content-Type'),
+                'etag': response.headers.get('ETag'),
+                'size': len(response.content),
+                'intent': intent,
+            }
+        with self._lock:
+            with open( self.indexfile, "at", encoding="utf-8" ) as f:
+                f.write( json.dumps(entry)+"\n" )
+        logger.info( f"Raw capture {filename} {entry}" )
+        return filename
+
+#################################################################################################
+
 class HttpOperations_Mixin():
     ############################################################################
     # methods for HTTP operations
@@ -234,7 +287,7 @@ class HttpOperations_Mixin():
 
     # this can also return a tuple including the etag if you will need it to update the artifact
     # handles response with a Link header to optionally accumulate the linked pages into one result, or to warn that there are Link headers
-    def execute_get_rdf_xml(self, reluri, *, params=None, headers=None, return_etag = False, return_headers=False, merge_linked_pages=False, warn_linked_pages=True, **kwargs):
+    def execute_get_rdf_xml(self, reluri, *, params=None, headers=None, return_etag = False, return_headers=False, merge_linked_pages=False, warn_linked_pages=True, rawcapture=None, **kwargs):
         if params is None:
             params = {}
         reqheaders = {'Accept': 'application/rdf+xml', 'OSLC-Core-Version': '2.0'}
@@ -242,6 +295,9 @@ class HttpOperations_Mixin():
             reqheaders.update(headers)
         request = self._get_get_request(reluri=reluri, params=params, headers=reqheaders)
         response = request.execute( **kwargs )
+        if rawcapture is not None:
+            # save exactly what the server sent
+            rawcapture.capture( response, intent=kwargs.get('intent') )
         result = ET.ElementTree(ET.fromstring(response.content))
         result_x = result.getroot()
         # check for Link header in response
@@ -260,8 +316,9 @@ class HttpOperations_Mixin():
                         break
                     nextpagerequest = self._get_get_request(reluri=nextpageurl, params=params, headers=reqheaders)
                     nextpageresponse = nextpagerequest.execute( **kwargs )
-                    nextpageresult = ET.ElementTree(ET.fromstring(response.content))
-                    nextpageresult_x = nextpageresult.getroot()
+                    if rawcapture is not None:
+                        rawcapture.capture( nextpageresponse, intent=kwargs.get('intent') )
+                    nextpageresult_x = ET.fromstring(nextpageresponse.content)
                     # merge these results into the main response
                     result_x.extend( list( nextpageresult_x ) )
                     nextpagelink = nextpageresponse.headers.get( "Link" )
@@ -357,6 +414,7 @@ class HttpOperations_Mixin():
 
         return result
 
+    # use stream=True to read large content in chunks using response.iter_content() rather than all in memory
     def execute_get_binary( self, reluri, *, params=None, headers=None, **kwargs):
         reqheaders = {}
         if headers is not None:
@@ -536,7 +594,8 @@ class HttpRequest():
         raise Exception('programming error this point should never be reached')
         
     # log a request/response, which may be the result of one or more redirections, so first log each of their request/response
-    def log_redirection_history( self, response, intent, action=None, donotlogbody=False ):
+    # if streamed is True the final response's content hasn't been read (it's being streamed by the caller) so isn't logged
+    def log_redirection_history( self, response, intent, action=None, donotlogbody=False, streamed=False ):
         thisintent = intent
         after = ""
         for i,r in enumerate(response.history):
@@ -545,7 +604,7 @@ class HttpRequest():
             logger.trace(f"\nWIRE: redir response ----- {r.status_code}\n\n{self._log_response(r)}")
             thisintent = 'Redirection of '+intent
         logger.trace( f"\nWIRE: request +++++ {response.request.method} {response.request.url}\n\n{self._log_request(response.request,intent=intent+after,donotlogbody=donotlogbody)}")
-        logger.trace(f"\nWIRE: response ----- {response.status_code}\n\n{self._log_response(response, action=action)}")
+        logger.trace(f"\nWIRE: response ----- {response.status_code}\n\n{self._log_response(response, action=action, streamed=streamed)}")
 
     # generate a string for logging of a http request with a stacktrace of the collers and showing URL, headers and any data
     def _log_request( self, request, donotlogbody=False, intent=None, action=None ):
@@ -628,7 +687,7 @@ class HttpRequest():
         return callers
 
     # generate a string for logging of a http response showing response code, headers and any data
-    def _log_response( self, response, action=None ):
+    def _log_response( self, response, action=None, streamed=False ):
         logtext = f"Response: {response.status_code}\n"
         # use the urllib3 cookiejar so Set-Cookie-s don't get folded into one single unparseable value by Requests
         # see https://github.com/psf/requests/issues/3957
@@ -637,7 +696,9 @@ class HttpRequest():
             logtext += "  " + c + ": " + v + "\n"
             
         # add the body
-        if response.content is not None:
+        if streamed:
+            logtext += "\n(streamed content not shown)\n\n"
+        elif response.content is not None:
             if len(response.content) > 1000000:
                 rawtext = "LONG LONG CONTENT..."
             else:
@@ -700,7 +761,8 @@ class HttpRequest():
     #  1. if the response indicates login is required then login and try the request again
     #  2. if request is rejected for various reasons retry with the CSRF header applied
     # supports Jazz Form authorization and Jazz Authorization Server login
-    def _execute_one_request_with_login( self, *, no_error_log=False, close=False, donotlogbody=False, retry_get_after_login=True, remove_headers=None, remove_parameters=None, intent=None, action = None, automaticlogin=True, showcurl=False, keepconfigurationcontextheader=False ):
+    # if stream is True the response content isn't read (so isn't logged) - the caller reads it, e.g. using response.iter_content()
+    def _execute_one_request_with_login( self, *, no_error_log=False, close=False, donotlogbody=False, retry_get_after_login=True, remove_headers=None, remove_parameters=None, intent=None, action = None, automaticlogin=True, showcurl=False, keepconfigurationcontextheader=False, stream=False ):
 #        if intent is None:
 #            raise Exception( "No intent provided!" )
         intent = intent or ""
@@ -767,9 +829,9 @@ class HttpRequest():
             # check for us using an appp password for this url (context root) and if so extend the User-Agent header 
             prepped.headers['User-Agent'] += addhdr
 
-            response = self._session.send( prepped )
+            response = self._session.send( prepped, stream=stream )
                                                  
-            self.log_redirection_history( response, intent=intent, action=action )
+            self.log_redirection_history( response, intent=intent, action=action, streamed=stream )
 
             response.raise_for_status()
 
@@ -869,8 +931,8 @@ class HttpRequest():
                 request.headers.update({'Cache-Control': 'no-cache'})
                 prepped = self._session.prepare_request(request)
                 prepped.headers['User-Agent'] += addhdr
-                response = self._session.send(prepped)
-                self.log_redirection_history( response, intent="RETRY AFTER AUTHENTICATION "+intent, action=action )
+                response = self._session.send(prepped, stream=stream)
+                self.log_redirection_history( response, intent="RETRY AFTER AUTHENTICATION "+intent, action=action, streamed=stream )
                 response.raise_for_status()
             except requests.HTTPError as e:
                 logger.error( f"Exception on retrying request. URL: {request.url}, {e.response.status_code}, {e.response.text}")
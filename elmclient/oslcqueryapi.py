@@ -6,12 +6,12 @@
 import copy
 import logging
 import re
+import threading
 import time
 import urllib
 
 import colorama
 import lark
-import lxml.etree as ET
 import tqdm
 
 from . import _queryparser
@@ -108,6 +108,7 @@ class _OSLCOperations_Mixin:
                         ,saverawresults=None
                         ,addcolumns=None
                         ,cacheable=False
+                        ,plaintextliterals=False
                      ):
         querystring = querystring or ''
         select = select or ''
@@ -137,6 +138,10 @@ class _OSLCOperations_Mixin:
             isnotnulls = [isnotnulls]
         searchterms = searchterms or []
 
+        if saverawresults and not isinstance(saverawresults, httpops.RawCapture):
+            # a path/file prefix - use one capture for all the queries so the files are numbered in sequence
+            saverawresults = httpops.RawCapture(saverawresults)
+
         if show_progress:
             print( "Preparing Query" )
 
@@ -187,102 +192,110 @@ class _OSLCOperations_Mixin:
         resultstack = self._evaluate_steps(querycapabilityuri,querysteps, select=parsedselect, prefixes=prefixes
                                             , orderbys=parsedorderby, searchterms=searchterms, show_progress=show_progress
                                             , verbose=verbose, maxresults=maxresults,delaybetweenpages=delaybetweenpages
-                                            , pagesize=pagesize, saverawresults=saverawresults, cacheable=cacheable)
+                                            , pagesize=pagesize, saverawresults=saverawresults, cacheable=cacheable
+                                            , plaintextliterals=plaintextliterals)
 
         if len(resultstack) != 1:
             raise Exception(f"Something went horribly wrong and there isn't exactly one result left on the query stack! {len(resultstack)} {resultstack}")
 
         # Now tidy up the results
         # in particular make sure type uris as column headers and values are turned into their more meaningful names
-        # go through the results, mapping attribute uris back to names
-        mappedresult = {}
-        originalresults = resultstack[0]
-        
-#        print( f"{len(originalresults)=}" )
-        
-        # add requested columns to each result
-        if len(addcolumns)>0:
-#            print( f"Adding columns {addcolumns}" )
-            for k in originalresults.keys():
-#                print( f"{k=}" )
-                for k1,v1 in addcolumns.items():
-#                    print( f"Adding {k1=} {v1=}" )
-                    originalresults[k][k1] = v1
-        remappednames = {}
+        mappedresult = self._postprocess_results( resultstack[0], uri_to_name_mapping=uri_to_name_mapping, addcolumns=addcolumns
+                                                    , resolvenames=resolvenames, totalize=totalize
+                                                    , isnulls=parsedisnulls, isnotnulls=parsedisnotnulls
+                                                    , show_progress=show_progress, verbose=verbose )
+
+        # all done!
+        if verbose:
+            print( f"Final results contains {len(mappedresult)} resources" )
+
+        return mappedresult
+
+    # post-process raw query results in a single pass:
+    #   add the addcolumns, map attribute uris (column names) and values to names, make sure list columns are lists in every row
+    #   (or their length if totalize), and remove rows which fail the isnulls/isnotnulls filters
+    # the work for each column (its output name, whether it's a list) is planned once per column, not once per row,
+    # and value->name resolution is remembered for the duration of this call because the same values (enums, users, folders...) repeat a lot
+    def _postprocess_results(self, originalresults, *, uri_to_name_mapping=None, addcolumns=None, resolvenames=True, totalize=False, isnulls=None, isnotnulls=None, show_progress=False, verbose=False ):
+        uri_to_name_mapping = uri_to_name_mapping or {}
+        addcolumns = addcolumns or {}
+        isnulls = isnulls or []
+        isnotnulls = isnotnulls or []
 
         if verbose:
             print( f"Original results are {len(originalresults)} resources" )
 
+        # find the list columns - a column is a list column if it has a list value in any row
+        rawlistcolumns = set()
+        for v in originalresults.values():
+            for kattr, vattr in v.items():
+                if isinstance(vattr, list):
+                    rawlistcolumns.add(kattr)
+        for k1,v1 in addcolumns.items():
+            if isinstance(v1, list):
+                rawlistcolumns.add(k1)
+
+        # column plans: raw attribute -> output column name
+        columnnames = {}
+        def plan_column(kattr):
+            if kattr in uri_to_name_mapping:
+                # this name was locally mapped while parsing the querystring
+                name = uri_to_name_mapping[kattr]
+            else:
+                name = self.resolve_uri_to_name(kattr) if resolvenames else kattr
+                if name is None:
+                    name = kattr
+            columnnames[kattr] = name
+            return name
+
+        # the output names of the list columns - these must be present (as a list, or its length if totalize) in every row
+        listcolumns = {}
+        for kattr in rawlistcolumns:
+            listcolumns[columnnames.get(kattr) or plan_column(kattr)] = True
+
+        # remember value->name resolutions
+        valuenames = {}
+        def resolve_value(value):
+            if not resolvenames:
+                return value
+            try:
+                return valuenames[value]
+            except KeyError:
+                result = self.resolve_uri_to_name(value)
+                valuenames[value] = result
+                return result
+            except TypeError:
+                # unhashable
+                return self.resolve_uri_to_name(value)
+
+        # the null filters are applied to the output names - resolve these once
+        isnullnames = [self.resolve_uri_to_name(isnull) for isnull in isnulls]
+        isnotnullnames = [self.resolve_uri_to_name(isnotnull) for isnotnull in isnotnulls]
+        logger.debug( f"{isnullnames=} {isnotnullnames=} {listcolumns=}" )
+
         if show_progress:
-            total = len(originalresults.items())
+            total = len(originalresults)
             pbar = tqdm.tqdm(initial=0, total=total,smoothing=1,unit=" results",desc="Processing       ")
-        listcolumns = []
-        # convert uris to human-friendly names
+
+        mappedresult = {}
+        nfiltered = 0
         for kuri, v in originalresults.items():
-            logger.info( f"post-processing result {kuri} {v}" )
-#            print( f"post-processing result {kuri} {v}" )
+            if addcolumns:
+                v = dict(v)
+                v.update(addcolumns)
             v1 = {}
             for kattr, vattr in v.items():
-                logger.info( f"{kattr=} {vattr=}" )
-                # first try to convert the value to a name
+                name = columnnames.get(kattr) or plan_column(kattr)
                 if isinstance(vattr, list):
-                    # detect list column
-                    if kattr not in listcolumns:
-                        # remember this column needs to be a list for all rows
-                        listcolumns.append(kattr)
-                    remappedvalue = []
-                    for lv in vattr:
-                        if resolvenames:
-                            remappedvalue.append(self.resolve_uri_to_name(lv))
-                        else:
-                            remappedvalue.append(lv)
+                    remappedvalue = [resolve_value(lv) for lv in vattr]
                 else:
-                    remappedvalue = self.resolve_uri_to_name(vattr) if resolvenames else vattr
-                # then check the attribute itself for one of the mappings we created while parsing the querystring to turn it into an oslc query
-                if kattr in uri_to_name_mapping:
-                    # this name was locally mapped
-                    v1[uri_to_name_mapping[kattr]] = remappedvalue
-                    # if a list column has been renamed, ensure the rename is recorded for later updates to listcolumns
-                    if kattr in listcolumns:
-#                            print( f"Totalizer replacing katter {kattr} with {remappedname}" )
-                        # remove the old name, add the new name
-                        listcolumns.remove(kattr)
-                        listcolumns.append(uri_to_name_mapping[kattr])
-                else:
-                    # try to map back to a name
-                    if kattr not in remappednames:
-                        remappedname = self.resolve_uri_to_name(kattr) if resolvenames else kattr
-                        remappednames[kattr] = remappedname
-                        # if a list column has been renamed, ensure the rename is recorded for later updates to listcolumns
-                        if kattr in listcolumns:
-#                            print( f"Totalizer replacing katter {kattr} with {remappedname}" )
-                            # remove the old name, add the new name
-                            listcolumns.remove(kattr)
-                            listcolumns.append(remappedname)
-                        
-                    if remappednames[kattr] is not None:
-                        v1[remappednames[kattr]] = remappedvalue
-                    else:
-                        v1[kattr] = remappedvalue
-            logger.info( f"> produced {kuri} {v1}" )
-#            print( f"> produced {kuri} {v1}" )
-            mappedresult[kuri] = v1
+                    remappedvalue = resolve_value(vattr)
+                v1[name] = remappedvalue
 
-            if show_progress:
-                pbar.update(1)
-#        print( f"{len(mappedresult)=}" )
-                
-        # if showing progress and pbar has been created (after the first set of results if paged)
-        if show_progress and pbar is not None:
-            # close off the progress bar
-            pbar.close()
-            print( "Processing completed" )
-            
-        # fixup the list columns to ensure all rows are lists even if column is empty or a single (non-list) entry
-        # and if totalize then convert to length of the list
-        for k,v in mappedresult.items():
+            # fixup the list columns to ensure all rows are lists even if column is empty or a single (non-list) entry
+            # and if totalize then convert to length of the list
             for tot in listcolumns:
-                vattr = v.get(tot)
+                vattr = v1.get(tot)
                 if not vattr:
                     # nothing in the column, convert to empty list
                     newv = []
@@ -291,42 +304,27 @@ class _OSLCOperations_Mixin:
                     newv = [vattr]
                 else:
                     newv = vattr
-                v[tot]=len(newv) if totalize else newv
-
-        if parsedisnulls or parsedisnotnulls:
-            logger.debug( f"{isnulls=} {isnotnulls=}" )
-            # now filter for isnulls and isnotnulls
-            todeletes = []
-            for kuri in list(mappedresult.keys()):
-                for isnull in parsedisnulls:
-                    # lookup the isnull URI to a name (as used in the results)
-                    lookupname = self.resolve_uri_to_name(isnull)
-                    lookupname = self.resolve_uri_to_name(isnull)
-                    v = mappedresult[kuri].get(lookupname,None)
-                    if v:
-                        # if v is not None or v is not an empty list, it's not null so must be removed
-                        todeletes.append(kuri)
-                        kuri = None
-                        break
-                if kuri is not None:
-                    for isnotnull in parsedisnotnulls:
-                        # lookup the isnotnull URI to a name (as used in the results)
-                        lookupname = self.resolve_uri_to_name(isnotnull)
-                        v = mappedresult[kuri].get(lookupname,None)
-                        if not v:
-                            # if v is None or v is an empty list, it's null so must be removed
-                            todeletes.append(kuri)
-                            break
-            for kuri in todeletes:
-                if kuri in mappedresult.keys():
-                    del mappedresult[kuri]
-
-            if verbose:
-                print( f"Without null/notnulls there are {len(mappedresult)} resources" )
+                v1[tot] = len(newv) if totalize else newv
 
-        # all done!
-        if verbose:
-            print( f"Final results contains {len(mappedresult)} resources" )
+            if show_progress:
+                pbar.update(1)
+
+            # filter for isnulls (value must be None or empty) and isnotnulls (value must not be None or empty)
+            if any( v1.get(lookupname) for lookupname in isnullnames ) or not all( v1.get(lookupname) for lookupname in isnotnullnames ):
+                nfiltered += 1
+                continue
+
+            mappedresult[kuri] = v1
+
+        # if showing progress and pbar has been created (after the first set of results if paged)
+        if show_progress:
+            # close off the progress bar
+            pbar.close()
+            print( "Processing completed" )
+
+        logger.info( f"Post-processed {len(originalresults)} results to {len(mappedresult)} with {len(columnnames)} columns {len(valuenames)} distinct values {nfiltered} filtered out" )
+        if verbose and ( isnulls or isnotnulls ):
+            print( f"Without null/notnulls there are {len(mappedresult)} resources" )
 
         return mappedresult
 
@@ -337,7 +335,7 @@ class _OSLCOperations_Mixin:
 
     # for a query which has been parsed to steps, execute the steps, recursing if there is more than one compount_term
     # a query with two logicalor terms looks like: [[['dcterms:identifier', 'in', [3949]]], [['dcterms:identifier', 'in', [3950]]], 'logicalor']
-    def _evaluate_steps(self, querycapabilityuri,querysteps,*,resultstack=None, select=None, prefixes=None, orderbys=None, searchterms=None, show_progress=False, verbose=False, maxresults=None, delaybetweenpages=0.0, pagesize=200, saverawresults=None, cacheable=False):
+    def _evaluate_steps(self, querycapabilityuri,querysteps,*,resultstack=None, select=None, prefixes=None, orderbys=None, searchterms=None, show_progress=False, verbose=False, maxresults=None, delaybetweenpages=0.0, pagesize=200, saverawresults=None, cacheable=False, plaintextliterals=False):
         logger.info( f"_evaluate_steps {querysteps}" )
         resultstack = resultstack if resultstack is not None else []
         orderbys = orderbys or []
@@ -355,11 +353,11 @@ class _OSLCOperations_Mixin:
                 if len(step)>0 and isinstance(step[0],list):
                     # handle anded terms
                     # iterate, recursing
-                    resultstack = self._evaluate_steps( querycapabilityuri,step,resultstack=resultstack, select=select, prefixes=prefixes, orderbys=orderbys, searchterms=searchterms, show_progress=show_progress, verbose=verbose, maxresults=maxresults, delaybetweenpages=delaybetweenpages)
+                    resultstack = self._evaluate_steps( querycapabilityuri,step,resultstack=resultstack, select=select, prefixes=prefixes, orderbys=orderbys, searchterms=searchterms, show_progress=show_progress, verbose=verbose, maxresults=maxresults, delaybetweenpages=delaybetweenpages, plaintextliterals=plaintextliterals)
 #                    raise Exception( f"Very strange parse result! {step}" )
                 else:
                     # do an actual query
-                    results = self.execute_oslc_query(querycapabilityuri,whereterms=[step], select=select, prefixes=prefixes, orderbys=orderbys, searchterms=searchterms, show_progress=show_progress, maxresults=maxresults, delaybetweenpages=delaybetweenpages, pagesize=pagesize, verbose=verbose, saverawresults=saverawresults, cacheable=cacheable, intent="Perform OSLC Query")
+                    results = self.execute_oslc_query(querycapabilityuri,whereterms=[step], select=select, prefixes=prefixes, orderbys=orderbys, searchterms=searchterms, show_progress=show_progress, maxresults=maxresults, delaybetweenpages=delaybetweenpages, pagesize=pagesize, verbose=verbose, saverawresults=saverawresults, cacheable=cacheable, intent="Perform OSLC Query", plaintextliterals=plaintextliterals)
                     if isinstance(results, list):
                         resultlist = {}
                         for result in results:
@@ -438,7 +436,7 @@ class _OSLCOperations_Mixin:
     # the whereterms can be created using create_query_operator_string
     # NOTE that prefixes is reversed from what you might expect, i.e. keyed by URL and the value is the prefix!
     # NOTE that whereterms should be a list of lists (the oslc terms) - each of these nested lists is ['attribute',operator',value'] - if more than one and'd term, the first entry must be 'and'!
-    def execute_oslc_query(self, querycapabilityuri, *, whereterms=None, select=None, prefixes=None, orderbys=None, searchterms=None, show_progress=False, verbose=False, maxresults=None, delaybetweenpages=0.0, pagesize=200, intent=None, saverawresults=None, cacheable=False):
+    def execute_oslc_query(self, querycapabilityuri, *, whereterms=None, select=None, prefixes=None, orderbys=None, searchterms=None, show_progress=False, verbose=False, maxresults=None, delaybetweenpages=0.0, pagesize=200, intent=None, saverawresults=None, cacheable=False, plaintextliterals=False):
         if select is None:
             select = []
         prefixes = prefixes or {}
@@ -459,7 +457,7 @@ class _OSLCOperations_Mixin:
         # crude way to keep the Configuration-Context header for a reqif query, because this header is required if GCM isn't installed!
         isreqifquery = "reqif" in querycapabilityuri
 
-        results = self._execute_vanilla_oslc_query(querycapabilityuri,query_params1, select=select, prefixes=prefixes, show_progress=show_progress, verbose=verbose, maxresults=maxresults, delaybetweenpages=delaybetweenpages, pagesize=pagesize, intent=intent, saverawresults=saverawresults, cacheable=cacheable, isreqifquery=isreqifquery )
+        results = self._execute_vanilla_oslc_query(querycapabilityuri,query_params1, select=select, prefixes=prefixes, show_progress=show_progress, verbose=verbose, maxresults=maxresults, delaybetweenpages=delaybetweenpages, pagesize=pagesize, intent=intent, saverawresults=saverawresults, cacheable=cacheable, isreqifquery=isreqifquery, plaintextliterals=plaintextliterals )
         return results
 
     # convert whereterms (which is a list of OSLC and terms) into a corresponding oslc.where string
@@ -566,12 +564,15 @@ class _OSLCOperations_Mixin:
     # select is used to build the returned dictionary containing only the selected values
     #
 
-    def _execute_vanilla_oslc_query(self, querycapabilityuri, query_params, orderby=None, searchterms=None, select=None, prefixes=None, show_progress=False, pagesize=200, verbose=False, maxresults=None, delaybetweenpages=0.0, intent=None,saverawresults=None, cacheable=False, isreqifquery=False ):
+    def _execute_vanilla_oslc_query(self, querycapabilityuri, query_params, orderby=None, searchterms=None, select=None, prefixes=None, show_progress=False, pagesize=200, verbose=False, maxresults=None, delaybetweenpages=0.0, intent=None,saverawresults=None, cacheable=False, isreqifquery=False, plaintextliterals=False ):
         select = select or []
         orderby = orderby or []
         searchterms = searchterms or []
         prefixes = prefixes or {}
         logger.debug( f"{prefixes=}" )
+        if saverawresults and not isinstance(saverawresults, httpops.RawCapture):
+            # a path/file prefix
+            saverawresults = httpops.RawCapture(saverawresults)
         
         headers = {}
 
@@ -635,11 +636,9 @@ class _OSLCOperations_Mixin:
                 intent = f"Retrieve {utils.nth(page)} page of OSLC query results"
 
             # request this page
-            this_result_xml = self.execute_get_rdf_xml(query_url, params=params, headers=headers, cacheable=cacheable, intent=intent, showcurl=verbose, keepconfigurationcontextheader=isreqifquery)
+            # if saving raw results the bytes received are written as they arrive and only parsed once
+            this_result_xml = self.execute_get_rdf_xml(query_url, params=params, headers=headers, cacheable=cacheable, intent=intent, showcurl=verbose, keepconfigurationcontextheader=isreqifquery, rawcapture=saverawresults)
             queryurls.append(query_url)
-            
-            if saverawresults:
-                open( f"{saverawresults}{page:04d}" ,'wb').write(ET.tostring(this_result_xml))
 
             # accumulate the results
             result_xmls.append(this_result_xml)
@@ -703,7 +702,8 @@ class _OSLCOperations_Mixin:
                 donelasttime = donesofar
 
             # check for any keypresses - user can abort by pressing escape key
-            while kbhit():
+            # (only on the main thread - e.g. the queries of a fan-out query run in worker threads which mustn't fight over the terminal)
+            while threading.current_thread() is threading.main_thread() and kbhit():
                 ch = getch()
                 if ch == b'\x1b':
                     print("\nUser pressed escape, terminating query with current results")
@@ -858,11 +858,8 @@ class _OSLCOperations_Mixin:
                             # print( f"no subs {len(ent)} {ent.tag=} {ent.text=}")
                             # no children, just use the text if not empty or the resource URL
                             if len(ent)>0 and rdfxml.xmlrdf_get_resource_uri(ent,attrib="rdf:parseType") == "Literal":
-                                # get the XML literal value by converting the whole ent to a string and then strip off the start/end tags!
-                                # (shouldn't there be a less hacky way of doing this?)
-                                literal = ET.tostring(ent).decode()
-                                value = literal[literal.index('>')+1:literal.rindex('<')]
-                                logger.info( f"0 {value=}" )
+                                # get the XML literal value as markup, or if requested as plain text
+                                value = rdfxml.xml_literal_text(ent) if plaintextliterals else rdfxml.xml_literal_content(ent)
                             elif ent.text is None or not ent.text.strip():
                                 # no text, try the resource URI
                                 value = ent.get("{http://www.w3.org/1999/02/22-rdf-syntax-ns#}resource")
@@ -200,6 +200,21 @@ def xmlrdf_get_resource_text(xml, xpath, prefix_map=RDF_DEFAULT_PREFIX, exceptio
         raise Exception( f"xmlrdf_get_resource_text no text found for {xpath}" )
     return None
 
+# return the content of an rdf:parseType="Literal" element as markup, i.e. without the element's own start/end tags
+# serialised to (ASCII) bytes and decoded so non-ASCII characters stay as character references e.g. &#233; exactly as before
+# (serialising each child separately would add the in-scope namespace declarations to every child)
+def xml_literal_content(el):
+    literal = ET.tostring(el, with_tail=False).decode()
+    start = literal.index('>')+1
+    if literal[start-2] == '/':
+        # empty element <tag/>
+        return ""
+    return literal[start:literal.rindex('<')]
+
+# return the content of an rdf:parseType="Literal" element as plain text, i.e. with all markup removed
+def xml_literal_text(el):
+    return ET.tostring(el, method="text", encoding="unicode", with_tail=False)
+
 
 # The term "tag" usually refers to an ElementTree-style tag "{ns}id"
 # The term "prefixed tag" refers to an XML namespaced tag like "ns:id"
@@ -21,9 +21,11 @@ import logging
 import os
 import pprint
 import sys
+import threading
+import time
 import urllib
 
-import tqdm
+import requests
 
 pp = pprint.PrettyPrinter(indent=4)
 
@@ -34,6 +36,47 @@ from elmclient import rdfxml
 from elmclient import server
 from elmclient import _typesystem
 
+logger = logging.getLogger(__name__)
+
+# max number of parallel GETs in resourceFactory_many
+RESOURCE_LOAD_WORKERS = 8
+
+# max number of parallel PUTs in put_resources, and the number of times an update is retried after a conflict or being throttled
+RESOURCE_UPDATE_WORKERS = 4
+RESOURCE_UPDATE_RETRIES = 3
+
+# adaptive rate limiting shared by the threads doing updates - each request waits for the current delay after the previous one started;
+# the delay doubles (or is set from Retry-After) when the server says it's overloaded and reduces again as requests succeed
+class _Throttle( object ):
+    def __init__( self, mindelay=0.0, maxdelay=30.0 ):
+        self.mindelay = mindelay
+        self.maxdelay = maxdelay
+        self.delay = mindelay
+        self.nextstart = 0
+        self.lock = threading.Lock()
+
+    def wait( self ):
+        with self.lock:
+            now = time.monotonic()
+            start = max( now, self.nextstart )
+            self.nextstart = start + self.delay
+        if start > now:
+            time.sleep( start-now )
+
+    def succeeded( self ):
+        with self.lock:
+            self.delay = self.delay*0.75 if self.delay*0.75 > 0.05 else self.mindelay
+
+    def overloaded( self, retryafter=None ):
+        with self.lock:
+            self.delay = min( self.maxdelay, max( self.delay*2, 0.5 ) )
+            if retryafter:
+                self.nextstart = max( self.nextstart, time.monotonic()+retryafter )
+            logger.info( f"Throttling updates {self.delay=}" )
+
+# marks an attribute deleted in the recorded changes of an update
+_DELETED = object()
+
 # formats for properties
 XMLLITERAL = "XMLLITERAL"
 RDFRESOURCE = "RDFRESOURCE"
@@ -42,7 +85,11 @@ TEXT = "TEXT"
 # These encode/decode between an RDF value and the corresponding Python representation
 # inherited classes implement just encoder() and decoder()
 # so the generic encode and decode cna apply the same logging (or not) to all codecs
+# there's one codec instance for each shape/property in a project/component (see Type_System_Mixin.get_attribute_schema)
 class Codec( object ):
+    # a codec whose decode of an rdf:resource needs a remote lookup and gives a value which doesn't change in a configuration sets
+    # memoise True so the value for each uri is only decoded once per configuration (use cacheddecode), and implements prefetch
+    memoise = False
     def __init__( self, projorcomp, shape_u, prop_u ):
 #        print( "Init Codec {self=}" )
         self.projorcomp = projorcomp
@@ -51,6 +98,23 @@ class Codec( object ):
         self.rdf_resource_tag = f"{{http://www.w3.org/1999/02/22-rdf-syntax-ns#}}resource"
         self.parse_type_tag = f"{{http://www.w3.org/1999/02/22-rdf-syntax-ns#}}parseType"
         self.datatype_tag = f"{{http://www.w3.org/1999/02/22-rdf-syntax-ns#}}datatype"
+        self._memo = {} # keyed by ( local config, uri ), the decoded value
+        pass
+
+    def _memokey( self, uri ):
+        return ( getattr( self.projorcomp, 'local_config', None ), uri )
+
+    def cacheddecode( self, rdfvalue_x ):
+        uri = rdfvalue_x.get( self.rdf_resource_tag ) if self.memoise else None
+        if uri is None:
+            return self.decode( rdfvalue_x )
+        key = self._memokey( uri )
+        if key not in self._memo:
+            self._memo[key] = self.decode( rdfvalue_x )
+        return self._memo[key]
+
+    # do the remote lookups for decoding many uris in bulk (in parallel) so cacheddecode doesn't have to do them one at a time
+    def prefetch( self, uris ):
         pass
         
     def encode( self, pythonvalue, debug=False ):
@@ -78,9 +142,7 @@ class XMLLiteralCodec( Codec ):
         newel_x = ET.Element( thetag, { self.parse_type_tag: 'Literal'} )
         return newel_x
     def decoder( self, x ):
-        # surely there should be a less hacky way of getting the literal content?
-        literal = ET.tostring(x).decode()
-        pythonvalue = literal[literal.index('>')+1:literal.rindex('<')]
+        pythonvalue = rdfxml.xml_literal_content( x )
         return pythonvalue
         
 class StringLiteralCodec( Codec ):
@@ -105,9 +167,7 @@ class StringLiteralCodec( Codec ):
 
     def decode( self, rdfvalue_x, debug=False ):
         # default decoding is string
-        # surely there should be a less hacky way of getting the literal content?
-        literal = ET.tostring(rdfvalue_x).decode()
-        pythonvalue = literal[literal.index('>')+1:literal.rindex('<')]
+        pythonvalue = rdfxml.xml_literal_content( rdfvalue_x )
 #        print( f"StringLiteralCodec Decode {rdfvalue_x=} {pythonvalue=} {ET.tostring( rdfvalue_x )}" )
         return pythonvalue
     
@@ -135,6 +195,11 @@ class ComponentCodec( RDFResourceCodec ):
         newel_x = ET.Element( thetag, { self.rdf_resource_tag: pythonvalue } )
 #        print( f"{newel_x=} {ET.tostring( newel_x )}" )
         return newel_x
+    memoise = True
+    def prefetch( self, uris ):
+        # retrieve the components into the type cache in parallel
+        self.projorcomp._prefetch_typeuris( [uri for uri in uris if self._memokey( uri ) not in self._memo] )
+
     def decode( self, rdfvalue_x ):
         comp_u = super().decode( rdfvalue_x )
         # get the component to get its name
@@ -258,6 +323,40 @@ class Resource( object ):
     def __init__( self ):
         self.__lockdown_unmodifiables = False # unmodifiables get locked once the object initialisation from RDF has completed
         self._attribute_to_propuri={}
+        self._undecoded = {} # for a lazy resource, keyed by attribute name the ( codec, [rdf elements] ) not yet decoded
+        self._lazy = False
+
+    # for a lazy resource (see resourceFactory) an attribute is decoded from the rdf when it's first used
+    def __getattr__( self, name ):
+        if not name.startswith( "_" ):
+            undecoded = self.__dict__.get( '_undecoded' )
+            if undecoded and name in undecoded:
+                codec, elements = undecoded.pop( name )
+                values = [codec.cacheddecode( el ) for el in elements]
+                value = values[0] if len( values )==1 else values
+                # (decoding isn't a modification)
+                super().__setattr__( name, value )
+                return value
+        raise AttributeError( f"'{type(self).__name__}' object has no attribute '{name}'" )
+
+    # deleting a property records it as modified so the update (see put/put_resources) removes it
+    def __delattr__( self, name ):
+        undecoded = self.__dict__.get( '_undecoded' )
+        if not name.startswith( "_" ) and name in self.__dict__.get( '_attribute_to_propuri', {} ) and ( name in self.__dict__ or ( undecoded and name in undecoded ) ):
+            if not hasattr( self, "_modifieds" ):
+                self._modifieds = []
+            if name not in self._modifieds:
+                self._modifieds.append( name )
+        if undecoded and name in undecoded:
+            del undecoded[name]
+            if name not in self.__dict__:
+                return
+        super().__delattr__( name )
+
+    # decode all the attributes not yet decoded
+    def _decode_all( self ):
+        for name in list( self._undecoded.keys() ):
+            getattr( self, name )
         
     def __setattr__( self, name, value ):
 #        print( f"setattr {self=} {name=} {value=}" )
@@ -273,58 +372,41 @@ class Resource( object ):
             # find the property definition if it is already known
             if name not in self._attribute_to_propuri:
                 # need to check if this name is in the type/shape as a property or is in the component's linktypes (which are available for all types, subject to Link Constraints which aren't handled!)
-                
-                # check properties of this shape
-#                print( f"{self._shape_u=}" )
-#                print( f"{self._projorcomp.shapes[self._shape_u]=}" )
-#                for p in self._projorcomp.shapes[self._shape_u]['properties']:
-#                    print( f"{p=} {self._projorcomp.properties[p]['name']=}" )
-                    
-                prop_u = next((c2 for c2 in self._projorcomp.shapes[self._shape_u]['properties'] if ( self._projorcomp.properties[c2]['name'] == name ) or ( self._projorcomp.properties[c2].get('safeName',"" ) == name ) ), None)
-#                print( f"{prop_u=} {self._projorcomp.properties[prop_u]=}" )
-                if prop_u:
-                    prop = self._projorcomp.properties[prop_u]
-                else:
-                    # check linktypes
-    #                print( f"{self._projorcomp.linktypes=}" )
-                    lt = next((c2 for c2 in self._projorcomp.linktypes.keys() if ( self._projorcomp.linktypes[c2]['name'] == name ) or ( self._projorcomp.linktypes[c2].get('safeName',"" ) == name ) ), None)
-    #                print( f"{lt=}" )
-                    if lt:
-                        prop_u = lt
-                        prop = self._projorcomp.linktypes[ lt ]
-                    else:
-                        raise Exception( f"{name} isn't a property or linktype!" )
+                # - uses the compiled schema for the shape rather than scanning
+                attr = self._projorcomp.get_shape_schema( self._shape_u ).get( name )
+#                print( f"{attr=}" )
+                if attr is None:
+                    raise Exception( f"{name} isn't a property or linktype!" )
+                prop_u = attr['uri']
             else:
                 prop_u = self._attribute_to_propuri[ name ]
 #                print( f"{prop_u=}" )
+                attr = self._projorcomp.get_attribute_schema( self._shape_u, prop_u )
+#            print( f"{attr=}" )
             
-                prop = self._projorcomp.properties[prop_u]
-#            print( f"{prop=}" )
-            
-            if self.__lockdown_unmodifiables and prop['typeCodec'] is not None:
+            if self.__lockdown_unmodifiables and attr['codec'] is not None:
                 # if locked down, must be user code assigning value so check it
-                thiscodec = prop['typeCodec']( self._projorcomp, self._shape_u, prop_u )
-                thiscodec.checkonassignment( value )
+                attr['codec'].checkonassignment( value )
                 
-            if prop.get('enums'):
+            if attr['enumnames'] is not None:
                 # an enum
                 if type( value )==list:
                     if len( value )>1:
                         # check that the enum is multivalued
-                        if not prop['isMultiValued']:
+                        if not attr['isMultiValued']:
                             raise Exception( f"Property {name} is not multivalued but you tried to set it to a list with more than one element '{value}'" )
                         checkvalues = value
                 else:
                     checkvalues = [value]
                     
                 # check the values are in the enum and aren't repeated!
-                checkeds = []
+                checkeds = set()
                 for val in checkvalues:
-                    if val not in self._projorcomp.get_enum_names( prop_u ):
+                    if val not in attr['enumnames']:
                         raise Exception( f"Property {name} enum value '{val}' not a valid enumeration name - allwoed values are '{self._projorcomp.get_enum_names( prop_u )}'" )
                     if val in checkeds:
                         raise Exception( f"Property {name} value {val} appears more than once in {checkvalues}" )
-                    checkeds.append( val )
+                    checkeds.add( val )
                     
             if not hasattr( self, name  ) or value != getattr( self, name ):
                 if not hasattr( self, "_modifieds" ):
@@ -347,7 +429,7 @@ class Resource( object ):
         # do the PUT
         result = self._projorcomp.execute_post_rdf_xml( self._url, data=new_x, headers={'If-Match':self._etag}, intent="Update the artifact", put=True )
         # update myself from the rdf
-        result = self._projorcomp.resourceFactory( self._url, self._projorcomp, existingresource=self )
+        result = self._projorcomp.resourceFactory( self._url, self._projorcomp, existingresource=self, lazy=self._lazy )
         return result
         
     def to_etree( self ):
@@ -382,7 +464,7 @@ class Resource( object ):
                     newvalues = [newvalues]
                 for newvalue in newvalues:
 #                    print( f"{newvalue=} {prop=} {shape_u=} {taguri=}" )
-                    thiscodec = prop['typeCodec']( self._projorcomp, shape_u, taguri )
+                    thiscodec = self._projorcomp.get_attribute_schema( shape_u, taguri, prop )['codec']
 #                    print( f"{thiscodec=}" )
                     newel_x = thiscodec.encode( newvalue )
                     # add this to the rawrdf
@@ -408,6 +490,7 @@ class Resource( object ):
     # prints attributes that don't start with _ grouped by unmodifiable/modifiable
     def __repr__( self ):
 #        print( "repr" )
+        self._decode_all()
         modifiablelines = [f"{k}: {self.__dict__[k]}" for k in sorted(self.__dict__.keys()) if not k.startswith( "_" ) and not k in self._projorcomp.unmodifiables ]
         unmodifiablelines = [f"{k}: {self.__dict__[k]}" for k in sorted(self.__dict__.keys()) if not k.startswith( "_" ) and k in self._projorcomp.unmodifiables]
         result = f"\n  Id={self.Identifier} {self.oslc_instanceShape} {self._url}\n  Unmodifiable:\n    "+"\n    ".join( unmodifiablelines )+"\n  Modifiable:\n    "+"\n    ".join( modifiablelines )+"\n"
@@ -510,24 +593,206 @@ class Resources_Mixin:
                      )
 #        print( f"{len(results)=}" )
         resources=[]
-        if verbose:
-            pbar = tqdm.tqdm(initial=0, total=len(results),smoothing=1,unit=" results",desc="Converting to resources")
-            
-        for r in results:
-            resources.append( self.resourceFactory( r, self ) )
-            if verbose:
-                pbar.update(1)
+        for r,res in self.resourceFactory_many( results, self, verbose=verbose ).items():
+            if isinstance( res, Exception ):
+                raise res
+            resources.append( res )
 
-        if verbose:
-            pbar.close()
-            
         return resources
                         
+    # update many modified resources, using up to workers parallel PUTs with adaptive rate limiting (backing off if the server returns 429 or 503)
+    # if a resource has been changed on the server since it was retrieved (412 Precondition Failed) it's retrieved again, the modifications
+    # made to it are applied again and the update retried (up to maxretries times). After updating, the resource's etag is updated.
+    # returns a dictionary keyed by resource url of "updated", "unchanged" (nothing modified so no PUT), or the exception if the update failed
+    def put_resources( self, resources, *, workers=None, maxretries=RESOURCE_UPDATE_RETRIES, verbose=True ):
+        byurl = { res._url: res for res in resources }
+        throttle = _Throttle()
+        # rebuilding a resource updates the typesystem's caches so is done one at a time
+        rebuildlock = threading.Lock()
+        def update( url ):
+            res = byurl[url]
+            if not getattr( res, '_modifieds', None ):
+                return "unchanged"
+            # record the changes so they can be applied again if the resource has to be retrieved again
+            changes = [ ( name, getattr( res, name ) if hasattr( res, name ) else _DELETED ) for name in res._modifieds ]
+            for attempt in range( maxretries+1 ):
+                throttle.wait()
+                try:
+                    response = res._projorcomp.execute_post_rdf_xml( res._url, data=res.to_etree(), headers={'If-Match':res._etag}, intent="Update the artifact", put=True )
+                except requests.HTTPError as e:
+                    status = e.response.status_code if e.response is not None else None
+                    if attempt >= maxretries or status not in ( 412, 429, 503 ):
+                        raise
+                    if status == 412:
+                        logger.info( f"Update of {url} conflicted - retrieving again and reapplying {[name for name,value in changes]}" )
+                        xml, etag = res._projorcomp.execute_get_rdf_xml( url, return_etag=True, cacheable=False, intent="Retrieve the artifact again after an update conflict" )
+                        with rebuildlock:
+                            self._resource_from_xml( url, res._projorcomp, xml, etag, existingresource=res, lazy=res._lazy )
+                            for name,value in changes:
+                                if value is _DELETED:
+                                    if hasattr( res, name ):
+                                        delattr( res, name )
+                                else:
+                                    setattr( res, name, value )
+                    else:
+                        retryafter = e.response.headers.get( 'Retry-After' )
+                        throttle.overloaded( float( retryafter ) if retryafter and retryafter.isdigit() else None )
+                    continue
+                throttle.succeeded()
+                res._etag = response.headers.get( 'ETag', res._etag )
+                res._modifieds = []
+                return "updated"
+        results = self._get_concurrently( update, byurl.keys(), workers=workers or RESOURCE_UPDATE_WORKERS, verbose=verbose, desc="Updating resources" )
+        logger.info( f"put_resources {len(results)} resources {sum(1 for r in results.values() if r=='updated')} updated {sum(1 for r in results.values() if isinstance( r, Exception ))} failed" )
+        return results
+
+    # find the link type uri for a link type name (from the typesystem), prefixed tag (e.g. oslc_qm:validatesRequirement) or uri
+    def _link_type_uri( self, linktype ):
+        if linktype.startswith( "http://" ) or linktype.startswith( "https://" ):
+            return linktype
+        if ':' in linktype and ' ' not in linktype and linktype.split( ':', 1 )[0] in rdfxml.RDF_DEFAULT_PREFIX:
+            return rdfxml.tag_to_uri( linktype )
+        self.load_types()
+        result = self.get_linktype_uri( linktype )
+        if result is None:
+            raise Exception( f"Link type {linktype} not found" )
+        return result
+
+    # create/remove many links, each entry of links being a tuple (source url, link type, target url) to add a link, or
+    # (source url, link type, target url, action) where action is "add" or "remove"; the link type is a link type name, prefixed tag or uri
+    # the links are grouped by source, and each source is updated with all its links in one GET-modify-PUT, doing up to workers sources in parallel
+    # if the source was changed since it was retrieved (412 Precondition Failed) it's retrieved and modified again (up to maxretries times); 429/503 responses slow
+    # down the updates as for put_resources.
+    # if dryrun is True nothing is updated, the sources are only retrieved to work out what would be done
+    # returns a list (in the order of links) of the result for each link: "added", "removed", "unchanged" (link was already present/absent) or the exception
+    # if updating its source failed. For a dryrun the result is "add", "remove" or "unchanged"
+    def update_links( self, links, *, dryrun=False, workers=None, maxretries=RESOURCE_UPDATE_RETRIES, verbose=True ):
+        linktypeuris = {}
+        bysource = {}
+        for i,link in enumerate( links ):
+            source_u, linktype, target_u, action = link if len( link )==4 else ( *link, "add" )
+            if action not in ( "add", "remove" ):
+                raise Exception( f"Link action {action} for {source_u} isn't 'add' or 'remove'" )
+            if linktype not in linktypeuris:
+                linktypeuris[linktype] = self._link_type_uri( linktype )
+            bysource.setdefault( source_u, [] ).append( ( i, rdfxml.uri_to_tag( linktypeuris[linktype] ), target_u, action ) )
+        logger.info( f"update_links {len(links)} links on {len(bysource)} sources {dryrun=}" )
+        throttle = _Throttle()
+        rdfresource = '{%s}resource' % rdfxml.RDF_DEFAULT_PREFIX["rdf"]
+
+        def update( source_u ):
+            for attempt in range( maxretries+1 ):
+                throttle.wait()
+                source_x, etag = self.execute_get_rdf_xml( source_u, return_etag=True, cacheable=False, intent="Retrieve the link source" )
+                # the element we want to modify is the rdf:Description for the source
+                thenode_x = rdfxml.xml_find_element( source_x, f".//rdf:Description[@rdf:about='{source_u}']" )
+                if thenode_x is None:
+                    thenode_x = rdfxml.xml_find_element( source_x, ".//rdf:Description[@rdf:about]" )
+                if thenode_x is None:
+                    raise Exception( f"No rdf:Description for {source_u} found!" )
+                results = {}
+                for i, tag, target_u, action in bysource[source_u]:
+                    link_x = None
+                    for el in thenode_x.iterchildren( tag ):
+                        if el.get( rdfresource ) == target_u:
+                            link_x = el
+                            break
+                    if action == "add" and link_x is None:
+                        ET.SubElement( thenode_x, tag, { rdfresource: target_u } )
+                        results[i] = "added"
+                    elif action == "remove" and link_x is not None:
+                        thenode_x.remove( link_x )
+                        results[i] = "removed"
+                    else:
+                        results[i] = "unchanged"
+                if dryrun or all( r == "unchanged" for r in results.values() ):
+                    return { i: { "added": "add", "removed": "remove" }.get( r, r ) if dryrun else r for i,r in results.items() }
+                try:
+                    self.execute_post_rdf_xml( source_u, data=source_x, put=True, cacheable=False, headers={'If-Match':etag}, intent="Update the links of the artifact" )
+                except requests.HTTPError as e:
+                    status = e.response.status_code if e.response is not None else None
+                    if attempt >= maxretries or status not in ( 412, 429, 503 ):
+                        raise
+                    if status == 412:
+                        logger.info( f"Updating links of {source_u} conflicted - retrieving again" )
+                    else:
+                        retryafter = e.response.headers.get( 'Retry-After' )
+                        throttle.overloaded( float( retryafter ) if retryafter and retryafter.isdigit() else None )
+                    continue
+                throttle.succeeded()
+                return results
+
+        sourceresults = self._get_concurrently( update, bysource.keys(), workers=workers or RESOURCE_UPDATE_WORKERS, verbose=verbose, desc="Updating links" )
+        results = [None]*len( links )
+        for source_u,sourceresult in sourceresults.items():
+            for i, tag, target_u, action in bysource[source_u]:
+                results[i] = sourceresult if isinstance( sourceresult, Exception ) else sourceresult[i]
+        logger.info( f"update_links {collections.Counter( r if isinstance( r, str ) else 'failed' for r in results )}" )
+        return results
+
     # this builds itself from rdf-xml containing the properties
     # the properties are turned into attributes with the human-friendly name
-    def resourceFactory( self, resourceURL, projorcomp, existingresource=None ):
+    # if lazy is True the attributes are only decoded from the rdf when first used - useful if only a few attributes are used, e.g.
+    # to read or update one attribute - the to_etree()/put() of an update only re-encodes the modified attributes
+    def resourceFactory( self, resourceURL, projorcomp, existingresource=None, lazy=False ):
         # read the resource and create/return an object
         xml, etag = projorcomp.execute_get_rdf_xml( resourceURL, return_etag=True, intent="Retrieve the artifact" )
+        return self._resource_from_xml( resourceURL, projorcomp, xml, etag, existingresource=existingresource, lazy=lazy )
+
+    # retrieve many resources in parallel (workers at a time) and build them as resourceFactory does, using one decode plan
+    # per shape for all the resources so the attribute names and codecs are only worked out once
+    # returns a dictionary keyed by url (in the order of resourceURLs) of the Resource, or of the exception if it failed
+    def resourceFactory_many( self, resourceURLs, projorcomp=None, *, workers=None, verbose=True, lazy=False ):
+        projorcomp = projorcomp or self
+        # make sure typesystem is loaded for this component
+        projorcomp.load_types()
+        xmls = projorcomp._get_concurrently( lambda url: projorcomp.execute_get_rdf_xml( url, return_etag=True, intent="Retrieve the artifact" ), resourceURLs, workers=workers or RESOURCE_LOAD_WORKERS, verbose=verbose, desc="Retrieving resources" )
+        plans = {}
+        # work out the decode plans first so the remote lookups the codecs need (e.g. link targets) are done in bulk
+        # (lazy resources only decode - and look up - the attributes which are used)
+        lookups = {}
+        for url,xmletag in xmls.items():
+            if not lazy and not isinstance( xmletag, Exception ):
+                self._collect_lookups( projorcomp, xmletag[0], plans, lookups )
+        for codec,uris in lookups.items():
+            codec.prefetch( list( dict.fromkeys( uris ) ) )
+        results = {}
+        for url,xmletag in xmls.items():
+            if isinstance( xmletag, Exception ):
+                logger.info( f"Retrieving {url} failed {xmletag}" )
+                results[url] = xmletag
+                continue
+            xml, etag = xmletag
+            try:
+                results[url] = self._resource_from_xml( url, projorcomp, xml, etag, plans=plans, lazy=lazy )
+            except Exception as e:
+                logger.info( f"Building resource {url} failed {e}" )
+                results[url] = e
+        return results
+
+    # add the uris of xml's properties which need a remote lookup to decode to lookups, keyed by codec
+    def _collect_lookups( self, projorcomp, xml, plans, lookups ):
+        shapeurl = rdfxml.xmlrdf_get_resource_uri( xml, './/oslc:instanceShape' )
+        plan = plans.setdefault( shapeurl, {} )
+        maintag = rdfxml.xml_find_element( xml.getroot(), ".//rdf:Description[@rdf:about]" )
+        if maintag is None:
+            return
+        for child in maintag:
+            taguri = rdfxml.tag_to_uri( child.tag )
+            if taguri not in plan:
+                try:
+                    plan[taguri] = self._plan_property( projorcomp, shapeurl, child.tag, taguri )
+                except Exception:
+                    # will be reported when the resource is built
+                    continue
+            if plan[taguri] is not None and plan[taguri][1].memoise:
+                uri = child.get( plan[taguri][1].rdf_resource_tag )
+                if uri:
+                    lookups.setdefault( plan[taguri][1], [] ).append( uri )
+
+    # plans is keyed by shape uri, a dictionary keyed by property uri of the ( attribute name, codec ) to decode that property - or None
+    # to ignore the property. It's filled in as properties are found so can be shared when building many resources
+    def _resource_from_xml( self, resourceURL, projorcomp, xml, etag, existingresource=None, plans=None, lazy=False ):
 #        print( f"\n\n{resourceURL=}" )
         # the type discriminator hopefully knows how to decide what type of resource this thing is
         if existingresource is None:
@@ -536,15 +801,18 @@ class Resources_Mixin:
             res = existingresource
             # clean down the existing resource - in particulatr remove all attributes
             res._unlock_unmodifiables()
-            # remove all attributes
+            # remove all attributes - an attribute may have been deleted by the user, or (if lazy) not yet decoded, so may not be set
+            res._undecoded = {}
             for attr in res._attribute_to_propuri.keys():
-                delattr( res, attr )
+                res.__dict__.pop( attr, None )
 #            
 #        print( f"{res=}" )
         res._xml = xml
         res._etag = etag
         res._url = resourceURL
         res._projorcomp = projorcomp
+        res._undecoded = {}
+        res._lazy = lazy
         res._attribute_to_propuri = {} # key is the property name, value is the prefixed for that property - used to allow the full tag name to be reconstructed from just the property name
 #        res._formats = {} # remember the format for a property so it can be updated correctly when generating rdf-xml to PUT to update the resource
 #        res._types = {} # the Type for each property - used to encode/decode between a python object and and RDF value
@@ -556,6 +824,7 @@ class Resources_Mixin:
         shapeurl = rdfxml.xmlrdf_get_resource_uri( xml, './/oslc:instanceShape' )
         res._shape_u = shapeurl
 #        print( f"{shapeurl=}" )
+        plan = ( plans if plans is not None else {} ).setdefault( shapeurl, {} )
         
         # look up the shape in typesystem
         shape = projorcomp.is_known_shape_uri( shapeurl )
@@ -570,95 +839,23 @@ class Resources_Mixin:
         for child in maintag:
 #            print( f"Child {child.tag} {child.text}" )
 #            print( f"{ET.tostring( child )=}" )
-            prefixedtag = child.tag
             taguri = rdfxml.tag_to_uri( child.tag )
-#            print( f"{taguri=} {child.tag=}" )
-            prefix,tag = prefixedtag.split( "}", 1 )
-            prefix = prefix[1:] # remove the leading {
-#            if tag in ['type','accessControl','parent','serviceProvider']:
-            if tag in ['accessControl','serviceProvider']:
+            if taguri not in plan:
+                plan[taguri] = self._plan_property( projorcomp, shapeurl, child.tag, taguri )
+            if plan[taguri] is None:
                 continue
-                
-            # get the property name
-            nameuri = rdfxml.tag_to_uri(prefixedtag)
-#            print( f"{nameuri=}" )
-            propname = projorcomp.resolve_uri_to_name( nameuri )
-#            print( f"{propname=}" )
-            if propname.startswith( "http" ):
-                # no friendly name so use just the tag
-                propname = tag
-#                print( f"Using tag {tag} for {propname}" )
-            else:
-#                print( f"No http for {propname}" )
-                pass
-                
-            # make the property name a safe Python attribute name
-            propname = _typesystem.makeSafeAttributeName( propname, taguri )
-#            print( f"safe {propname=}" )
+            propname, thiscodec = plan[taguri]
 
-            # work out what format the thing is from the typesystem, using the tag of the child
-            propdef = self.properties.get( taguri )
-            if not propdef:
-#                print( f"\nNo Property!\n{self.properties}" )
-                # unknown property - ask the application if it wants to map it to a dummy property (!)
-                if not self.mapUnknownProperty( propname, taguri, shapeurl ):
-                    raise Exception( f"Unkown property in RDF! {propname} {taguri} {shapeurl}" )
-                propdef = self.properties.get( taguri )
-                
-            propname = propdef['safeName']
-                
-            # make sure there is an entry mapping the safe attribute name to its uri
-            if not propname in res._attribute_to_propuri:
-                # need to add!
-                res._attribute_to_propuri[propname]=taguri        
-#                print( f"{res._attribute_to_propuri=}" )
-                
-#            print( f"{propdef=}" )
-            # use the codec to decode the value
-            thecodec = propdef['typeCodec']
-            if thecodec is None:
-                burp
-            else:
-                thiscodec = thecodec( projorcomp, shapeurl, taguri )
-#            print( f"{thiscodec=}" )
-            
-            value = thiscodec.decode( child )
+            if lazy:
+                # just remember the element to decode when the attribute is first used
+                res._attribute_to_propuri[ propname ] = taguri
+                res._undecoded.setdefault( propname, ( thiscodec, [] ) )[1].append( child )
+                continue
+
+            value = thiscodec.cacheddecode( child )
             
 #            print( f"{value=}" )
 
-            if False:
-                # work out what the attribute name will be - from the type!
-                # work out what type the value is, and what it's value is
-                if len(child)>0 and parsetype == "Literal":
-                    # get the XML literal value by converting the whole child to a string and then strip off the start/end tags!
-                    # (shouldn't there be a less hacky way of doing this?)
-                    literal = ET.tostring(child).decode()
-                    value = literal[literal.index('>')+1:literal.rindex('<')]
-        #            print( f"0 {prefixedtag}  {value=}" )
-                    res._formats[tag] = XMLLITERAL
-                elif child.text is None or not child.text.strip():
-                    # no text, try the resource URI
-                    rawvalue = rdfxml.xmlrdf_get_resource_uri( child )
-                    if rawvalue is None:
-                        # no resource URI, use an empty string
-                        value = ""
-                    else:
-                        value = projorcomp.resolve_uri_to_name( rawvalue )
-#                        print( f"Value name={value}" )
-        #            print( f"1 {prefixedtag}  {value=}" )
-                    res._formats[tag] = RDFRESOURCE
-                else:
-                    rawvalue = child.text.strip()
-                    if datatype == "http://www.w3.org/2001/XMLSchema#dateTime":
-                        # convert to datetime object from 2025-07-07T08:25:18.624Z
-                        value = datetime.datetime.fromisoformat( rawvalue )
-                    elif utils.isint( rawvalue ):
-                        value = int( rawvalue )
-                    else:
-                        value = rawvalue
-        #            print( f"2 {prefixedtag} {value=}" )
-                    res._formats[tag] = TEXT
-
             # remember the property uri for this attribute name
             if taguri in res._attribute_to_propuri:
                 if res._attribute_to_propuri[ propname ] == taguri:
@@ -696,57 +893,112 @@ class Resources_Mixin:
         res._lock_unmodifiables()
 #        burp
         return res
-        
+
+    # work out how to decode a property (tag) of a resource with shape shapeurl - returns ( attribute name, codec ) or None if the property is ignored
+    def _plan_property( self, projorcomp, shapeurl, prefixedtag, taguri ):
+        prefix,tag = prefixedtag.split( "}", 1 )
+        prefix = prefix[1:] # remove the leading {
+#        if tag in ['type','accessControl','parent','serviceProvider']:
+        if tag in ['accessControl','serviceProvider']:
+            return None
+            
+        # get the property name
+        nameuri = rdfxml.tag_to_uri(prefixedtag)
+#        print( f"{nameuri=}" )
+        propname = projorcomp.resolve_uri_to_name( nameuri )
+#        print( f"{propname=}" )
+        if propname.startswith( "http" ):
+            # no friendly name so use just the tag
+            propname = tag
+#            print( f"Using tag {tag} for {propname}" )
+        else:
+#            print( f"No http for {propname}" )
+            pass
+            
+        # make the property name a safe Python attribute name
+        propname = _typesystem.makeSafeAttributeName( propname, taguri )
+#        print( f"safe {propname=}" )
+
+        # work out what format the thing is from the typesystem, using the tag of the child
+        propdef = self.properties.get( taguri )
+        if not propdef:
+#            print( f"\nNo Property!\n{self.properties}" )
+            # unknown property - ask the application if it wants to map it to a dummy property (!)
+            if not self.mapUnknownProperty( propname, taguri, shapeurl ):
+                raise Exception( f"Unkown property in RDF! {propname} {taguri} {shapeurl}" )
+            propdef = self.properties.get( taguri )
+            
+        propname = propdef['safeName']
+            
+#        print( f"{propdef=}" )
+        # the codec used to decode the value - the one for this shape/property in the project/component
+        if propdef['typeCodec'] is None:
+            burp
+        else:
+            thiscodec = projorcomp.get_attribute_schema( shapeurl, taguri, propdef )['codec']
+#        print( f"{thiscodec=}" )
+        return ( propname, thiscodec )
+
         def resourceToObject( self ):
             raise Exception( "Save not implemented yet" )
             # convert self into a specific type of resource
             pass
             
-    # immediately create a new core artifact, in the specified folder
-    def createCoreResource( self, artifactTypename_or_rdfuri ,* ,foldername_or_path=None ):        
-        foldername_or_path = foldername_or_path or "/"
-
-        # mskr sure the type system is loaded
+    # index of the shapes which the requirement creation factory can create, keyed by shape uri, title and rdf uri (owl:sameAs)
+    # of (factory_u,shape_u). Built from the loaded typesystem (only a factory shape which isn't in the typesystem is retrieved) and
+    # rebuilt if anything in the typesystem changes (i.e. it's reloaded or more types are registered)
+    # If you have two or more shapes with the same name the first one in the factory is used - the order is determined by the server and can vary - i.e. different shapes with the same name is a BAD idea!
+    def _get_creation_index( self ):
+        # make sure the type system is loaded
         self.load_types()
-        
+        creationindex = getattr( self, '_creationindex', None )
+        if creationindex is not None and creationindex[0] == self.typesystem_generation:
+            return creationindex[1]
+
+        # find the requirement creation factory
+        factory_u, shapes = self.get_factory_uri("oslc_rm:Requirement", return_shapes=True )
+#        print( f"Factory URL = {factory_u}" )
+#        print( f"Shapes for this factory: {shapes}" )
+        retrieved = self._get_concurrently( lambda shape_u: self.execute_get_rdf_xml( shape_u ), [shape_u for shape_u in shapes if shape_u not in self.shapes] )
+        index = {}
+        for shape_u in shapes:
+            if shape_u in self.shapes:
+                shape_title = self.shapes[shape_u]['name']
+                shape_sameas = self.shapes[shape_u]['sameas']
+            else:
+                shape_x = retrieved[shape_u]
+                if isinstance( shape_x, Exception ):
+                    raise shape_x
+                shape_title = rdfxml.xmlrdf_get_resource_text( shape_x, ".//oslc:ResourceShape/dcterms:title" )
+                shape_sameas = rdfxml.xmlrdf_get_resource_uri( shape_x, ".//oslc:ResourceShape/owl:sameAs" )
+#            print( f"{shape_title=} {shape_sameas=}" )
+            for key in ( shape_u, shape_title, shape_sameas ):
+                if key:
+                    index.setdefault( key, ( factory_u, shape_u ) )
+        logger.info( f"Creation index has {len(index)} entries for {len(shapes)} shapes" )
+        self._creationindex = ( self.typesystem_generation, index )
+        return index
+
+    # find the creation factory and shape for an artifact type name, shape uri or rdf uri
+    def _find_creation_shape( self, artifactTypename_or_rdfuri ):
+        result = self._get_creation_index().get( artifactTypename_or_rdfuri )
+        if result is None:
+            raise Exception( f"Shape '{artifactTypename_or_rdfuri}' not found!" )
+        return result
+
+    # find the folder to create a new artifact in - folders are remembered once found so this only retrieves folders the first time
+    def _find_creation_folder( self, foldername_or_path ):
+        foldername_or_path = foldername_or_path or "/"
         # load the folder (using folder query capability)
         # NOTE this returns as soon as it finds a matching folder - i.e. doesn't load them all!
         thefolder = self.find_folder(foldername_or_path)
         if thefolder is None:
             raise Exception( f"Folder '{foldername_or_path}' not found!" )
 #        print( f"Folder URL = {thefolder.folderuri}" )
-        
-        # find the requirement creation factory    
-        factory_u, shapes = self.get_factory_uri("oslc_rm:Requirement", return_shapes=True )
-#        print( f"Factory URL = {factory_u}" )
-#        print( f"Shapes for this factory: {shapes}" )
-
-        # THIS CODE SHOULD USE THE TYPESYSTEM!
+        return thefolder
 
-        # Find the type - read the shapes until find one matching the type name on the commandline
-        # If you have two or more shapes with the same name this will only return the last matching one - the order is determined by the server and can vary - i.e. different shapes with the same name is a BAD idea!
-        # Also shows all the shape names :-)
-        theshape_u = None
-        for shape_u in shapes:
-            # retrieve the type
-            shape_x = self.execute_get_rdf_xml( shape_u )
-            # check its name
-            shape_title = rdfxml.xmlrdf_get_resource_text( shape_x, ".//oslc:ResourceShape/dcterms:title" )
-#            print( f"{shape_title=}" )
-            if shape_title == artifactTypename_or_rdfuri:
-                theshape_u = shape_u
-#                print( f"Found artifact type!" )
-                break
-            shape_sameas = rdfxml.xmlrdf_get_resource_text( shape_x, ".//oslc:ResourceShape/owl:sameAs" )
-#            print( f"{shape_sameas=}" )
-            if shape_sameas == artifactTypename_or_rdfuri:
-                theshape_u = shape_u
-#                print( f"Found RDF URI!" )
-                break
-            
-        if theshape_u is None:
-            raise Exception( f"Shape '{artifactTypename_or_rdfuri}' not found!" )
-     
+    # POST a new artifact with shape theshape_u in folder folder_u to the creation factory factory_u, returning the new artifact's URL
+    def _post_new_artifact( self, factory_u, theshape_u, folder_u ):
         # text of the XML with basic content provided (this is based on example in section 2 of https://jazz.net/library/article/1197
         # If you want more complex and general purpose data such as custom attributes you probably need to use the instanceShape
         thexml_t = f"""<rdf:RDF xmlns:rdf="http://www.w3.org/1999/02/22-rdf-syntax-ns#"
@@ -767,7 +1019,7 @@ class Resources_Mixin:
 </div></jazz_rm:primaryText>
         <dc:title rdf:parseType="Literal"></dc:title>
         <oslc:instanceShape rdf:resource="{theshape_u}"/>
-        <nav:parent rdf:resource="{thefolder.folderuri}"/>
+        <nav:parent rdf:resource="{folder_u}"/>
     </rdf:Description>
 </rdf:RDF>  
  """
@@ -779,21 +1031,39 @@ class Resources_Mixin:
         location = response.headers.get('Location')
         if response.status_code != 201:
             raise Exception( "POST failed!" )
-        theartifact_u = location
-        
-        # get the artifact so we can show its id
-        theartifact_x = self.execute_get_rdf_xml( theartifact_u, intent="Retrieve the artifact so we can show its identifier" )
-        
-        # show its ID
-        theid = rdfxml.xml_find_element( theartifact_x, ".//dcterms:identifier" )
-#        print( f"Your new artifact has identifier {theid.text} URL {theartifact_u}" )
+        return location
 
+    # immediately create a new core artifact, in the specified folder
+    def createCoreResource( self, artifactTypename_or_rdfuri ,* ,foldername_or_path=None ):        
+        factory_u, theshape_u = self._find_creation_shape( artifactTypename_or_rdfuri )
+        thefolder = self._find_creation_folder( foldername_or_path )
+
+        theartifact_u = self._post_new_artifact( factory_u, theshape_u, thefolder.folderuri )
+        
+        # get the artifact
         newresource = self.resourceFactory( theartifact_u, self, existingresource=None )
 
-#        print( f"{newresource=}" )
+#        print( f"Your new artifact has identifier {newresource.identifier} URL {theartifact_u}" )
         
         return newresource
         
+    # immediately create many new core artifacts, POSTing up to workers at a time
+    # each entry of artifacts is either an artifact type name/rdf uri (created in foldername_or_path) or a tuple (artifact type name/rdf uri,foldername_or_path)
+    # the types and folders are all resolved before anything is created, so an unknown type or folder means nothing is created
+    # returns a list (in the order of artifacts) of the new Resource, or the exception if creating/retrieving that one failed
+    # the new resources can be modified and then saved together using put_resources()
+    def createCoreResources( self, artifacts, *, foldername_or_path=None, workers=None, verbose=True ):
+        tocreate = {}
+        for i,artifact in enumerate( artifacts ):
+            typename, foldername = artifact if isinstance( artifact, tuple ) else ( artifact, foldername_or_path )
+            factory_u, theshape_u = self._find_creation_shape( typename )
+            tocreate[i] = ( factory_u, theshape_u, self._find_creation_folder( foldername ).folderuri )
+        locations = self._get_concurrently( lambda i: self._post_new_artifact( *tocreate[i] ), tocreate.keys(), workers=workers or RESOURCE_UPDATE_WORKERS, verbose=verbose, desc="Creating artifacts" )
+        resources = self.resourceFactory_many( [location for location in locations.values() if not isinstance( location, Exception )], self, workers=workers, verbose=verbose )
+        results = [ locations[i] if isinstance( locations[i], Exception ) else resources[locations[i]] for i in tocreate ]
+        logger.info( f"createCoreResources created {sum(1 for l in locations.values() if not isinstance( l, Exception ))} of {len(tocreate)} artifacts" )
+        return results
+
     # immediately create the resource for a module
     def createModuleResource( self, artifactTypename_or_rdfuri, *, foldername_or_path=None  ):
         return self.createCoreResource( artifactTypename_or_rdfuri=artifactTypename_or_rdfuri, foldername_or_path=foldername_or_path )